@@ -0,0 +1,49 @@
+"""
+Сравнивает два файла результатов benchmarks/run.py и показывает изменение задержки и пропускной способности.
+Код возврата 1, если p95 какого-либо сценария вырос больше, чем на --threshold процентов.
+
+    python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def load(path: Path) -> dict[tuple[str, int], dict]:
+    report = json.loads(path.read_text())
+    return {(result["scenario"], result["concurrency"]): result for result in report["results"]}
+
+
+def change(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    parser.add_argument("--threshold", type=float, default=10.0, help="Допустимый рост p95, в процентах")
+    args = parser.parse_args()
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    regressions = []
+    print(f"{'сценарий':>14} {'c':>4} {'rps':>18} {'p50, мс':>22} {'p95, мс':>22} {'p99, мс':>22}")
+    for key in sorted(baseline.keys() & candidate.keys()):
+        old, new = baseline[key], candidate[key]
+        cells = [f"{old['throughput_rps']:.0f}→{new['throughput_rps']:.0f} ({change(old['throughput_rps'], new['throughput_rps']):+.0f}%)"]
+        for percentile in ("p50", "p95", "p99"):
+            before, after = old["latency_ms"][percentile], new["latency_ms"][percentile]
+            cells.append(f"{before:.1f}→{after:.1f} ({change(before, after):+.0f}%)")
+        print(f"{key[0]:>14} {key[1]:>4} " + " ".join(f"{cell:>22}" for cell in cells))
+
+        if change(old["latency_ms"]["p95"], new["latency_ms"]["p95"]) > args.threshold:
+            regressions.append(key)
+
+    for scenario, concurrency in regressions:
+        print(f"Регрессия: {scenario} c={concurrency}, p95 вырос больше чем на {args.threshold}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import asyncio
+import random
+
+from aiohttp import web
+
+
+class StubServer:
+    """
+    Заглушки внешних сервисов в одном aiohttp-сервере:
+    - сервис авторизации: PATCH /users/balance (пополнение баланса после правильного ответа);
+    - Telegram Bot API: POST /bot<token>/<method>.
+    Каждый ответ задерживается на случайное время из [min_latency, max_latency], чтобы имитировать сеть.
+    """
+
+    def __init__(self, host: str, port: int, min_latency: float, max_latency: float):
+        self.host = host
+        self.port = port
+        self.min_latency = min_latency
+        self.max_latency = max_latency
+        self.counters = {"balance": 0, "telegram": 0}
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_patch("/users/balance", self._balance)
+        app.router.add_post("/bot{token}/{method}", self._telegram)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _delay(self):
+        await asyncio.sleep(random.uniform(self.min_latency, self.max_latency))
+
+    async def _balance(self, request: web.Request) -> web.Response:
+        await request.json()
+        await self._delay()
+        self.counters["balance"] += 1
+        return web.json_response({"status": "ok"})
+
+    async def _telegram(self, request: web.Request) -> web.Response:
+        await request.read()
+        await self._delay()
+        self.counters["telegram"] += 1
+        message_id = self.counters["telegram"]
+        result = {"message_id": message_id}
+        # Как настоящий Bot API, возвращаем file_id загруженного медиа, чтобы сервис мог его переиспользовать
+        method = request.match_info.get("method", "")
+        if method == "sendPhoto":
+            result["photo"] = [{"file_id": f"photo-{message_id}"}]
+        elif method == "sendVideo":
+            result["video"] = {"file_id": f"video-{message_id}"}
+        return web.json_response({"ok": True, "result": result})
@@ -0,0 +1,45 @@
+# Продакшен-запуск: gunicorn -c gunicorn.conf.py main:app
+import gc
+import os
+import shutil
+
+from src.core.utils.config import settings
+
+# Метрики воркеров прошлого запуска нельзя смешивать с новыми, поэтому каталог очищается
+# до импорта приложения (с preload_app оно импортируется сразу после чтения этого файла)
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if PROMETHEUS_MULTIPROC_DIR:
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+bind = f"{settings.run.host}:{settings.run.port}"
+workers = settings.run.workers
+worker_class = "src.core.gunicorn_worker.PlayitUvicornWorker"
+
+# Приложение импортируется в мастере до fork: снимок Excel и индекс ответов готовятся один раз и достаются воркерам
+preload_app = True
+
+max_requests = settings.run.max_requests
+max_requests_jitter = settings.run.max_requests_jitter
+# При остановке воркер перестаёт принимать соединения и дорабатывает начатые запросы не дольше graceful_timeout
+graceful_timeout = settings.run.graceful_timeout
+timeout = settings.run.timeout
+keepalive = settings.run.keepalive
+
+
+def when_ready(server):
+    # Вызывается в мастере после импорта приложения и до запуска воркеров
+    from main import preload
+
+    preload()
+    # Объекты мастера уводятся из-под сборщика мусора: иначе первая же сборка в воркере запишет
+    # в заголовок каждого объекта и скопирует все унаследованные страницы
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    # Значения gauge'ей завершившегося воркера больше не актуальны
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
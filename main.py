@@ -1,11 +1,30 @@
-import asyncio
 import uvicorn
 import logging
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
 from src.api.routers import all_routers
+from src.core.metrics import event_loop_lag_monitor
+from src.core.middlewares.body_limit import BodySizeLimitMiddleware
+from src.core.middlewares.metrics import MetricsMiddleware
+from src.core.middlewares.profiling import ProfilingMiddleware
+from src.core.database.db import engine
+from src.core.http_client import http_client
+from src.core.redis_client import (
+    redis_client,
+    redis_pool,
+    redis_binary_client,
+    redis_binary_pool,
+    redis_blocking_client,
+)
+from src.core.services.aiohttp_client import balance_replay_worker
+from src.core.services.answer_index import answer_index
+from src.core.services.cache import cache_invalidation_listener
+from src.core.services.outbox import moderation_dispatcher
+from src.core.services.snapshot import workbook_snapshot
+from src.core.services.watcher import workbook_watcher
 from src.core.utils.config import settings
 
 logging.basicConfig(
@@ -14,7 +33,64 @@ logging.basicConfig(
 )
 
 
-app = FastAPI(root_path="/playit/tasks")
+def preload():
+    """
+    Загружает снимок Excel и строит индекс ответов в мастере gunicorn до fork (см. when_ready в gunicorn.conf.py).
+    Таблица снимка отображена в память из файла, поэтому её страницы остаются общими для всех воркеров,
+    а индекс ответов воркеры получают готовым и не перестраивают.
+    """
+    try:
+        workbook_snapshot.load()
+        answer_index.refresh()
+    except Exception as e:
+        logging.error(f"Не удалось подготовить снимок Excel-файла: {e}", exc_info=True)
+
+
+async def warm_up():
+    """
+    Проверяет при старте воркера, что снимок и индекс ответов актуальны, не блокируя event loop.
+    Если их уже подготовил мастер, лишь сверяется подпись файла; при запуске без gunicorn снимок загружается здесь.
+    """
+    try:
+        await answer_index.ensure_fresh()
+    except Exception as e:
+        logging.error(f"Не удалось подготовить снимок Excel-файла: {e}", exc_info=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warm_up()
+    await event_loop_lag_monitor.start()
+    await http_client.start()
+    await balance_replay_worker.start()
+    await cache_invalidation_listener.start()
+    await workbook_watcher.start()
+    await moderation_dispatcher.start()
+    yield
+    await moderation_dispatcher.stop()
+    await workbook_watcher.stop()
+    await cache_invalidation_listener.stop()
+    await balance_replay_worker.stop()
+    await http_client.close()
+    await redis_blocking_client.aclose()
+    await redis_client.aclose()
+    await redis_pool.disconnect()
+    await redis_binary_client.aclose()
+    await redis_binary_pool.disconnect()
+    await engine.dispose()
+    await event_loop_lag_monitor.stop()
+    workbook_snapshot.close()
+
+
+app = FastAPI(root_path="/playit/tasks", lifespan=lifespan)
+# Middleware, добавленный позже, оборачивает добавленные раньше. CORS добавляется после ограничения тела,
+# чтобы ответ 413 тоже получил CORS-заголовки и фронтенд увидел статус, а не сетевую ошибку
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    # Запас в 1 МБ на текстовые поля и служебные части multipart-формы
+    max_body_size=settings.upload.UPLOAD_MAX_SIZE + 1024 * 1024,
+    paths=("/create/moderation",),
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -25,18 +101,23 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.profiling.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware, sample_rate=settings.profiling.PROFILING_SAMPLE_RATE)
+# Добавляется последним, чтобы замерять запрос целиком, включая остальные middleware
+app.add_middleware(MetricsMiddleware)
 
 for router in all_routers:
     app.include_router(router)
 
 
-async def main():
+def main():
+    # Однопроцессный сервер для локальной разработки; в продакшене: gunicorn -c gunicorn.conf.py main:app
     uvicorn.run(
         "main:app",
         host=settings.run.host,
         port=settings.run.port,
-        reload=True)
+        reload=settings.run.reload)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
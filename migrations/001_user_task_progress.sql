@@ -0,0 +1,31 @@
+-- Задания пользователей у модераторов: отдельная строка на пару (пользователь, задание) вместо массива users.in_progress.
+-- Уникальный ключ позволяет занять задание одним INSERT ... ON CONFLICT DO UPDATE ... WHERE ... RETURNING
+-- без гонки между проверкой и записью (DO UPDATE срабатывает только для зависшей заявки 'pending').
+--   pending     - задание принято и ждёт отправки модераторам;
+--   in_progress - Telegram подтвердил доставку.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS user_task_progress (
+    username   TEXT        NOT NULL,
+    task_id    INTEGER     NOT NULL,
+    status     TEXT        NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'in_progress')),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (username, task_id)
+);
+
+-- Переносим уже взятые в работу задания из массива
+INSERT INTO user_task_progress (username, task_id, status)
+SELECT DISTINCT users.username, task.task_id, 'in_progress'
+FROM users
+CROSS JOIN LATERAL unnest(users.in_progress) AS task(task_id)
+WHERE task.task_id IS NOT NULL
+ON CONFLICT (username, task_id) DO NOTHING;
+
+COMMIT;
+
+-- Колонку users.in_progress удалять пока нельзя: бот модерации не только читает её, но и пишет в неё
+-- (при отклонении убирает задание из массива). Таблица и массив синхронизируются триггерами
+-- из 002_user_task_progress_sync.sql. Когда бот перейдёт на таблицу:
+-- ALTER TABLE users DROP COLUMN in_progress;
@@ -0,0 +1,43 @@
+-- Синхронизация user_task_progress с массивом users.in_progress, пока бот модерации работает только с массивом.
+-- Сервис заданий читает и пишет лишь таблицу, а массив поддерживает база:
+--   задание доставлено модераторам (status -> in_progress) - оно добавляется в users.in_progress, как ждёт бот;
+--   бот отклонил задание (убрал его из массива)            - строка удаляется, и задание можно отправить снова.
+-- Когда бот перейдёт на таблицу, триггеры удаляются вместе с колонкой users.in_progress.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION user_task_progress_to_array() RETURNS trigger AS $$
+BEGIN
+    UPDATE users
+    SET in_progress = array_append(COALESCE(in_progress, '{}'), NEW.task_id)
+    WHERE username = NEW.username AND NOT (NEW.task_id = ANY(COALESCE(in_progress, '{}')));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS user_task_progress_delivered ON user_task_progress;
+CREATE TRIGGER user_task_progress_delivered
+    AFTER UPDATE OF status ON user_task_progress
+    FOR EACH ROW
+    WHEN (NEW.status = 'in_progress' AND OLD.status IS DISTINCT FROM 'in_progress')
+    EXECUTE FUNCTION user_task_progress_to_array();
+
+CREATE OR REPLACE FUNCTION users_in_progress_to_progress() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM user_task_progress
+    WHERE username = NEW.username
+      AND status = 'in_progress'
+      AND task_id = ANY(COALESCE(OLD.in_progress, '{}'))
+      AND NOT (task_id = ANY(COALESCE(NEW.in_progress, '{}')));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_in_progress_removed ON users;
+CREATE TRIGGER users_in_progress_removed
+    AFTER UPDATE OF in_progress ON users
+    FOR EACH ROW
+    WHEN (OLD.in_progress IS DISTINCT FROM NEW.in_progress)
+    EXECUTE FUNCTION users_in_progress_to_progress();
+
+COMMIT;
@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from src.core.metrics import render_metrics
+
+router = APIRouter()
+
+
+@router.get(path="/metrics", include_in_schema=False)
+def metrics():
+    """Метрики всех воркеров в формате Prometheus"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,33 @@
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from starlette.concurrency import run_in_threadpool
+
+from src.core.services.profiling import PROFILE_HEADER, profile_store, verify_profile_signature
+from src.core.utils.config import settings
+
+router = APIRouter()
+
+
+def _check_access(request: Request):
+    # Подпись та же, что и для профилирования запроса, но на путь самого эндпоинта. Путь берётся из scope,
+    # как в ProfilingMiddleware: request.url добавляет root_path, и подписи бы не совпали
+    if not settings.profiling.PROFILING_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if not verify_profile_signature(request.scope["path"], request.headers.get(PROFILE_HEADER)):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+
+
+@router.get(path="/profiles", include_in_schema=False)
+async def list_profiles(request: Request, limit: int = Query(20, ge=1, le=100)):
+    """Самые медленные из последних профилей запросов"""
+    _check_access(request)
+    return await run_in_threadpool(profile_store.slowest, limit)
+
+
+@router.get(path="/profiles/{name}", include_in_schema=False)
+async def get_profile(request: Request, name: str):
+    """Сохранённый профиль запроса целиком"""
+    _check_access(request)
+    capture = await run_in_threadpool(profile_store.load, name)
+    if capture is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return capture
@@ -42,8 +42,19 @@ base_bad_response_for_endpoints_of_task = {
     },
 }
 
+bad_responses_autocheck_batch = {
+    401: base_bad_response_for_endpoints_of_task[401],
+    422: {
+        "description": "Пустой пакет, ответов в пакете больше допустимого "
+                       "или Idempotency-Key уже использован с другим телом запроса",
+    },
+}
+
 bad_responses_autocheck = {
     404: {
         "description": "Задание с указанным ID не найдено в Excel-файле."
-    }
+    },
+    422: {
+        "description": "Idempotency-Key уже использован с другим телом запроса"
+    },
 }
@@ -1,5 +1,9 @@
+from src.api.metrics import router as metrics_router
+from src.api.profiling import router as profiling_router
 from src.api.tasks import router as tasks_router
 
 all_routers = [
     tasks_router,
+    metrics_router,
+    profiling_router,
 ]
@@ -1,14 +1,25 @@
 from typing import Optional
 import logging
 
-from fastapi import APIRouter, Request, Form, UploadFile, File, Query, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Request, Response, Form, UploadFile, File, Query, Depends, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.api.responses import base_bad_response_for_endpoints_of_task, bad_responses_autocheck
-from src.core.schemas.tasks import ParseTasksResponse, CheckTaskAnswerInputSchema
+from src.api.responses import (
+    base_bad_response_for_endpoints_of_task,
+    bad_responses_autocheck,
+    bad_responses_autocheck_batch,
+)
+from src.core.schemas.auth import AuthenticatedUser
+from src.core.schemas.tasks import (
+    ParseTasksResponse,
+    CheckTaskAnswerInputSchema,
+    CheckTaskAnswerBatchInputSchema,
+    CheckTaskAnswerBatchOutputSchema,
+)
 from src.core.services.tasks import TaskService
 from src.core.services.excel import ExcelService
 from src.core.database.db import get_db_session
+from src.core.utils.auth import get_current_user
 
 
 router = APIRouter()
@@ -23,15 +34,15 @@ router = APIRouter()
     Возвращает все задания из таблицы либо задания по дням с помощью 'day' 
 
     - Аутентифицирует пользователя по JWT;
-    - При первом запросе данные парсятся из Excel и сохраняются в Redis;
-    - При последующих запросах данные получаются из кеша.
+    - Каталог заданий публикуется в Redis при старте и при каждом изменении Excel-файла;
+    - При последующих запросах готовое тело ответа отдаётся из кеша без повторной сериализации.
     - Если day не указан, то вернутся все задания
     - Если day > 3, возвращается ошибка 400.
     """,
 )
 async def parse_all_tasks(
         request: Request,
-        session: Session = Depends(get_db_session),
+        session: AsyncSession = Depends(get_db_session),
         day: int | None = Query(
             None,
             description="День, за который нужно получить задания",
@@ -41,9 +52,9 @@ async def parse_all_tasks(
 ):
     """
     Эндпоинт для получения всех заданий.
-    Сначала пытается вернуть данные из кеша.
-    Если кеш пуст или данные невалидны, вызывается ExcelService для парсинга Excel,
-    а результат сохраняется в Redis с TTL 6 часов.
+    Сначала пытается вернуть готовый ответ из кеша, затем собрать его из закешированных дней.
+    Если каталога актуальной версии в кеше нет, он собирается из Excel через ExcelService
+    и публикуется в Redis под ключами версии файла.
     """
     return await TaskService.get_all_tasks(request=request, session=session, day=day)
 
@@ -52,12 +63,17 @@ async def parse_all_tasks(
     path="/create/moderation",
     tags=["Tasks"],
     summary="Создать задание",
-    description="Создаёт задание и отправляет его модератору с файлом.",
+    description=
+    "Принимает задание и ставит его в очередь на отправку модератору с файлом. "
+    "Возвращает 202, как только задание сохранено в очереди, "
+    "и 200, если задание уже находится у модераторов.",
+    status_code=status.HTTP_202_ACCEPTED,
     responses=base_bad_response_for_endpoints_of_task
 )
 async def create_task(
         request: Request,
-        session: Session = Depends(get_db_session),
+        response: Response,
+        session: AsyncSession = Depends(get_db_session),
         task_id: int = Form(..., description="ID задания"),
         user_id: int = Form(..., description="ID пользователя"),
         value: int = Form(..., description="Количество баллов"),
@@ -65,7 +81,7 @@ async def create_task(
         file: Optional[UploadFile] = File(default=None, description="Файл для задания")
 ):
     """
-    Этот эндпоинт принимает данные задания и отправляет его модератору через Telegram Bot API.
+    Этот эндпоинт принимает данные задания и ставит его в очередь на отправку модератору через Telegram Bot API.
     """
     logging.info("Данные приняты")
 
@@ -82,6 +98,7 @@ async def create_task(
         file=file
     )
 
+    response.status_code = result
     return {"status": result}
 
 
@@ -92,12 +109,34 @@ async def create_task(
     description=
     "Проверяет, правильно ли пользователь ответил на задание, "
     "для проверки используется Excel-файл 'PlayIT.xlsx' (лист 'Персонажи'),"
-    "где в колонке '№' хранится ID задания, а в колонке 'Ответ' — правильный ответ.",
+    "где в колонке '№' хранится ID задания, а в колонке 'Ответ' — правильный ответ. "
+    "Баланс за задание пополняется не больше одного раза; повтор запроса с тем же заголовком "
+    "Idempotency-Key возвращает сохранённый ответ, а с тем же ключом, но другим телом — 422.",
     responses=bad_responses_autocheck
 )
 async def check_task_answer(
         request: Request,
         data: CheckTaskAnswerInputSchema,
-        session: Session = Depends(get_db_session)
+        session: AsyncSession = Depends(get_db_session)
 ):
     return await ExcelService.check_answer(session=session, request=request, data=data)
+
+
+@router.post(
+    path="/create/autocheck/batch",
+    response_model=CheckTaskAnswerBatchOutputSchema,
+    tags=["Tasks"],
+    summary="Проверить несколько ответов за один запрос",
+    description=
+    "Проверяет пакет ответов пользователя (например, накопленных клиентом офлайн) так же, как /create/autocheck, "
+    "но с одной аутентификацией на весь пакет. Для каждого ответа возвращается свой статус: "
+    "200 - ответ проверен, 404 - задания нет, 409 - повтор задания в пакете, "
+    "иной код - ответ правильный, но баланс пополнить не удалось.",
+    responses=bad_responses_autocheck_batch
+)
+async def check_task_answers_batch(
+        request: Request,
+        data: CheckTaskAnswerBatchInputSchema,
+        user: AuthenticatedUser = Depends(get_current_user)
+):
+    return await ExcelService.check_answers_batch(request=request, user=user, data=data)
@@ -0,0 +1,51 @@
+import argparse
+import logging
+import time
+
+from src.core.services.profiling import sign_profile_request
+from src.core.services.snapshot import workbook_snapshot
+from src.core.utils.config import settings
+
+logging.basicConfig(
+    level=settings.logging.log_level_value,
+    format=settings.logging.log_format
+)
+
+
+def compile_snapshot(args: argparse.Namespace):
+    version = workbook_snapshot.compile(force=args.force)
+    print(f"{workbook_snapshot.snapshot_path}: sha256={version}")
+
+
+def sign_profile(args: argparse.Namespace):
+    if not settings.profiling.PROFILING_SECRET:
+        raise SystemExit("PROFILING_SECRET не задан")
+    expires = int(time.time()) + args.ttl
+    print(f"X-Profile: {sign_profile_request(settings.profiling.PROFILING_SECRET, args.path, expires)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="Служебные команды PlayIT tasks backend")
+    subparsers = parser.add_subparsers(required=True)
+
+    compile_parser = subparsers.add_parser(
+        "compile-snapshot",
+        help="Собрать снимок листа Excel, если xlsx изменился с прошлой сборки",
+    )
+    compile_parser.add_argument("--force", action="store_true", help="Пересобрать, даже если снимок актуален")
+    compile_parser.set_defaults(func=compile_snapshot)
+
+    sign_parser = subparsers.add_parser(
+        "sign-profile",
+        help="Подписать заголовок X-Profile для профилирования запросов к пути (или доступа к /profiles)",
+    )
+    sign_parser.add_argument("path", help="Полный путь запроса, например /playit/tasks/get-all")
+    sign_parser.add_argument("--ttl", type=int, default=300, help="Сколько секунд подпись действительна")
+    sign_parser.set_defaults(func=sign_profile)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
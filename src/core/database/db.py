@@ -1,18 +1,27 @@
 import logging
+from typing import AsyncGenerator
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from src.core.utils.config import settings
 
 
-engine = create_engine(settings.db.DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+engine = create_async_engine(
+    settings.db.DATABASE_URL,
+    pool_size=settings.db.DB_POOL_SIZE,
+    max_overflow=settings.db.DB_MAX_OVERFLOW,
+    pool_timeout=settings.db.DB_POOL_TIMEOUT,
+    pool_recycle=settings.db.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.db.DB_POOL_PRE_PING,
+    connect_args={
+        # Таймаут на стороне клиента (asyncpg) и на стороне Postgres
+        "command_timeout": settings.db.DB_STATEMENT_TIMEOUT / 1000,
+        "server_settings": {"statement_timeout": str(settings.db.DB_STATEMENT_TIMEOUT)},
+    },
+)
+async_session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
 
 
-def get_db_session() -> SessionLocal:
-    session = SessionLocal()
-    try:
+async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
+    async with async_session_maker() as session:
         yield session
-    finally:
-        session.close()
@@ -0,0 +1,7 @@
+from uvicorn_worker import UvicornWorker
+
+
+class PlayitUvicornWorker(UvicornWorker):
+    """Воркер gunicorn на uvicorn с uvloop и httptools вместо стандартного asyncio-цикла и h11"""
+
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
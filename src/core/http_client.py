@@ -0,0 +1,53 @@
+from typing import Optional
+
+import aiohttp
+
+from src.core.utils.config import settings
+
+
+class HttpClient:
+    """
+    Общая на весь воркер aiohttp-сессия для исходящих запросов.
+    Создаётся при старте приложения и закрывается при остановке (см. lifespan в main.py),
+    благодаря чему соединения и DNS-ответы переиспользуются между запросами.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(
+            limit=settings.http.HTTP_LIMIT,
+            limit_per_host=settings.http.HTTP_LIMIT_PER_HOST,
+            use_dns_cache=True,
+            ttl_dns_cache=settings.http.HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=settings.http.HTTP_KEEPALIVE_TIMEOUT,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=settings.http.HTTP_TOTAL_TIMEOUT,
+            connect=settings.http.HTTP_CONNECT_TIMEOUT,
+            sock_read=settings.http.HTTP_READ_TIMEOUT,
+        )
+        # Куки передаются явно в каждом запросе: общая сессия не должна
+        # запоминать куки одного пользователя и отправлять их от имени другого
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError("HTTP-клиент не запущен")
+        return self._session
+
+
+http_client = HttpClient()
+
+# Это модуль общего HTTP-клиента для исходящих запросов
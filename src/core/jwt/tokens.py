@@ -1,14 +1,24 @@
-from fastapi_users.jwt import decode_jwt
+from fastapi_users.jwt import decode_jwt, generate_jwt
 from fastapi import HTTPException
 from src.core.utils.config import settings
 
 
+JWT_AUDIENCE = "prod"  # Должно совпадать с "aud" в create_jwt_token
+
+
 def verify_jwt_token(token: str) -> dict:
     """
     Синхронно декодирует и проверяет JWT-токен.
     """
     try:
-        audience = "prod"  # Должно совпадать с "aud" в create_jwt_token
-        return decode_jwt(token, settings.token.SECRET_KEY, audience)
+        return decode_jwt(token, settings.token.SECRET_KEY, JWT_AUDIENCE)
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Невалидный токен: {str(e)}")
+
+
+def create_service_token(username: str, lifetime_seconds: int) -> str:
+    """
+    Выпускает короткоживущий JWT-токен от имени пользователя для запросов, которые сервис отправляет сам
+    (например, отложенное пополнение баланса), чтобы не хранить токен пользователя.
+    """
+    return generate_jwt({"sub": username, "aud": JWT_AUDIENCE}, settings.token.SECRET_KEY, lifetime_seconds)
@@ -0,0 +1,135 @@
+import asyncio
+import functools
+import logging
+import os
+import time
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+from src.core.utils.config import settings
+
+logger = logging.getLogger("metrics_logger")
+
+# Под gunicorn каждый воркер пишет метрики в свои файлы в каталоге PROMETHEUS_MULTIPROC_DIR,
+# а /metrics любого воркера собирает их вместе. Без этой переменной используется обычный реестр процесса.
+MULTIPROCESS_MODE = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    ["method", "route", "status"],
+)
+CACHE_LOOKUPS = Counter(
+    "tasks_cache_lookups_total",
+    "Обращения к кешу заданий: layer - local/redis (готовые ответы) или catalogue (дни актуальной версии)",
+    ["layer", "result"],
+)
+CACHE_DAY_LOOKUPS = Counter(
+    "tasks_cache_day_lookups_total",
+    "Обращения к кешу отдельных дней каталога",
+    ["day", "result"],
+)
+EXCEL_PARSE_SECONDS = Histogram(
+    "excel_parse_duration_seconds",
+    "Время чтения заданий из снимка Excel-файла",
+    ["source"],
+)
+EXCEL_PARSE_ROWS = Histogram(
+    "excel_parse_rows",
+    "Количество заданий, прочитанных из снимка Excel-файла",
+    ["source"],
+    buckets=(10, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Время выполнения метода репозитория",
+    ["method"],
+)
+OUTBOUND_HTTP_SECONDS = Histogram(
+    "outbound_http_request_duration_seconds",
+    "Время исходящих HTTP-запросов; status=0 - ответа не было (ошибка соединения или таймаут)",
+    ["target", "status"],
+)
+BALANCE_UPDATES = Counter(
+    "balance_updates_total",
+    "Пополнения баланса: sent - отправлено сразу, queued - отложено, replayed - отправлено из очереди, "
+    "failed - сервис отказал, unknown - неизвестно, прошло ли (записано на сверку), dead - снято с очереди на сверку",
+    ["result"],
+)
+BALANCE_CIRCUIT_STATE = Gauge(
+    "balance_circuit_state",
+    "Состояние предохранителя сервиса авторизации в воркере: 0 - замкнут, 1 - пробный запрос, 2 - разомкнут",
+    multiprocess_mode="liveall",
+)
+BALANCE_IN_FLIGHT = Gauge(
+    "balance_requests_in_flight",
+    "Запросы на пополнение баланса, выполняющиеся сейчас",
+    multiprocess_mode="livesum",
+)
+BALANCE_REPLAY_QUEUE_DEPTH = Gauge(
+    "balance_replay_queue_depth",
+    "Отложенные пополнения баланса в очереди Redis",
+    multiprocess_mode="livemax",
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "На сколько позже запланированного просыпается задача в event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+
+def track_db_query(func):
+    """Замеряет время выполнения асинхронного метода репозитория"""
+    observer = DB_QUERY_SECONDS.labels(method=func.__qualname__)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            observer.observe(time.perf_counter() - started_at)
+
+    return wrapper
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Возвращает метрики в текстовом формате Prometheus и их content-type"""
+    if MULTIPROCESS_MODE:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class EventLoopLagMonitor:
+    """
+    Фоновая задача воркера: засыпает на interval и замеряет, насколько позже она проснулась.
+    Большая задержка означает, что event loop блокирует синхронный код.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run(), name="event-loop-lag-monitor")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected_at = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - expected_at))
+
+
+event_loop_lag_monitor = EventLoopLagMonitor(interval=settings.metrics.EVENT_LOOP_LAG_INTERVAL)
@@ -0,0 +1,56 @@
+from fastapi import HTTPException, status
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+BODY_TOO_LARGE_DETAIL = "Файл слишком большой"
+
+
+class BodySizeLimitMiddleware:
+    """
+    Ограничивает размер тела запроса для указанных путей (точное совпадение, без root_path) прямо во время приёма:
+    - если Content-Length больше лимита, запрос отклоняется сразу, тело даже не читается;
+    - иначе считаются пришедшие байты, и как только лимит превышен, разбор формы прерывается с 413.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_size: int, paths: tuple[str, ...]):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.paths = frozenset(paths)
+
+    @staticmethod
+    def _route_path(scope: Scope) -> str:
+        # За прокси путь приходит как с префиксом root_path, так и без него
+        path, root_path = scope["path"], scope.get("root_path", "")
+        if root_path and path.startswith(f"{root_path}/"):
+            return path[len(root_path):]
+        return path
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or self._route_path(scope) not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_body_size:
+                response = JSONResponse(
+                    {"detail": BODY_TOO_LARGE_DETAIL},
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                )
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=BODY_TOO_LARGE_DETAIL,
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,73 @@
+import logging
+import random
+import time
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.core.services.profiling import (
+    PROFILE_HEADER,
+    PROFILE_MEMORY_HEADER,
+    RequestProfile,
+    profile_store,
+    verify_profile_signature,
+)
+
+logger = logging.getLogger("profiling_logger")
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует отдельные запросы по требованию:
+    - запрос с заголовком X-Profile, подписанным PROFILING_SECRET (см. sign_profile_request);
+    - случайная доля запросов sample_rate.
+    Профиль сохраняется в кольцо на диске уже после отправки ответа.
+    Подключается, только если PROFILING_ENABLED, поэтому в обычном режиме не стоит ничего.
+    """
+
+    def __init__(self, app: ASGIApp, sample_rate: float):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if verify_profile_signature(scope["path"], headers.get(PROFILE_HEADER)):
+            trigger = "header"
+        elif self.sample_rate and random.random() < self.sample_rate:
+            trigger = "sample"
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        profile = RequestProfile(trace_memory=headers.get(PROFILE_MEMORY_HEADER) == "1")
+        started_at = time.time()
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            capture = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "trigger": trigger,
+                "started_at": started_at,
+                **profile.stop(),
+                "duration": profile.duration,
+            }
+            try:
+                await run_in_threadpool(profile_store.save, capture)
+            except Exception as e:
+                logger.error(f"Не удалось сохранить профиль запроса {scope['path']}: {e}", exc_info=True)
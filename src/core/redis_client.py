@@ -1,12 +1,49 @@
-import redis
+from redis import asyncio as aioredis
 
 from src.core.utils.config import settings
 
-redis_client = redis.Redis(
+# Блокирующий пул: при исчерпании соединений запрос ждёт свободное не дольше REDIS_POOL_TIMEOUT,
+# а не падает сразу с "Too many connections"
+redis_pool = aioredis.BlockingConnectionPool(
     host=settings.redis.REDIS_HOST,
     port=settings.redis.REDIS_PORT,
     db=settings.redis.REDIS_DB,
-    decode_responses=True
+    decode_responses=True,
+    max_connections=settings.redis.REDIS_MAX_CONNECTIONS,
+    timeout=settings.redis.REDIS_POOL_TIMEOUT,
+    socket_timeout=settings.redis.REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=settings.redis.REDIS_CONNECT_TIMEOUT,
+    health_check_interval=settings.redis.REDIS_HEALTH_CHECK_INTERVAL,
+)
+
+redis_client = aioredis.Redis(connection_pool=redis_pool)
+
+# Клиент без декодирования ответов: для готовых тел HTTP-ответов, которые отдаются клиенту как есть
+redis_binary_pool = aioredis.BlockingConnectionPool(
+    host=settings.redis.REDIS_HOST,
+    port=settings.redis.REDIS_PORT,
+    db=settings.redis.REDIS_DB,
+    decode_responses=False,
+    max_connections=settings.redis.REDIS_MAX_CONNECTIONS,
+    timeout=settings.redis.REDIS_POOL_TIMEOUT,
+    socket_timeout=settings.redis.REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=settings.redis.REDIS_CONNECT_TIMEOUT,
+    health_check_interval=settings.redis.REDIS_HEALTH_CHECK_INTERVAL,
+)
+
+redis_binary_client = aioredis.Redis(connection_pool=redis_binary_pool)
+
+# Отдельный клиент для блокирующих команд (XREADGROUP BLOCK и т.п.):
+# им нужен таймаут чтения больше, чем время блокировки, поэтому общий пул с коротким таймаутом не подходит
+redis_blocking_client = aioredis.Redis(
+    host=settings.redis.REDIS_HOST,
+    port=settings.redis.REDIS_PORT,
+    db=settings.redis.REDIS_DB,
+    decode_responses=True,
+    max_connections=settings.redis.REDIS_BLOCKING_MAX_CONNECTIONS,
+    socket_timeout=None,
+    socket_connect_timeout=settings.redis.REDIS_CONNECT_TIMEOUT,
+    health_check_interval=settings.redis.REDIS_HEALTH_CHECK_INTERVAL,
 )
 
 # Это модуль подключения к Redis
@@ -0,0 +1,61 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.metrics import track_db_query
+from src.core.utils.config import settings
+
+
+class TaskProgressRepository:
+    """
+    Задания пользователей, отправленные модераторам (таблица user_task_progress).
+
+    Бот модерации пока знает только массив users.in_progress. Массив синхронизирует с таблицей база
+    (триггеры из migrations/002_user_task_progress_sync.sql): доставленное задание попадает в массив,
+    а строка задания, отклонённого ботом, удаляется — так пользователь может отправить его ещё раз.
+    """
+
+    @staticmethod
+    @track_db_query
+    async def claim_task(session: AsyncSession, username: str, task_id: int) -> bool:
+        """
+        Атомарно занимает задание за пользователем. Возвращает False, если оно уже занято
+        (в том числе параллельным запросом) — проверка и запись выполняются одним запросом.
+        Заявка 'pending' старше OUTBOX_PENDING_STALE_AFTER (воркер упал между занятием задания и записью в outbox)
+        занимается заново.
+        """
+        stmt = text("""
+            INSERT INTO user_task_progress (username, task_id)
+            VALUES (:username, :task_id)
+            ON CONFLICT (username, task_id) DO UPDATE
+            SET created_at = now(), updated_at = now()
+            WHERE user_task_progress.status = 'pending'
+              AND user_task_progress.created_at < now() - make_interval(secs => :stale_after)
+            RETURNING task_id
+        """)
+        params = {"username": username, "task_id": task_id, "stale_after": settings.outbox.OUTBOX_PENDING_STALE_AFTER}
+        claimed = (await session.execute(stmt, params)).scalar()
+        await session.commit()
+        return claimed is not None
+
+    @staticmethod
+    @track_db_query
+    async def mark_in_progress(session: AsyncSession, username: str, task_id: int):
+        """Отмечает задание доставленным модераторам"""
+        stmt = text("""
+            UPDATE user_task_progress
+            SET status = 'in_progress', updated_at = now()
+            WHERE username = :username AND task_id = :task_id
+        """)
+        await session.execute(stmt, {"username": username, "task_id": task_id})
+        await session.commit()
+
+    @staticmethod
+    @track_db_query
+    async def release_task(session: AsyncSession, username: str, task_id: int):
+        """Освобождает задание, которое так и не дошло до модераторов, чтобы его можно было отправить снова"""
+        stmt = text("""
+            DELETE FROM user_task_progress
+            WHERE username = :username AND task_id = :task_id AND status = 'pending'
+        """)
+        await session.execute(stmt, {"username": username, "task_id": task_id})
+        await session.commit()
@@ -1,17 +1,19 @@
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.metrics import track_db_query
 from src.core.utils.exceptions import InvalidStatusExcept, NotFoundTasksExcept
 
 
 class TaskRepository:
     @staticmethod
+    @track_db_query
     async def create_task(
             user_id: int,
             description: str,
             photo: str,
             value: int,
-            session: Session,
+            session: AsyncSession,
     ):
         # в sqlite CURRENT_TIMESTAMP в Postgresql NOW()
         insert_query = text(
@@ -30,7 +32,7 @@ class TaskRepository:
                 """
         )
 
-        result = session.execute(
+        result = await session.execute(
             insert_query,
             {
                 "description": description,
@@ -40,7 +42,7 @@ class TaskRepository:
             },
         )
         data = result.fetchone()
-        session.commit()
+        await session.commit()
 
         return {
             "id": data.id,
@@ -51,7 +53,8 @@ class TaskRepository:
         }
 
     @staticmethod
-    async def get_task_pending(session: Session):
+    @track_db_query
+    async def get_task_pending(session: AsyncSession):
         query = text(
             """
                     SELECT
@@ -65,7 +68,7 @@ class TaskRepository:
                     ORDER BY created_at DESC
                 """
         )
-        tasks = session.execute(query).fetchall()
+        tasks = (await session.execute(query)).fetchall()
 
         if not tasks:
             return []
@@ -86,7 +89,7 @@ class TaskRepository:
         return formatted_tasks
 
     # @staticmethod
-    # async def update_task(task_id: int, status: str, session: Session):
+    # async def update_task(task_id: int, status: str, session: AsyncSession):
     #     task = session.execute(
     #         text("SELECT * FROM tasks WHERE id = :task_id"), {"task_id": task_id}
     #     ).fetchone()
@@ -111,17 +114,18 @@ class TaskRepository:
     #     return "Task status updated successfully"
 
     @staticmethod
-    async def delete_task(task_id: int, session: Session):
-        task = session.execute(
+    @track_db_query
+    async def delete_task(task_id: int, session: AsyncSession):
+        task = (await session.execute(
             text("SELECT * FROM tasks WHERE id = :task_id"), {"task_id": task_id}
-        ).fetchone()
+        )).fetchone()
 
         if not task:
             raise NotFoundTasksExcept
 
-        session.execute(
+        await session.execute(
             text("DELETE FROM tasks WHERE id = :task_id"), {"task_id": task_id}
         )
-        session.commit()
+        await session.commit()
 
         return "Task deleted successfully"
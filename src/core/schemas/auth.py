@@ -0,0 +1,8 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class AuthenticatedUser(BaseModel):
+    username: str
+    exp: Optional[int] = None  # Время истечения JWT-токена (unix timestamp)
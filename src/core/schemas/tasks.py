@@ -1,9 +1,12 @@
 import enum
+from typing import Optional
 
 from fastapi import Form, UploadFile, File
 from pydantic import BaseModel, Field
 from sqlalchemy import Boolean
 
+from src.core.utils.config import settings
+
 
 class ParseTasksResponse(BaseModel):
     status: int
@@ -44,9 +47,43 @@ class CheckTaskAnswerOutputSchema(BaseModel):
     task_id: int
     is_correct: bool # True или False выдаст
 
+
+class CheckTaskAnswerBatchInputSchema(BaseModel):
+    answers: list[CheckTaskAnswerInputSchema] = Field(
+        ...,
+        min_length=1,
+        max_length=settings.autocheck.AUTOCHECK_BATCH_MAX_SIZE,
+        description="Ответы пользователя на задания",
+    )
+
+
+class CheckTaskAnswerBatchItemSchema(BaseModel):
+    task_id: int
+    status: int = Field(..., description="HTTP-статус, который вернула бы проверка этого ответа по отдельности")
+    is_correct: Optional[bool] = None  # None, если ответ не удалось проверить
+    detail: Optional[str] = None  # Причина ошибки для статусов, отличных от 200
+
+
+class CheckTaskAnswerBatchOutputSchema(BaseModel):
+    results: list[CheckTaskAnswerBatchItemSchema]
+
 class UpdateUserBalanceData(BaseModel):
     task_id: int
     user_id: int
     value: int
     status: str
-    tg: bool
\ No newline at end of file
+    tg: bool
+
+
+class ModerationSubmission(BaseModel):
+    """Задание, ожидающее отправки модераторам в исходящей очереди"""
+    task_id: int
+    user_id: int
+    value: int
+    username: str
+    text: Optional[str] = None
+    file_path: Optional[str] = None
+    file_type: Optional[str] = None  # photo или video
+    file_name: Optional[str] = None
+    content_type: Optional[str] = None
+    file_sha256: Optional[str] = None  # Хеш исходного файла: по нему повторно отправляется уже загруженный в Telegram file_id
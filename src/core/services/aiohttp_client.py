@@ -1,41 +1,404 @@
-import aiohttp
+import asyncio
+import json
 import logging
+import random
+import time
+import uuid
+from typing import Optional
 
-from fastapi import HTTPException, Request
+import aiohttp
+from fastapi import HTTPException, Request, status
+from src.core.http_client import http_client
+from src.core.jwt.tokens import create_service_token
+from src.core.metrics import (
+    BALANCE_CIRCUIT_STATE,
+    BALANCE_IN_FLIGHT,
+    BALANCE_REPLAY_QUEUE_DEPTH,
+    BALANCE_UPDATES,
+    OUTBOUND_HTTP_SECONDS,
+)
+from src.core.redis_client import redis_client
+from src.core.services.idempotency import balance_credits
 from src.core.schemas.tasks import UpdateUserBalanceData
-from src.core.utils.config import BASE_URL_FOR_AIOHTTP
+from src.core.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from src.core.utils.config import BASE_URL_FOR_AIOHTTP, settings
 
 logger = logging.getLogger("aiohttp_logger")
 
+BALANCE_ENDPOINT = "users/balance"
+
+# Статусы, при которых сервис точно не начислил баланс, и запрос можно повторить.
+# Таймауты и обрывы соединения после отправки сюда не входят: начисление могло пройти.
+RETRYABLE_STATUSES = {503}
+
+_CIRCUIT_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# KEYS[1] - очередь отложенных начислений (sorted set, score - когда отправлять, мс)
+# ARGV[1] - сколько записей забрать, ARGV[2] - аренда в миллисекундах
+# Забирает записи, которым пора отправляться, и сдвигает их на время аренды,
+# чтобы другой воркер не отправил их одновременно с нами
+REPLAY_CLAIM_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local entries = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'LIMIT', 0, tonumber(ARGV[1]))
+for _, entry in ipairs(entries) do
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), entry)
+end
+return entries
+"""
+
+
+class BalanceUnavailable(Exception):
+    """Сервис авторизации недоступен, и запрос до него точно не дошёл: начисление можно безопасно отложить"""
+
+
+class BalanceOutcomeUnknown(Exception):
+    """
+    Запрос отправлен, но ответа нет (таймаут, обрыв соединения) или сервис ответил 5xx:
+    начисление могло пройти, поэтому повторять его нельзя — только сверить вручную.
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _on_circuit_state_change(state: str):
+    BALANCE_CIRCUIT_STATE.set(_CIRCUIT_STATE_VALUES[state])
+    logger.warning(f"Предохранитель сервиса авторизации: {state}")
+
+
+_breaker = CircuitBreaker(
+    "balance",
+    failure_threshold=settings.balance.BALANCE_BREAKER_FAILURES,
+    reset_timeout=settings.balance.BALANCE_BREAKER_RESET,
+    on_state_change=_on_circuit_state_change,
+)
+BALANCE_CIRCUIT_STATE.set(0)
+
+# Ограничивает число одновременных запросов к сервису авторизации, чтобы зависший сервис
+# не занял все соединения и корутины воркера
+_bulkhead = asyncio.Semaphore(settings.balance.BALANCE_BULKHEAD_SIZE)
+
+
 class AiohtppClientService:
     @staticmethod
-    async def send_patch_request(endpoint: str, payload: dict, request: Request) -> dict:
+    async def send_patch_request(endpoint: str, payload: dict, token: Optional[str]) -> dict:
         """
-        Отправляет PATCH-запрос по указанному эндпоинту с заданным пейлоадом
+        Отправляет PATCH-запрос по указанному эндпоинту с заданным пейлоадом.
+
+        Весь вызов, включая ожидание свободного слота и повторы, укладывается в BALANCE_DEADLINE.
+        Повторяются только запросы, которые точно не дошли до сервиса (ошибка соединения, 503).
+        Отказ сервиса (4xx) возвращается HTTPException с его же статусом. Если неизвестно, прошло ли
+        начисление (таймаут — 504, обрыв соединения — 502, ответ 5xx), выбрасывает BalanceOutcomeUnknown.
+        Если сервис недоступен (разомкнут предохранитель, заняты все слоты, исчерпаны повторы),
+        выбрасывает BalanceUnavailable.
         """
-        logger.debug("Заход в метод send_patch_request")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.balance.BALANCE_DEADLINE
+        try:
+            await asyncio.wait_for(_bulkhead.acquire(), timeout=settings.balance.BALANCE_BULKHEAD_WAIT)
+        except TimeoutError:
+            raise BalanceUnavailable("все слоты запросов к сервису авторизации заняты")
+
+        BALANCE_IN_FLIGHT.inc()
+        try:
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    _breaker.before_call()
+                except CircuitOpenError as e:
+                    raise BalanceUnavailable(str(e))
+
+                try:
+                    result = await AiohtppClientService._patch(endpoint, payload, token, deadline - loop.time())
+                except BalanceUnavailable:
+                    _breaker.record_failure()
+                    delay = random.uniform(0, settings.balance.BALANCE_BACKOFF_BASE * 2 ** (attempt - 1))
+                    if attempt >= settings.balance.BALANCE_MAX_ATTEMPTS or loop.time() + delay >= deadline:
+                        raise
+                    logger.warning(f"PATCH-запрос на {endpoint} не дошёл, попытка {attempt}, повтор через {delay:.2f} с")
+                    await asyncio.sleep(delay)
+                    continue
+                except BalanceOutcomeUnknown:
+                    _breaker.record_failure()
+                    raise
+                except HTTPException:
+                    _breaker.record_success()
+                    raise
+                except BaseException:
+                    _breaker.release()
+                    raise
+
+                _breaker.record_success()
+                return result
+        finally:
+            BALANCE_IN_FLIGHT.dec()
+            _bulkhead.release()
+
+    @staticmethod
+    async def _patch(endpoint: str, payload: dict, token: Optional[str], timeout: float) -> dict:
+        """Одна попытка PATCH-запроса не дольше timeout секунд"""
         url = f"{BASE_URL_FOR_AIOHTTP}/{endpoint}"
-        token = request.cookies.get("jwt-token")
-        cookies = {"jwt-token": token}
+        if timeout <= 0:
+            raise BalanceUnavailable(f"не осталось времени на запрос к '{url}'")
+
+        logger.debug(f"Отправка запроса на {url} с данными {payload}")
+        request_timeout = aiohttp.ClientTimeout(
+            total=timeout,
+            connect=min(timeout, settings.http.HTTP_CONNECT_TIMEOUT),
+        )
+        started_at = time.perf_counter()
+        status_code = 0
         try:
-            async with aiohttp.ClientSession() as session:
-                logger.debug("Заход в контекстный менеджер отправки PATCH запроса в методе send_patch_request")
-                logger.debug(url)
-                logger.debug(payload)
-                async with session.patch(url, json=payload, cookies=cookies) as response:
-                    logger.debug(f"Отправка запроса на {url} с данными {payload}")
-                    logger.debug(f"Ответ от сервера: {response.status}")
-                    if response.status != 200:
-                        error_text = await response.text()
-                        raise HTTPException(status_code=response.status, detail=error_text)
-                    logger.debug("PATCH запрос успешно отправлен успешно в методе send_patch_request")
+            async with http_client.session.patch(
+                url, json=payload, cookies={"jwt-token": token}, timeout=request_timeout
+            ) as response:
+                status_code = response.status
+                logger.debug(f"Ответ от сервера: {response.status}")
+                if response.status == 200:
                     return await response.json()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Непредвиденная ошибка при отправке PATCH-запроса на: '{url}'")
+                error_text = await response.text()
+        except (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError) as e:
+            # Соединение не установлено — запрос до сервиса не дошёл
+            raise BalanceUnavailable(f"не удалось подключиться к '{url}': {e}")
+        except TimeoutError:
+            raise BalanceOutcomeUnknown(status.HTTP_504_GATEWAY_TIMEOUT, f"Сервис не ответил вовремя: '{url}'")
+        except aiohttp.ClientError as e:
+            raise BalanceOutcomeUnknown(status.HTTP_502_BAD_GATEWAY, f"Ошибка соединения с '{url}': {e}")
+        finally:
+            OUTBOUND_HTTP_SECONDS.labels(target=endpoint, status=status_code).observe(time.perf_counter() - started_at)
+
+        if response.status in RETRYABLE_STATUSES:
+            raise BalanceUnavailable(f"'{url}' ответил {response.status}: {error_text}")
+        logger.error(f"PATCH-запрос на {url} вернул {response.status}: {error_text}")
+        if response.status >= 500:
+            raise BalanceOutcomeUnknown(response.status, error_text)
+        raise HTTPException(status_code=response.status, detail=error_text)
 
     @staticmethod
-    async def update_user_balance(data: UpdateUserBalanceData, request: Request) -> dict:
+    async def update_user_balance(
+            data: UpdateUserBalanceData,
+            request: Request,
+            username: str,
+            credit_key: str,
+            credit_token: str) -> dict:
+        """
+        Пополняет баланс пользователя username и завершает захват credit_token ключа credit_key в balance_credits.
+        Выполненным захват отмечается, только если сервис авторизации подтвердил начисление.
+
+        Если сервис недоступен, начисление откладывается в очередь (status=queued), а захват остаётся
+        отложенным, пока BalanceReplayWorker не отправит начисление. Если неизвестно, прошло ли начисление,
+        оно записывается на ручную сверку (status=unknown), а захват остаётся отложенным бессрочно:
+        так повтор ответа не отправит второй PATCH. Исключение выбрасывается, только когда начисление
+        точно не прошло (отказ сервиса 4xx) и его можно повторить — захват тогда снимает вызывающий.
+        """
         logger.debug("Заход в метод update_user_balance")
-        endpoint = "users/balance"
         payload = data.model_dump()
-        return await AiohtppClientService.send_patch_request(endpoint, payload, request)
\ No newline at end of file
+        token = request.cookies.get("jwt-token")
+        try:
+            result = await AiohtppClientService.send_patch_request(BALANCE_ENDPOINT, payload, token)
+        except BalanceUnavailable as e:
+            result = {"status": "queued"}
+            await balance_replay_queue.push(BALANCE_ENDPOINT, payload, username, credit_key, credit_token)
+            # Захват должен пережить запись в очереди: её отправят или похоронят не позже чем через
+            # BALANCE_REPLAY_MAX_AGE плюс последнюю паузу между попытками и аренду
+            await balance_credits.hold(
+                credit_key,
+                credit_token,
+                result,
+                ttl=(
+                    settings.balance.BALANCE_REPLAY_MAX_AGE
+                    + settings.balance.BALANCE_REPLAY_BACKOFF_MAX
+                    + settings.balance.BALANCE_REPLAY_LEASE
+                ),
+            )
+            BALANCE_UPDATES.labels(result="queued").inc()
+            logger.warning(f"Пополнение баланса за задание {data.task_id} отложено: {e}")
+            return result
+        except BalanceOutcomeUnknown as e:
+            logger.error(f"Неизвестно, пополнен ли баланс за задание {data.task_id}: {e}")
+            BALANCE_UPDATES.labels(result="unknown").inc()
+            result = {"status": "unknown"}
+            try:
+                await balance_replay_queue.record_unknown(BALANCE_ENDPOINT, payload, str(e), credit_key, credit_token)
+            except Exception as redis_error:
+                logger.error(
+                    f"Не удалось записать на сверку начисление за задание {data.task_id} пользователю {data.user_id}: "
+                    f"{redis_error}",
+                    exc_info=True,
+                )
+            await balance_credits.hold(credit_key, credit_token, result)
+            return result
+        except HTTPException:
+            BALANCE_UPDATES.labels(result="failed").inc()
+            raise
+        BALANCE_UPDATES.labels(result="sent").inc()
+        await balance_credits.complete(credit_key, credit_token, result)
+        return result
+
+
+class BalanceReplayQueue:
+    """
+    Очередь отложенных пополнений баланса в Redis, общая для всех воркеров.
+    Токен пользователя в очереди не хранится: запись знает только его username, а при отправке
+    сервис выпускает собственный короткоживущий токен (см. create_service_token).
+    Запись также хранит ключ и токен захвата в balance_credits, чтобы завершить его, когда исход станет известен.
+    """
+
+    def __init__(self, key: str, dead_key: str):
+        self.key = key
+        self.dead_key = dead_key
+        self._claim_script = redis_client.register_script(REPLAY_CLAIM_SCRIPT)
+
+    async def push(
+            self,
+            endpoint: str,
+            payload: dict,
+            username: str,
+            credit_key: str,
+            credit_token: str,
+            attempts: int = 0,
+            delay: float = 0):
+        entry = {
+            "id": uuid.uuid4().hex,
+            "endpoint": endpoint,
+            "payload": payload,
+            "username": username,
+            "credit_key": credit_key,
+            "credit_token": credit_token,
+            "attempts": attempts,
+            "queued_at": time.time(),
+        }
+        await redis_client.zadd(self.key, {json.dumps(entry): int((time.time() + delay) * 1000)})
+
+    async def claim(self, count: int, lease: float) -> list[str]:
+        return await self._claim_script(keys=[self.key], args=[count, int(lease * 1000)])
+
+    async def ack(self, raw_entry: str):
+        await redis_client.zrem(self.key, raw_entry)
+
+    async def reschedule(self, raw_entry: str, delay: float):
+        entry = json.loads(raw_entry)
+        entry["attempts"] += 1
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.key, raw_entry)
+            pipe.zadd(self.key, {json.dumps(entry): int((time.time() + delay) * 1000)})
+            await pipe.execute()
+
+    async def bury(self, raw_entry: str, reason: str):
+        """Снимает запись с очереди в dead letter для ручной сверки"""
+        entry = json.loads(raw_entry)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.key, raw_entry)
+            pipe.rpush(self.dead_key, self._dead_entry(entry, reason))
+            await pipe.execute()
+
+    async def record_unknown(self, endpoint: str, payload: dict, reason: str, credit_key: str, credit_token: str):
+        """Записывает в dead letter начисление, которое могло пройти, чтобы его сверили вручную"""
+        entry = {
+            "id": uuid.uuid4().hex,
+            "endpoint": endpoint,
+            "payload": payload,
+            "credit_key": credit_key,
+            "credit_token": credit_token,
+            "queued_at": time.time(),
+        }
+        await redis_client.rpush(self.dead_key, self._dead_entry(entry, reason))
+
+    @staticmethod
+    def _dead_entry(entry: dict, reason: str) -> str:
+        entry = dict(entry, reason=reason)
+        return json.dumps(entry, ensure_ascii=False)
+
+    async def depth(self) -> int:
+        return await redis_client.zcard(self.key)
+
+
+class BalanceReplayWorker:
+    """
+    Фоновая задача воркера: раз в BALANCE_REPLAY_INTERVAL отправляет отложенные пополнения баланса,
+    пока предохранитель не разомкнут. Записи забираются с арендой, поэтому воркеры не отправляют одну запись дважды.
+    Ответ с ошибкой или таймаут после отправки не повторяются (начисление могло пройти) и уходят в dead letter.
+
+    Захват начисления в balance_credits завершается после подтверждения и снимается, если начисление точно
+    не прошло (отказ сервиса, истёк срок хранения), чтобы правильный ответ мог пополнить баланс снова.
+    Если исход неизвестен, захват остаётся до ручной сверки.
+    """
+
+    def __init__(self, queue: BalanceReplayQueue):
+        self.queue = queue
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run(), name="balance-replay-worker")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                BALANCE_REPLAY_QUEUE_DEPTH.set(await self.queue.depth())
+                if _breaker.state != OPEN:
+                    await self._replay_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Не удалось обработать очередь отложенных начислений: {e}", exc_info=True)
+            await asyncio.sleep(settings.balance.BALANCE_REPLAY_INTERVAL)
+
+    async def _replay_batch(self):
+        entries = await self.queue.claim(settings.balance.BALANCE_REPLAY_BATCH, settings.balance.BALANCE_REPLAY_LEASE)
+        unavailable = False
+        for raw_entry in entries:
+            entry = json.loads(raw_entry)
+            if time.time() - entry["queued_at"] > settings.balance.BALANCE_REPLAY_MAX_AGE:
+                await self.queue.bury(raw_entry, "истёк срок хранения")
+                await balance_credits.abandon(entry["credit_key"], entry["credit_token"])
+                BALANCE_UPDATES.labels(result="dead").inc()
+                continue
+            if unavailable:
+                # Сервис уже не ответил в этом проходе, остальные записи откладываются без запроса
+                await self.queue.reschedule(raw_entry, self._backoff(entry["attempts"]))
+                continue
+
+            token = create_service_token(entry["username"], settings.balance.BALANCE_REPLAY_TOKEN_LIFETIME)
+            try:
+                result = await AiohtppClientService.send_patch_request(entry["endpoint"], entry["payload"], token)
+            except BalanceUnavailable as e:
+                unavailable = True
+                logger.warning(f"Отложенное начисление {entry['id']} снова не отправлено: {e}")
+                await self.queue.reschedule(raw_entry, self._backoff(entry["attempts"]))
+                continue
+            except (HTTPException, BalanceOutcomeUnknown) as e:
+                logger.error(f"Отложенное начисление {entry['id']} не подтверждено: {e.status_code} {e.detail}")
+                await self.queue.bury(raw_entry, f"{e.status_code}: {e.detail}")
+                if isinstance(e, HTTPException):
+                    await balance_credits.abandon(entry["credit_key"], entry["credit_token"])
+                else:
+                    await balance_credits.hold(entry["credit_key"], entry["credit_token"], {"status": "unknown"})
+                BALANCE_UPDATES.labels(result="dead").inc()
+                continue
+
+            await balance_credits.complete(entry["credit_key"], entry["credit_token"], result)
+            await self.queue.ack(raw_entry)
+            BALANCE_UPDATES.labels(result="replayed").inc()
+            logger.info(f"Отложенное начисление {entry['id']} отправлено")
+
+    @staticmethod
+    def _backoff(attempts: int) -> float:
+        delay = min(settings.balance.BALANCE_REPLAY_BACKOFF_MAX, settings.balance.BALANCE_REPLAY_INTERVAL * 2 ** attempts)
+        return random.uniform(delay / 2, delay)
+
+
+balance_replay_queue = BalanceReplayQueue(
+    key=settings.balance.BALANCE_REPLAY_KEY,
+    dead_key=settings.balance.BALANCE_REPLAY_DEAD_KEY,
+)
+balance_replay_worker = BalanceReplayWorker(balance_replay_queue)
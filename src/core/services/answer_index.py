@@ -0,0 +1,86 @@
+import logging
+from typing import Optional
+
+import pyarrow as pa
+from pandas import isna, to_numeric
+from starlette.concurrency import run_in_threadpool
+
+from src.core.services.snapshot import WorkbookSnapshot, workbook_snapshot
+
+logger = logging.getLogger("answer_index_logger")
+
+
+def normalize_answer(answer) -> str:
+    """Приводит ответ к виду, в котором ответы сравниваются между собой"""
+    return str(answer).strip().lower()
+
+
+class AnswerIndex:
+    """
+    Индекс правильных ответов: ID задания -> нормализованный ответ.
+
+    Строится один раз на версию Excel-файла и общий для всех запросов воркера.
+    За тем, изменился ли файл, следит WorkbookSnapshot; индекс перестраивается,
+    только если сменилась версия снимка. Под gunicorn индекс строится в мастере,
+    и воркеры получают его готовым после fork.
+    """
+
+    def __init__(self, snapshot: WorkbookSnapshot):
+        self.snapshot = snapshot
+
+        self._answers: dict[int, str] = {}
+        self._version: Optional[str] = None
+
+    @property
+    def version(self) -> Optional[str]:
+        """Хеш содержимого файла, по которому построен текущий индекс"""
+        return self._version
+
+    async def get_answer(self, task_id: int) -> Optional[str]:
+        """Возвращает нормализованный правильный ответ на задание или None, если задания нет"""
+        await self.ensure_fresh()
+        return self._answers.get(task_id)
+
+    async def get_answers(self, task_ids: list[int]) -> dict[int, Optional[str]]:
+        """Возвращает правильные ответы сразу на несколько заданий из одной версии индекса"""
+        await self.ensure_fresh()
+        return {task_id: self._answers.get(task_id) for task_id in task_ids}
+
+    async def ensure_fresh(self):
+        """Как refresh, но снимок загружается и индекс строится вне event loop"""
+        version, table = await self.snapshot.aload()
+        if version != self._version:
+            logger.info(f"Перестроение индекса ответов (sha256={version})")
+            answers = await run_in_threadpool(self._build, table)
+            self._apply(version, answers)
+
+    def refresh(self):
+        """Перестраивает индекс, если сменилась версия снимка"""
+        version, table = self.snapshot.load()
+        if version != self._version:
+            logger.info(f"Перестроение индекса ответов (sha256={version})")
+            self._apply(version, self._build(table))
+
+    def _apply(self, version: str, answers: dict[int, str]):
+        self._answers = answers
+        self._version = version
+        logger.info(f"Индекс ответов построен, заданий: {len(self._answers)}")
+
+    @staticmethod
+    def _build(table: pa.Table) -> dict[int, str]:
+        df = table.select(["№", "Ответ"]).to_pandas()
+        # В колонке «№» бывают не только числа (подписи, разделители); такие строки пропускаются
+        task_ids = to_numeric(df["№"], errors="coerce")
+        skipped = df["№"][task_ids.isna() & df["№"].notna()]
+        if not skipped.empty:
+            logger.warning(f"Пропущено строк с нечисловым номером задания: {len(skipped)} ({list(skipped.head(5))})")
+
+        answers = {}
+        for task_id, answer in zip(task_ids, df["Ответ"]):
+            if isna(task_id):
+                continue
+            answers[int(task_id)] = normalize_answer(answer)
+        return answers
+
+
+answer_index = AnswerIndex(snapshot=workbook_snapshot)
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import logging
+import time
+from typing import Optional
+
+from src.core.redis_client import redis_client
+from src.core.schemas.auth import AuthenticatedUser
+from src.core.utils.config import settings
+from src.core.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger("auth_cache_logger")
+
+# Маркер "пользователя из токена нет в базе" для негативного кеширования
+UNKNOWN_USER = object()
+
+_local_cache = TTLCache(
+    max_size=settings.auth_cache.AUTH_CACHE_MAX_SIZE,
+    ttl=settings.auth_cache.AUTH_CACHE_TTL,
+)
+
+
+class AuthCacheService:
+    """
+    Кеш проверенных пользователей по хешу JWT-токена.
+    Первый уровень — в памяти воркера, второй (опционально) — в Redis, общий для всех воркеров.
+    Запись никогда не живёт дольше, чем exp самого токена.
+    """
+
+    @staticmethod
+    def hash_token(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @staticmethod
+    def _redis_key(token_hash: str) -> str:
+        return settings.auth_cache.AUTH_CACHE_KEY_TEMPLATE.format(token_hash=token_hash)
+
+    @staticmethod
+    def _ttl(ttl: int, exp: Optional[int]) -> float:
+        if exp is None:
+            return ttl
+        return min(ttl, exp - time.time())
+
+    @staticmethod
+    async def get(token_hash: str):
+        """
+        Возвращает AuthenticatedUser, UNKNOWN_USER (негативная запись) или None, если в кеше ничего нет.
+        """
+        cached = _local_cache.get(token_hash)
+        if cached is not None:
+            return cached
+
+        if not settings.auth_cache.AUTH_CACHE_REDIS_ENABLED:
+            return None
+
+        try:
+            raw = await redis_client.get(AuthCacheService._redis_key(token_hash))
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать кеш авторизации из Redis: {e}")
+            return None
+        if not raw:
+            return None
+
+        data = json.loads(raw)
+        exp = data.get("exp")
+        ttl = AuthCacheService._ttl(settings.auth_cache.AUTH_CACHE_TTL, exp)
+        if ttl <= 0:
+            return None
+
+        cached = UNKNOWN_USER if data.get("username") is None else AuthenticatedUser(**data)
+        _local_cache.set(token_hash, cached, ttl=ttl)
+        return cached
+
+    @staticmethod
+    async def set_user(token_hash: str, user: AuthenticatedUser):
+        ttl = AuthCacheService._ttl(settings.auth_cache.AUTH_CACHE_TTL, user.exp)
+        await AuthCacheService._set(token_hash, user, user.model_dump(), ttl)
+
+    @staticmethod
+    async def set_unknown(token_hash: str, exp: Optional[int]):
+        ttl = AuthCacheService._ttl(settings.auth_cache.AUTH_CACHE_NEGATIVE_TTL, exp)
+        await AuthCacheService._set(token_hash, UNKNOWN_USER, {"username": None, "exp": exp}, ttl)
+
+    @staticmethod
+    async def _set(token_hash: str, value, payload: dict, ttl: float):
+        if ttl <= 0:
+            return
+
+        _local_cache.set(token_hash, value, ttl=ttl)
+
+        if not settings.auth_cache.AUTH_CACHE_REDIS_ENABLED:
+            return
+        try:
+            await redis_client.set(
+                AuthCacheService._redis_key(token_hash),
+                json.dumps(payload),
+                px=max(int(ttl * 1000), 1),
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить кеш авторизации в Redis: {e}")
@@ -1,75 +1,356 @@
-import json
+import asyncio
 import logging
+from typing import Optional
 
+from src.core.metrics import CACHE_LOOKUPS
 from src.core.utils.config import settings
-from src.core.redis_client import redis_client
-from src.core.schemas.tasks import ParseTasksResponse
+from src.core.redis_client import redis_binary_client, redis_blocking_client
+from src.core.utils.http_cache import IDENTITY
+from src.core.utils.ttl_cache import TTLCache
 
 logger = logging.getLogger("cache_logger")
 
+# KEYS[1] - последний принятый fencing-токен, KEYS[2] - указатель на актуальную версию,
+# KEYS[3] - индекс дней новой версии (sorted set), KEYS[4..n+3] - ключи дней новой версии
+# ARGV[1] - fencing-токен писателя, ARGV[2] - новая версия, ARGV[3] - количество дней n,
+# ARGV[4..n+3] - номера дней, ARGV[n+4..2n+3] - данные дней
+# Возвращает {1, прежняя версия} или {0}, если запись отвергнута
+PUBLISH_VERSION_SCRIPT = """
+local last = tonumber(redis.call('GET', KEYS[1]) or '0')
+local token = tonumber(ARGV[1])
+if token < last then
+    return {0}
+end
+redis.call('SET', KEYS[1], token)
+
+local days_count = tonumber(ARGV[3])
+redis.call('DEL', KEYS[3])
+for i = 1, days_count do
+    redis.call('SET', KEYS[i + 3], ARGV[days_count + i + 3])
+    redis.call('ZADD', KEYS[3], ARGV[i + 3], ARGV[i + 3])
+end
+
+local previous = redis.call('GET', KEYS[2]) or ''
+redis.call('SET', KEYS[2], ARGV[2])
+return {1, previous}
+"""
+
+# KEYS[1] - указатель на актуальную версию, KEYS[2] - ключ готового ответа
+# ARGV[1] - версия, из которой собран ответ, ARGV[2..] - поля и значения хеша
+# Ответ устаревшей версии не записывается: его уже некому будет удалить
+RESPONSE_WRITE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[2])
+redis.call('HSET', KEYS[2], unpack(ARGV, 2))
+return 1
+"""
+
+# KEYS[1] - указатель на актуальную версию, KEYS[2..] - ключи дней
+# ARGV[1] - версия, ARGV[2..] - данные дней
+# Дни дописываются только в актуальную версию: ключи уже выведенной версии никто не удалит
+DAYS_REPAIR_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+for i = 2, #KEYS do
+    redis.call('SET', KEYS[i], ARGV[i])
+end
+return 1
+"""
+
+_publish_version_script = redis_binary_client.register_script(PUBLISH_VERSION_SCRIPT)
+_response_write_script = redis_binary_client.register_script(RESPONSE_WRITE_SCRIPT)
+_days_repair_script = redis_binary_client.register_script(DAYS_REPAIR_SCRIPT)
+
+# Локальный уровень кеша готовых ответов: (scope, кодировка) -> (версия, etag, кодировка, тело).
+# Размер ограничен суммарным объёмом тел в байтах
+_local_responses = TTLCache(
+    max_size=settings.local_cache.LOCAL_CACHE_MAX_BYTES,
+    ttl=settings.local_cache.LOCAL_CACHE_TTL,
+)
+
 
 class CacheService:
+    """
+    Кеш заданий в Redis. Всё хранится уже сериализованным и привязано к версии Excel-файла (sha256):
+    - по ключу дня версии — JSON-массив заданий этого дня;
+    - по ключу ответа версии — хеш с ETag и готовыми телами ответа /get-all
+      (несжатым, gzip, br) для конкретного набора дней.
+
+    Данные версии пишутся целиком и не меняются, а затем одной командой переключается указатель
+    на актуальную версию, поэтому читатель никогда не увидит дни из разных версий файла.
+    TTL у актуальной версии нет; прежняя версия удаляется через CACHE_RETIRED_VERSION_TTL после переключения.
+
+    Перед Redis стоит локальный уровень в памяти воркера для готовых ответов. После переключения
+    версии в канал инвалидации публикуется новая версия, и каждый воркер выбрасывает локальные
+    ответы других версий. Если Redis недоступен, ответы отдаются из локального уровня, даже истёкшие.
+    """
+
     @staticmethod
-    def get_day_data(day: int):
-        """Получает данные для конкретного дня из кеша"""
-        cache_key = settings.redis.CACHE_KEY_TEMPLATE.format(day=day)
+    def _day_key(version: str, day: int | str) -> str:
+        return settings.redis.CACHE_KEY_TEMPLATE.format(version=version, day=day)
+
+    @staticmethod
+    def _response_key(version: str, scope: str) -> str:
+        return settings.redis.RESPONSE_CACHE_KEY_TEMPLATE.format(version=version, scope=scope)
+
+    @staticmethod
+    def _days_index_key(version: str) -> str:
+        return settings.redis.CACHE_DAYS_INDEX_TEMPLATE.format(version=version)
+
+    @staticmethod
+    def response_scope(day: int | None) -> str:
+        """Набор дней, для которого строится ответ: все дни или дни 1..day"""
+        return "all" if day is None else f"day:{day}"
+
+    @staticmethod
+    def all_response_scopes() -> list[str]:
+        return [CacheService.response_scope(None)] + [
+            CacheService.response_scope(day) for day in range(1, settings.excel.DAYS_COUNT + 1)
+        ]
+
+    @staticmethod
+    async def get_current_version() -> Optional[str]:
+        """Возвращает версию Excel-файла, каталог которой сейчас актуален, или None, если каталога ещё нет"""
         try:
-            data = redis_client.get(cache_key)
-            if data:
-                return json.loads(data)
+            version = await redis_binary_client.get(settings.redis.CACHE_CURRENT_VERSION_KEY)
+        except Exception as e:
+            logger.error(f"Ошибка при получении актуальной версии кеша из Redis: {e}", exc_info=True)
             return None
+        return version.decode() if version else None
+
+    @staticmethod
+    async def get_days_data(version: str, days: list[int]) -> dict[int, Optional[bytes]]:
+        """
+        Получает сериализованные данные сразу нескольких дней версии одним MGET.
+        Для отсутствующих в кеше дней возвращает None.
+        """
+        if not days:
+            return {}
+        try:
+            values = await redis_binary_client.mget([CacheService._day_key(version, day) for day in days])
+        except Exception as e:
+            logger.error(f"Ошибка при получении данных дней {days} из Redis: {e}", exc_info=True)
+            return {day: None for day in days}
+
+        return dict(zip(days, values))
+
+    @staticmethod
+    async def publish_version(version: str, days_data: dict[int, bytes], fence_token: int) -> bool:
+        """
+        Атомарно записывает все дни новой версии вместе с индексом дней и переключает на неё указатель.
+        Запись отвергается, если уже была запись с более новым fencing-токеном (то есть аренда этого
+        писателя истекла и кеш пересобрал кто-то другой). После переключения прежняя версия
+        доживает CACHE_RETIRED_VERSION_TTL, а все воркеры получают новую версию через канал инвалидации.
+        """
+        days = list(days_data)
+        keys = (
+            [settings.redis.CACHE_FENCE_KEY, settings.redis.CACHE_CURRENT_VERSION_KEY, CacheService._days_index_key(version)]
+            + [CacheService._day_key(version, day) for day in days]
+        )
+        args = [fence_token, version, len(days)] + days + [days_data[day] for day in days]
+        try:
+            accepted, *previous = await _publish_version_script(keys=keys, args=args)
         except Exception as e:
-            logger.error(f"Ошибка при получении данных дня {day} из Redis: {e}", exc_info=True)
+            logger.error(f"Ошибка при публикации версии {version} в Redis: {e}", exc_info=True)
+            return False
+
+        if not accepted:
+            logger.warning(f"Публикация версии {version} с устаревшим fencing-токеном {fence_token} отклонена")
+            return False
+        logger.info(f"Каталог версии {version} (дни {days}) опубликован в Redis")
+
+        previous_version = previous[0].decode() if previous and previous[0] else None
+        if previous_version and previous_version != version:
+            await CacheService._retire_version(previous_version)
+
+        try:
+            await redis_binary_client.publish(settings.local_cache.CACHE_INVALIDATION_CHANNEL, version)
+        except Exception as e:
+            logger.error(f"Не удалось опубликовать инвалидацию кеша версии {version}: {e}", exc_info=True)
+        return True
+
+    @staticmethod
+    async def repair_days(version: str, days_data: dict[int, bytes]) -> bool:
+        """
+        Дописывает в кеш актуальной версии дни, которых в нём не оказалось (например, вытесненные Redis).
+        Если версия уже сменилась, ничего не пишет и возвращает False.
+        """
+        days = list(days_data)
+        keys = [settings.redis.CACHE_CURRENT_VERSION_KEY] + [CacheService._day_key(version, day) for day in days]
+        try:
+            written = await _days_repair_script(keys=keys, args=[version] + [days_data[day] for day in days])
+        except Exception as e:
+            logger.error(f"Ошибка при восстановлении дней {days} версии {version} в Redis: {e}", exc_info=True)
+            return False
+        if written:
+            logger.info(f"Дни {days} версии {version} восстановлены в Redis")
+        return bool(written)
+
+    @staticmethod
+    async def _retire_version(version: str):
+        """Ставит TTL на все ключи прежней версии, чтобы уже начатые запросы успели их дочитать"""
+        ttl = settings.redis.CACHE_RETIRED_VERSION_TTL
+        index_key = CacheService._days_index_key(version)
+        try:
+            days = await redis_binary_client.zrange(index_key, 0, -1)
+            async with redis_binary_client.pipeline(transaction=False) as pipe:
+                pipe.expire(index_key, ttl)
+                for day in days:
+                    pipe.expire(CacheService._day_key(version, int(day)), ttl)
+                for scope in CacheService.all_response_scopes():
+                    pipe.expire(CacheService._response_key(version, scope), ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Не удалось вывести из оборота версию кеша {version}: {e}", exc_info=True)
+
+    @staticmethod
+    async def get_response(scope: str, encoding: str) -> Optional[tuple[str, str, bytes]]:
+        """
+        Получает ETag и готовое тело ответа для набора дней в нужной кодировке:
+        сначала из памяти воркера, затем из Redis для актуальной версии.
+        Возвращает (etag, кодировка, тело); если нужной кодировки нет, отдаёт несжатый вариант.
+        """
+        local_key = (scope, encoding)
+        cached = _local_responses.get(local_key)
+        if cached is not None:
+            CACHE_LOOKUPS.labels(layer="local", result="hit").inc()
+            return cached[1:]
+
+        try:
+            version = await redis_binary_client.get(settings.redis.CACHE_CURRENT_VERSION_KEY)
+            if version is None:
+                CACHE_LOOKUPS.labels(layer="redis", result="miss").inc()
+                return None
+            version = version.decode()
+
+            stale = _local_responses.get(local_key, allow_stale=True)
+            if stale is not None and stale[0] == version:
+                # Версия не сменилась — продлеваем локальный ответ, не перечитывая тело из Redis
+                _local_responses.set(local_key, stale, size=len(stale[3]))
+                CACHE_LOOKUPS.labels(layer="local", result="hit").inc()
+                return stale[1:]
+
+            key = CacheService._response_key(version, scope)
+            etag, body = await redis_binary_client.hmget(key, ["etag", encoding])
+            if body is None and etag is not None and encoding != IDENTITY:
+                encoding = IDENTITY
+                body = await redis_binary_client.hget(key, IDENTITY)
+            if etag is None or body is None:
+                CACHE_LOOKUPS.labels(layer="redis", result="miss").inc()
+                return None
+        except Exception as e:
+            stale = _local_responses.get(local_key, allow_stale=True)
+            if stale is not None:
+                CACHE_LOOKUPS.labels(layer="local", result="stale").inc()
+                logger.warning(f"Redis недоступен ({e}), ответ {scope} отдан из памяти воркера")
+                return stale[1:]
+            logger.error(f"Ошибка при получении ответа {scope} из Redis: {e}", exc_info=True)
             return None
 
+        CACHE_LOOKUPS.labels(layer="redis", result="hit").inc()
+        cached = (version, etag.decode(), encoding, body)
+        _local_responses.set(local_key, cached, size=len(body))
+        return cached[1:]
+
     @staticmethod
-    def cache_day_data(day: int, data: dict):
-        """Кеширует данные для конкретного дня"""
-        cache_key = settings.redis.CACHE_KEY_TEMPLATE.format(day=day)
+    async def cache_response(scope: str, etag: str, variants: dict[str, bytes], version: str):
+        """
+        Кеширует ETag и все варианты тела ответа (несжатый, gzip, br) для набора дней версии.
+        В Redis ответ записывается, только если его версия всё ещё актуальна.
+        """
+        for encoding, body in variants.items():
+            _local_responses.set((scope, encoding), (version, etag, encoding, body), size=len(body))
+
+        fields = ["etag", etag]
+        for encoding, body in variants.items():
+            fields += [encoding, body]
         try:
-            redis_client.set(cache_key, json.dumps(data), ex=settings.redis.CACHE_EXPIRE)
-            logger.debug(f"Данные дня {day} успешно сохранены в Redis")
+            await _response_write_script(
+                keys=[settings.redis.CACHE_CURRENT_VERSION_KEY, CacheService._response_key(version, scope)],
+                args=[version] + fields,
+            )
         except Exception as e:
-            logger.error(f"Ошибка при сохранении данных дня {day} в Redis: {e}", exc_info=True)
+            logger.error(f"Ошибка при сохранении ответа {scope} в Redis: {e}", exc_info=True)
+
+    @staticmethod
+    def invalidate_local(version: str):
+        """Выбрасывает из памяти воркера готовые ответы всех версий, кроме указанной"""
+        _local_responses.discard_if(lambda _, value: value[0] != version)
 
     @staticmethod
-    def get_all_cached_days():
-        """Получает все доступные дни из кеша"""
+    async def get_version_days(version: str) -> list[int]:
+        """Получает все дни версии из её индекса дней"""
         try:
-            # Получаем все ключи, соответствующие шаблону
-            keys = redis_client.keys(settings.redis.CACHE_KEY_TEMPLATE.format(day="*"))
-            days = []
-            for key in keys:
-                # Извлекаем номер дня из ключа
-                day = int(key.split(":")[-1])
-                days.append(day)
-            return sorted(days)
+            days = await redis_binary_client.zrange(CacheService._days_index_key(version), 0, -1)
+            return [int(day) for day in days]
         except Exception as e:
-            logger.error(f"Ошибка при получении списка дней из кеша: {e}", exc_info=True)
+            logger.error(f"Ошибка при получении списка дней версии {version} из кеша: {e}", exc_info=True)
             return []
 
     @staticmethod
-    def get_accumulated_data(day: int | None = None):
+    async def get_accumulated_data(
+            day: int | None = None) -> tuple[Optional[str], list[int], dict[int, Optional[bytes]]]:
         """
-        Получает накопленные данные:
-        - если day=None - все данные из кеша
+        Получает накопленные данные актуальной версии в виде сериализованных массивов по дням:
+        - если day=None - все дни версии
         - если указан day - данные за все дни до day включительно
+        Возвращает версию (None, если каталога ещё нет), список нужных дней и их данные;
+        отсутствующие в кеше дни имеют значение None. Дни, которых нет в каталоге версии
+        (в таблице нет таких заданий), сразу считаются пустыми.
         """
-        result = []
+        version = await CacheService.get_current_version()
+        version_days = await CacheService.get_version_days(version) if version else []
         if day is None:
-            # Получаем все доступные дни
-            days = CacheService.get_all_cached_days()
+            days = version_days or list(range(1, settings.excel.DAYS_COUNT + 1))
         else:
-            # Получаем дни от 1 до указанного
-            days = range(1, day + 1)
-
-        # TODO: Тут можно сделать поумнее, если какой-то день отсутствует, но другие есть в кеше, то спарсить именно его
-        # TODO: С excel таблички, а остальные достать из кеша
-        for day_num in days:
-            day_data = CacheService.get_day_data(day_num)
-            if day_data:
-                result.extend(day_data)
-            else:
-                return None  # Если какой-то день отсутствует
-
-        return result if result else None
+            days = list(range(1, day + 1))
+
+        if version is None:
+            return None, days, {day_num: None for day_num in days}
+        if not version_days:
+            # Индекс дней пропал — не знаем, какие дни пусты, поэтому все они считаются отсутствующими
+            return version, days, await CacheService.get_days_data(version, days)
+
+        catalogue_days = set(version_days)
+        days_data = await CacheService.get_days_data(version, [day_num for day_num in days if day_num in catalogue_days])
+        return version, days, {day_num: days_data.get(day_num, b"[]") for day_num in days}
+
+
+class CacheInvalidationListener:
+    """
+    Фоновая задача воркера: слушает канал инвалидации в Redis и чистит локальный уровень кеша.
+    При обрыве соединения переподписывается; пока подписки нет, локальные ответы живут не дольше LOCAL_CACHE_TTL.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run(), name="cache-invalidation-listener")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                async with redis_blocking_client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(settings.local_cache.CACHE_INVALIDATION_CHANNEL)
+                    async for message in pubsub.listen():
+                        version = message["data"]
+                        logger.info(f"Получена инвалидация кеша, актуальная версия: {version}")
+                        CacheService.invalidate_local(version)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Подписка на инвалидацию кеша прервана: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+
+cache_invalidation_listener = CacheInvalidationListener()
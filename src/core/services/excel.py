@@ -1,24 +1,42 @@
+import asyncio
+import hashlib
 import json
 import logging
+import time
 
 from fastapi import HTTPException, status, Request
-from pandas import read_excel, DataFrame
-from sqlalchemy.orm import Session
+import pyarrow as pa
+from pandas import DataFrame
+from pydantic import BaseModel
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
+from src.core.schemas.auth import AuthenticatedUser
 from src.core.schemas.tasks import (
+    CheckTaskAnswerBatchInputSchema,
+    CheckTaskAnswerBatchItemSchema,
+    CheckTaskAnswerBatchOutputSchema,
     CheckTaskAnswerInputSchema,
     CheckTaskAnswerOutputSchema,
     UpdateUserBalanceData
 )
+from src.core.metrics import EXCEL_PARSE_ROWS, EXCEL_PARSE_SECONDS
 from src.core.services.aiohttp_client import AiohtppClientService
+from src.core.services.answer_index import answer_index, normalize_answer
+from src.core.services.idempotency import balance_credits, idempotent_responses
+from src.core.services.snapshot import workbook_snapshot
 from src.core.utils.auth import verify_user_by_jwt
+from src.core.utils.config import settings
+from src.core.utils.disconnect import cancel_on_disconnect
+from src.core.utils.exceptions import ExcelParseTimeoutExcept
 
 logger = logging.getLogger("excel_logger")
 
 class ExcelService:
     @staticmethod
     async def _parse_excel(columns_to_drop: list, max_day: int | None) -> DataFrame:
-        file_path = "PlayIT.xlsx"
+        file_path = settings.excel.FILE_PATH
 
         # Проверка, что файл имеет корректное расширение
         if not file_path.endswith(".xlsx" or ".xls"):
@@ -27,8 +45,25 @@ class ExcelService:
                 detail="Unprocessable content",
             )
 
-        # Чтение Excel-файла с данными листа 'Персонажи'
-        excel_shop_df = read_excel(file_path, sheet_name="Персонажи")
+        # Чтение листа 'Персонажи' из скомпилированного снимка Excel-файла, не блокируя event loop
+        started_at = time.perf_counter()
+        try:
+            _, table = await workbook_snapshot.aload()
+        except TimeoutError:
+            raise ExcelParseTimeoutExcept
+        excel_shop_df = await run_in_threadpool(ExcelService._filter_tasks, table, columns_to_drop, max_day)
+        ExcelService._observe_parse("parse_table", started_at, excel_shop_df)
+        return excel_shop_df
+
+    @staticmethod
+    def _observe_parse(source: str, started_at: float, excel_shop_df: DataFrame):
+        EXCEL_PARSE_SECONDS.labels(source=source).observe(time.perf_counter() - started_at)
+        EXCEL_PARSE_ROWS.labels(source=source).observe(len(excel_shop_df))
+
+    @staticmethod
+    def _filter_tasks(table: pa.Table, columns_to_drop: list, max_day: int | None) -> DataFrame:
+        # Снимок общий для всех запросов (и воркеров), поэтому DataFrame строится заново и живёт только в этом запросе
+        excel_shop_df = table.to_pandas()
         if excel_shop_df.empty:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -62,35 +97,66 @@ class ExcelService:
         excel_shop_df = await ExcelService._parse_excel(columns_to_drop=["Ответ", "Аватарка"], max_day=day)
         return excel_shop_df
 
+    @staticmethod
+    async def load_catalogue() -> tuple[str, DataFrame]:
+        """
+        Возвращает версию Excel-файла и все задания без ответов, прочитанные из одного и того же снимка.
+        Файл сверяется с диском сразу, без ожидания INDEX_CHECK_INTERVAL, чтобы все воркеры
+        публиковали одну и ту же версию. Если файл разбирается дольше EXCEL_PARSE_TIMEOUT, отвечает 503.
+        """
+        started_at = time.perf_counter()
+        try:
+            version, table = await workbook_snapshot.aload(force_check=True)
+        except TimeoutError:
+            raise ExcelParseTimeoutExcept
+        excel_shop_df = await run_in_threadpool(
+            ExcelService._filter_tasks, table, columns_to_drop=["Ответ", "Аватарка"], max_day=None
+        )
+        ExcelService._observe_parse("catalogue", started_at, excel_shop_df)
+        return version, excel_shop_df
+
     @staticmethod
     async def check_answer(
             request: Request,
-            session: Session,
+            session: AsyncSession,
             data: CheckTaskAnswerInputSchema
     ) -> CheckTaskAnswerOutputSchema:
         """
-        Проверяет, совпадает ли ответ пользователя с правильным ответом из Excel-файла.
+        Проверяет, совпадает ли ответ пользователя с правильным ответом из индекса ответов,
+        построенного по Excel-файлу.
          - True, если ответ совпал;
          - False, если ответ не совпал;
-        Затем, если ответ правильный, то отправляет запрос с помощью aiohttp на ручку пополнения баланса.
+        Затем, если ответ правильный, пополняет баланс — не больше одного раза за задание (см. _credit_balance).
+        Повтор запроса с тем же заголовком Idempotency-Key возвращает сохранённый ответ без повторной проверки.
         """
         logger.info(f"Запущена проверка jwt-токена в get_all_tasks")
-        await verify_user_by_jwt(request=request, session=session)
+        user = await verify_user_by_jwt(request=request, session=session)
         logger.info(f"JWT-токен успешно проверен")
 
-        # TODO: закэшировать
-        try:
-            excel_shop_df = await ExcelService._parse_excel(columns_to_drop=["Аватарка"], max_day=None)
-
-            row = excel_shop_df[excel_shop_df["№"] == data.task_id]
-            if row.empty:
-                raise HTTPException(status_code=404, detail="Задание не найдено")
+        result = await ExcelService._run_with_idempotency_key(
+            request,
+            scope=f"autocheck:{user.username}",
+            payload=data,
+            operation=lambda: ExcelService._check_answer(request, data, user),
+        )
+        return CheckTaskAnswerOutputSchema(**result)
 
-            correct_answer = str(row.iloc[0]["Ответ"]).strip().lower()
-            result = correct_answer == data.user_answer.strip().lower()
+    @staticmethod
+    async def _check_answer(request: Request, data: CheckTaskAnswerInputSchema, user: AuthenticatedUser) -> dict:
+        try:
+            correct_answer = await cancel_on_disconnect(request, answer_index.get_answer(data.task_id))
+        except HTTPException:
+            raise
+        except TimeoutError:
+            raise ExcelParseTimeoutExcept
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"{str(e)}")
 
+        if correct_answer is None:
+            raise HTTPException(status_code=404, detail="Задание не найдено")
+
+        result = correct_answer == normalize_answer(data.user_answer)
+
         if result:
             # Если ответ правильный, формируем данные для обновления баланса.
             balance_data = UpdateUserBalanceData(
@@ -100,10 +166,155 @@ class ExcelService:
                 status="approved",
                 tg=True
             )
-            await AiohtppClientService.update_user_balance(balance_data, request)
+            await ExcelService._credit_balance(balance_data, request, user)
 
         return CheckTaskAnswerOutputSchema(
             task_id=data.task_id,
             is_correct=result
+        ).model_dump()
+
+    @staticmethod
+    async def _credit_balance(balance_data: UpdateUserBalanceData, request: Request, user: AuthenticatedUser):
+        """
+        Пополняет баланс за правильный ответ не больше одного раза на пару (пользователь, task_id):
+        повторный правильный ответ или повтор запроса клиентом получает сохранённый ответ сервиса авторизации
+        без исходящего запроса. Без Redis пополнять баланс нельзя — иначе возможно двойное начисление.
+        Выполненным начисление считается, только когда его подтвердил сервис авторизации. Отложенное в очередь
+        начисление и начисление с неизвестным исходом держат захват до отправки или ручной сверки
+        (см. AiohtppClientService.update_user_balance), а повторный ответ получает их статус.
+        """
+        # user_id приходит в теле запроса и не проверяется, поэтому ключ строится по пользователю из JWT:
+        # иначе, меняя user_id, один и тот же правильный ответ можно было бы засчитать несколько раз
+        key = f"{user.username}:{balance_data.task_id}"
+        try:
+            token, current = await balance_credits.claim(key)
+            if current is not None:
+                return await balance_credits.wait_for_result(key, current)
+            try:
+                return await AiohtppClientService.update_user_balance(balance_data, request, user.username, key, token)
+            except BaseException:
+                await balance_credits.abandon(key, token)
+                raise
+        except RedisError as e:
+            logger.error(f"Не удалось проверить повторное начисление за задание {balance_data.task_id}: {e}", exc_info=True)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Не удалось пополнить баланс, попробуйте позже",
+            )
+
+    @staticmethod
+    async def _run_with_idempotency_key(request: Request, scope: str, payload: BaseModel, operation):
+        """
+        Если клиент передал заголовок Idempotency-Key, выполняет операцию один раз на этот ключ
+        в рамках scope (пользователь и эндпоинт) и на повторы отдаёт сохранённый результат.
+        Вместе с результатом хранится хеш тела запроса: повтор ключа с другим телом получает 422.
+        """
+        idempotency_key = request.headers.get("idempotency-key")
+        if not idempotency_key:
+            return await operation()
+        if len(idempotency_key) > settings.idempotency.IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Слишком длинный Idempotency-Key")
+
+        try:
+            fingerprint = hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+            return await idempotent_responses.run_once(f"{scope}:{idempotency_key}", operation, fingerprint=fingerprint)
+        except RedisError as e:
+            logger.error(f"Idempotency-Key не проверен из-за ошибки Redis: {e}", exc_info=True)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Не удалось обработать запрос, попробуйте позже",
+            )
+
+    @staticmethod
+    async def check_answers_batch(
+            request: Request,
+            user: AuthenticatedUser,
+            data: CheckTaskAnswerBatchInputSchema
+    ) -> CheckTaskAnswerBatchOutputSchema:
+        """
+        Проверяет сразу несколько ответов пользователя, уже аутентифицированного один раз на весь пакет.
+        Все ответы сверяются с одной версией индекса ответов, а пополнения баланса за правильные ответы
+        отправляются параллельно (не больше AUTOCHECK_BATCH_CONCURRENCY одновременно) через общий пул соединений.
+
+        Ошибка в одном ответе не отменяет остальные: для каждого ответа возвращается свой статус.
+        Повторный ответ на то же задание в пакете не проверяется (409), а баланс за одно задание
+        пополняется не больше одного раза, как и в check_answer. Заголовок Idempotency-Key поддерживается для всего пакета.
+        """
+        logger.info(f"Пакетная проверка {len(data.answers)} ответов пользователя @{user.username}")
+        result = await ExcelService._run_with_idempotency_key(
+            request,
+            scope=f"autocheck-batch:{user.username}",
+            payload=data,
+            operation=lambda: ExcelService._check_answers_batch(request, data, user),
+        )
+        return CheckTaskAnswerBatchOutputSchema(**result)
+
+    @staticmethod
+    async def _check_answers_batch(
+            request: Request,
+            data: CheckTaskAnswerBatchInputSchema,
+            user: AuthenticatedUser) -> dict:
+        try:
+            correct_answers = await cancel_on_disconnect(
+                request, answer_index.get_answers([item.task_id for item in data.answers])
+            )
+        except HTTPException:
+            raise
+        except TimeoutError:
+            raise ExcelParseTimeoutExcept
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"{str(e)}")
+
+        results: list[CheckTaskAnswerBatchItemSchema] = []
+        balance_updates = {}  # Индекс результата -> данные для пополнения баланса
+        seen_task_ids = set()
+        for item in data.answers:
+            if item.task_id in seen_task_ids:
+                results.append(CheckTaskAnswerBatchItemSchema(
+                    task_id=item.task_id,
+                    status=status.HTTP_409_CONFLICT,
+                    detail="Ответ на это задание уже есть в пакете",
+                ))
+                continue
+            seen_task_ids.add(item.task_id)
+
+            correct_answer = correct_answers[item.task_id]
+            if correct_answer is None:
+                results.append(CheckTaskAnswerBatchItemSchema(
+                    task_id=item.task_id,
+                    status=status.HTTP_404_NOT_FOUND,
+                    detail="Задание не найдено",
+                ))
+                continue
+
+            is_correct = correct_answer == normalize_answer(item.user_answer)
+            if is_correct:
+                balance_updates[len(results)] = UpdateUserBalanceData(
+                    task_id=item.task_id,
+                    user_id=item.user_id,
+                    value=item.value,
+                    status="approved",
+                    tg=True
+                )
+            results.append(CheckTaskAnswerBatchItemSchema(task_id=item.task_id, status=status.HTTP_200_OK, is_correct=is_correct))
+
+        semaphore = asyncio.Semaphore(settings.autocheck.AUTOCHECK_BATCH_CONCURRENCY)
+
+        async def update_balance(balance_data: UpdateUserBalanceData):
+            async with semaphore:
+                await ExcelService._credit_balance(balance_data, request, user)
+
+        outcomes = await asyncio.gather(
+            *(update_balance(balance_data) for balance_data in balance_updates.values()),
+            return_exceptions=True,
         )
+        for index, outcome in zip(balance_updates, outcomes):
+            if isinstance(outcome, HTTPException):
+                results[index].status = outcome.status_code
+                results[index].detail = outcome.detail
+            elif isinstance(outcome, Exception):
+                logger.error(f"Не удалось пополнить баланс за задание {results[index].task_id}: {outcome}", exc_info=outcome)
+                results[index].status = status.HTTP_500_INTERNAL_SERVER_ERROR
+                results[index].detail = "Не удалось пополнить баланс"
 
+        return CheckTaskAnswerBatchOutputSchema(results=results).model_dump()
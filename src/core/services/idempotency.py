@@ -0,0 +1,215 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import HTTPException, status
+
+from src.core.redis_client import redis_client
+from src.core.utils.config import settings
+
+logger = logging.getLogger("idempotency_logger")
+
+PENDING_PREFIX = "pending:"
+HELD_PREFIX = "held:"
+FINGERPRINT_SEPARATOR = "|"
+
+# Захватывает операцию, если её ещё никто не выполнял; иначе возвращает текущее значение ключа
+CLAIM_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    return current
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return false
+"""
+
+# Проверка, что ключ всё ещё захвачен этим исполнителем: ARGV[1] - его захват,
+# ARGV[2] - начало отложенного захвата того же исполнителя (held:<id>|<fingerprint>|)
+OWNED = """
+local current = redis.call('GET', KEYS[1])
+local owned = current == ARGV[1] or (current and string.sub(current, 1, #ARGV[2]) == ARGV[2])
+"""
+
+# Записывает результат, только если операция всё ещё захвачена этим исполнителем.
+# ARGV[4] - TTL результата в секундах, 0 - хранить бессрочно
+COMPLETE_SCRIPT = OWNED + """
+if not owned then
+    return 0
+end
+if tonumber(ARGV[4]) > 0 then
+    redis.call('SET', KEYS[1], ARGV[3], 'EX', ARGV[4])
+else
+    redis.call('SET', KEYS[1], ARGV[3])
+end
+return 1
+"""
+
+# Откладывает завершение: захват остаётся за исполнителем, но вместо ожидания
+# повторные вызовы получают предварительный результат. ARGV[4] - TTL в миллисекундах, 0 - бессрочно
+HOLD_SCRIPT = OWNED + """
+if not owned then
+    return 0
+end
+if tonumber(ARGV[4]) > 0 then
+    redis.call('SET', KEYS[1], ARGV[3], 'PX', ARGV[4])
+else
+    redis.call('SET', KEYS[1], ARGV[3])
+end
+return 1
+"""
+
+# Снимает захват после ошибки, чтобы операцию можно было повторить
+ABANDON_SCRIPT = OWNED + """
+if owned then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class IdempotencyStore:
+    """
+    Выполняет операцию не больше одного раза на ключ и запоминает её результат в Redis.
+
+    Ключ сначала атомарно захватывается (на PENDING_TTL, если исполнитель упадёт), затем в него
+    записывается результат. Повторный вызов с тем же ключом получает сохранённый результат без выполнения
+    операции, а пока операция ещё выполняется — ждёт её результат. Если операция упала, захват снимается
+    и её можно повторить. Результат должен сериализоваться в JSON.
+
+    Если исход операции станет известен позже (например, она отложена в очередь), захват можно
+    отложить через hold: повторные вызовы получают предварительный результат, а завершает или снимает
+    захват тот, кто узнает исход, — по ключу и токену захвата (complete/abandon).
+
+    Результат хранится result_ttl секунд, а без result_ttl — бессрочно.
+    Если передан fingerprint (например, хеш тела запроса), он хранится вместе с захватом и результатом,
+    и вызов с тем же ключом, но другим fingerprint получает 422 вместо чужого результата.
+    """
+
+    def __init__(self, prefix: str, result_ttl: Optional[int] = None):
+        self.prefix = prefix
+        self.result_ttl = result_ttl
+        self._claim_script = redis_client.register_script(CLAIM_SCRIPT)
+        self._complete_script = redis_client.register_script(COMPLETE_SCRIPT)
+        self._hold_script = redis_client.register_script(HOLD_SCRIPT)
+        self._abandon_script = redis_client.register_script(ABANDON_SCRIPT)
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    async def run_once(
+            self,
+            key: str,
+            operation: Callable[[], Awaitable[Any]],
+            fingerprint: Optional[str] = None) -> Any:
+        token, current = await self.claim(key, fingerprint)
+        if current is not None:
+            return await self.wait_for_result(key, current, fingerprint)
+
+        try:
+            result = await operation()
+        except BaseException:
+            await self.abandon(key, token)
+            raise
+
+        await self.complete(key, token, result)
+        return result
+
+    async def claim(self, key: str, fingerprint: Optional[str] = None) -> tuple[str, Optional[str]]:
+        """
+        Захватывает ключ. Возвращает (токен захвата, None) или, если ключ уже занят, (токен, текущее значение) —
+        тогда результат нужно ждать через wait_for_result.
+        """
+        token = f"{PENDING_PREFIX}{uuid.uuid4().hex}{FINGERPRINT_SEPARATOR}{fingerprint or ''}"
+        current = await self._claim_script(
+            keys=[self._key(key)],
+            args=[token, settings.idempotency.IDEMPOTENCY_PENDING_TTL_MS],
+        )
+        return token, current
+
+    async def complete(self, key: str, token: str, result: Any) -> bool:
+        """Записывает результат операции, если ключ всё ещё захвачен токеном token (в том числе отложенно)"""
+        stored = json.dumps({"result": result, "fingerprint": self._fingerprint(token)}, ensure_ascii=False, default=str)
+        completed = await self._complete_script(
+            keys=[self._key(key)],
+            args=[token, self._held_prefix(token), stored, self.result_ttl or 0],
+        )
+        if not completed:
+            logger.warning(f"Захват {self._key(key)} истёк до завершения операции, результат не сохранён")
+        return bool(completed)
+
+    async def hold(self, key: str, token: str, result: Any, ttl: Optional[float] = None) -> bool:
+        """
+        Откладывает завершение захвата на ttl секунд (без ttl — бессрочно): повторные вызовы получают result,
+        а операция не выполняется снова, пока захват не завершат (complete) или не снимут (abandon).
+        """
+        held = self._held_prefix(token) + json.dumps({"result": result}, ensure_ascii=False, default=str)
+        return bool(await self._hold_script(
+            keys=[self._key(key)],
+            args=[token, self._held_prefix(token), held, int(ttl * 1000) if ttl else 0],
+        ))
+
+    async def abandon(self, key: str, token: str):
+        """Снимает захват, чтобы операцию можно было повторить"""
+        try:
+            await self._abandon_script(keys=[self._key(key)], args=[token, self._held_prefix(token)])
+        except Exception as e:
+            # Захват всё равно истечёт сам по PENDING_TTL
+            logger.warning(f"Не удалось снять захват {self._key(key)}: {e}")
+
+    async def wait_for_result(self, key: str, current: str, fingerprint: Optional[str] = None) -> Any:
+        redis_key = self._key(key)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.idempotency.IDEMPOTENCY_WAIT_TIMEOUT
+        while current is not None and current.startswith(PENDING_PREFIX):
+            self._check_fingerprint(self._fingerprint(current), fingerprint)
+            if loop.time() >= deadline:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Такой же запрос ещё обрабатывается, повторите позже",
+                )
+            await asyncio.sleep(settings.idempotency.IDEMPOTENCY_POLL_INTERVAL)
+            current = await redis_client.get(redis_key)
+
+        if current is None:
+            # Исполнитель упал, и захват снят — пусть клиент повторит запрос
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Такой же запрос завершился ошибкой, повторите его",
+            )
+        if current.startswith(HELD_PREFIX):
+            # held:<id>|<fingerprint>|<предварительный результат>
+            _, held_fingerprint, held = current[len(HELD_PREFIX):].split(FINGERPRINT_SEPARATOR, 2)
+            self._check_fingerprint(held_fingerprint or None, fingerprint)
+            return json.loads(held)["result"]
+        stored = json.loads(current)
+        self._check_fingerprint(stored.get("fingerprint"), fingerprint)
+        return stored["result"]
+
+    @staticmethod
+    def _fingerprint(token: str) -> Optional[str]:
+        return token.partition(FINGERPRINT_SEPARATOR)[2] or None
+
+    @staticmethod
+    def _held_prefix(token: str) -> str:
+        return f"{HELD_PREFIX}{token[len(PENDING_PREFIX):]}{FINGERPRINT_SEPARATOR}"
+
+    @staticmethod
+    def _check_fingerprint(stored: Optional[str], fingerprint: Optional[str]):
+        # Записи без fingerprint (сделанные до его появления) не сверяются
+        if stored is not None and fingerprint is not None and stored != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key уже использован для запроса с другим телом",
+            )
+
+
+# Пополнение баланса за правильный ответ: не больше одного раза на пару (username из JWT, task_id).
+# Хранится бессрочно — после истечения записи правильный ответ пополнил бы баланс снова
+balance_credits = IdempotencyStore(prefix="idempotency:balance")
+# Ответы на запросы с заголовком Idempotency-Key: ключ клиента в рамках пользователя и эндпоинта
+idempotent_responses = IdempotencyStore(
+    prefix="idempotency:response",
+    result_ttl=settings.idempotency.IDEMPOTENCY_RESULT_TTL,
+)
@@ -0,0 +1,42 @@
+import logging
+from typing import Optional
+
+from src.core.redis_client import redis_client
+
+logger = logging.getLogger("lease_logger")
+
+# Снимает блокировку, только если она всё ещё принадлежит владельцу токена
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisLease:
+    """
+    Аренда (lease lock) в Redis с ограниченным временем жизни: SET NX PX.
+    Каждому захвату выдаётся монотонно растущий fencing-токен, по которому хранилище
+    может отвергнуть запись от владельца, чья аренда уже истекла.
+    """
+
+    def __init__(self, name: str, ttl_ms: int):
+        self.ttl_ms = ttl_ms
+        self.lock_key = f"lease:{name}"
+        self.fence_key = f"lease:{name}:fence"
+        self._release_script = redis_client.register_script(RELEASE_SCRIPT)
+
+    async def acquire(self) -> Optional[int]:
+        """Возвращает fencing-токен, если аренда захвачена, иначе None"""
+        token = await redis_client.incr(self.fence_key)
+        if await redis_client.set(self.lock_key, token, nx=True, px=self.ttl_ms):
+            return token
+        return None
+
+    async def release(self, token: int):
+        try:
+            await self._release_script(keys=[self.lock_key], args=[token])
+        except Exception as e:
+            # Аренда всё равно истечёт сама по TTL
+            logger.warning(f"Не удалось освободить {self.lock_key}: {e}")
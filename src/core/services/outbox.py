@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from pydantic import ValidationError
+from redis.exceptions import ResponseError
+
+from src.core.database.db import async_session_maker
+from src.core.redis_client import redis_client, redis_blocking_client
+from src.core.repositories.progress import TaskProgressRepository
+from src.core.schemas.tasks import ModerationSubmission
+from src.core.services.rate_limit import RedisTokenBucket
+from src.core.services.telegram import TelegramMediaCache, TelegramService
+from src.core.utils.config import settings
+from src.core.utils.exceptions import TelegramDeliveryError
+from src.core.utils.images import recompress_image
+
+logger = logging.getLogger("outbox_logger")
+
+
+class ModerationOutbox:
+    """
+    Исходящая очередь заданий для модераторов на Redis Stream.
+    Задание считается принятым, как только оно записано в стрим; отправкой занимается ModerationDispatcher.
+    """
+
+    @staticmethod
+    async def enqueue(submission: ModerationSubmission) -> str:
+        entry_id = await redis_client.xadd(
+            settings.outbox.OUTBOX_STREAM,
+            {"payload": submission.model_dump_json()},
+        )
+        logger.info(f"Задание {submission.task_id} пользователя @{submission.username} поставлено в очередь: {entry_id}")
+        return entry_id
+
+
+class ModerationDispatcher:
+    """
+    Фоновая задача воркера, которая разбирает исходящую очередь через consumer group:
+    - одновременно отправляет не больше OUTBOX_CONCURRENCY заданий;
+    - перед каждой отправкой берёт токен из общего для всех воркеров лимита Telegram,
+      а при 429 приостанавливает этот лимит на retry_after;
+    - повторяет отправку с экспоненциальной задержкой, после OUTBOX_MAX_ATTEMPTS кладёт задание в dead-letter стрим;
+    - отмечает задание "в работе" у пользователя только после того, как Telegram подтвердил доставку,
+      а недоставленное задание освобождает, чтобы пользователь мог отправить его снова;
+    - перед первой отправкой уменьшает и пересжимает фото в пуле процессов, не занимая event loop;
+    - забирает задания, зависшие у упавших воркеров (XAUTOCLAIM).
+    """
+
+    def __init__(self):
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._bucket = RedisTokenBucket(
+            name="telegram",
+            rate=settings.bot.TELEGRAM_RATE_LIMIT,
+            capacity=settings.bot.TELEGRAM_RATE_BURST,
+        )
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: set[asyncio.Task] = set()
+        self._group_ready = False
+        self._image_pool: Optional[ProcessPoolExecutor] = None
+
+    async def start(self):
+        # spawn, а не fork: форк процесса с работающим event loop и потоками небезопасен
+        self._image_pool = ProcessPoolExecutor(
+            max_workers=settings.image.IMAGE_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self._task = asyncio.create_task(self._run(), name="moderation-dispatcher")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        if self._in_flight:
+            # Незавершённые задания останутся в pending и будут подобраны другим воркером
+            _, pending = await asyncio.wait(self._in_flight, timeout=settings.outbox.OUTBOX_SHUTDOWN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        if self._image_pool is not None:
+            self._image_pool.shutdown(wait=False, cancel_futures=True)
+            self._image_pool = None
+
+    async def _run(self):
+        next_claim_at = 0.0
+        while True:
+            try:
+                await self._ensure_group()
+
+                free_slots = settings.outbox.OUTBOX_CONCURRENCY - len(self._in_flight)
+                if free_slots <= 0:
+                    await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+
+                if time.monotonic() >= next_claim_at:
+                    free_slots -= await self._claim_stale(free_slots)
+                    next_claim_at = time.monotonic() + settings.outbox.OUTBOX_CLAIM_IDLE_MS / 1000 / 2
+                    if free_slots <= 0:
+                        continue
+
+                response = await redis_blocking_client.xreadgroup(
+                    groupname=settings.outbox.OUTBOX_GROUP,
+                    consumername=self.consumer,
+                    streams={settings.outbox.OUTBOX_STREAM: ">"},
+                    count=free_slots,
+                    block=settings.outbox.OUTBOX_READ_BLOCK_MS,
+                )
+                for _, entries in response or []:
+                    for entry_id, fields in entries:
+                        self._spawn(entry_id, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при чтении исходящей очереди: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def _ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            await redis_client.xgroup_create(
+                settings.outbox.OUTBOX_STREAM,
+                settings.outbox.OUTBOX_GROUP,
+                id="0",
+                mkstream=True,
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def _claim_stale(self, count: int) -> int:
+        response = await redis_client.xautoclaim(
+            settings.outbox.OUTBOX_STREAM,
+            settings.outbox.OUTBOX_GROUP,
+            self.consumer,
+            min_idle_time=settings.outbox.OUTBOX_CLAIM_IDLE_MS,
+            start_id="0-0",
+            count=count,
+        )
+        entries = response[1]
+        for entry_id, fields in entries:
+            logger.warning(f"Задание {entry_id} забрано у неотвечающего воркера")
+            self._spawn(entry_id, fields)
+        return len(entries)
+
+    def _spawn(self, entry_id: str, fields: dict):
+        task = asyncio.create_task(self._deliver(entry_id, fields))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _deliver(self, entry_id: str, fields: dict):
+        try:
+            submission = ModerationSubmission.model_validate_json(fields["payload"])
+        except (KeyError, ValidationError) as e:
+            # Запись, которую невозможно разобрать, не отправить и после повторов: сразу в dead letter,
+            # иначе её бы бесконечно забирали у «упавших» воркеров
+            try:
+                await self._dead_letter(entry_id, fields, f"Некорректная запись: {e}", 0)
+            except Exception as dead_letter_error:
+                logger.error(f"Не удалось убрать некорректное задание {entry_id} в dead letter: {dead_letter_error}", exc_info=True)
+            return
+        await self._prepare_photo(submission)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                await self._touch(entry_id)
+                await self._bucket.acquire()
+                await TelegramService.send_submission(submission)
+                break
+            except TelegramDeliveryError as e:
+                if e.retry_after:
+                    await self._bucket.pause(e.retry_after)
+                if not e.retryable or attempt >= settings.outbox.OUTBOX_MAX_ATTEMPTS:
+                    await self._dead_letter(entry_id, fields, str(e), attempt, submission)
+                    return
+                delay = e.retry_after or self._backoff(attempt)
+            except FileNotFoundError as e:
+                await self._dead_letter(entry_id, fields, str(e), attempt, submission)
+                return
+            except Exception as e:
+                if attempt >= settings.outbox.OUTBOX_MAX_ATTEMPTS:
+                    await self._dead_letter(entry_id, fields, str(e), attempt, submission)
+                    return
+                delay = self._backoff(attempt)
+
+            logger.warning(f"Задание {entry_id}: попытка {attempt} не удалась, повтор через {delay:.1f} с")
+            await asyncio.sleep(delay)
+
+        await self._mark_in_progress(submission)
+        try:
+            await self._ack(entry_id)
+        except Exception as e:
+            logger.error(f"Не удалось подтвердить задание {entry_id} в очереди: {e}", exc_info=True)
+            return
+        self._remove_file(submission)
+        logger.info(f"Задание {entry_id} доставлено модераторам с попытки {attempt}")
+
+    async def _prepare_photo(self, submission: ModerationSubmission):
+        """
+        Уменьшает и пересжимает фото перед отправкой. Файл подменяется на месте, поэтому повторные попытки
+        и другие воркеры отправляют уже обработанный файл. При любой ошибке фото отправляется как есть.
+        """
+        if submission.file_type != "photo" or not submission.file_path or self._image_pool is None:
+            return
+        if await TelegramMediaCache.get(submission.file_type, submission.file_sha256):
+            return  # Такое фото уже загружено в Telegram и уйдёт по file_id, пересжимать его незачем
+
+        loop = asyncio.get_running_loop()
+        try:
+            content_type = await asyncio.wait_for(
+                loop.run_in_executor(
+                    self._image_pool,
+                    recompress_image,
+                    submission.file_path,
+                    settings.image.IMAGE_MAX_DIMENSION,
+                    settings.image.IMAGE_QUALITY,
+                    settings.image.IMAGE_PASSTHROUGH_BYTES,
+                ),
+                timeout=settings.image.IMAGE_PROCESS_TIMEOUT,
+            )
+        except FileNotFoundError:
+            return  # Отправка сама отправит задание в dead letter
+        except Exception as e:
+            logger.warning(f"Не удалось пересжать фото {submission.file_path}, отправляем как есть: {e}")
+            return
+
+        if content_type is not None:
+            submission.content_type = content_type
+            submission.file_name = f"{Path(submission.file_name or 'photo').stem}.jpg"
+            logger.info(f"Фото {submission.file_path} пересжато до {os.path.getsize(submission.file_path)} байт")
+
+    async def _touch(self, entry_id: str):
+        """Сбрасывает время простоя записи, чтобы её не забрал другой воркер, пока мы ещё пытаемся отправить"""
+        await redis_client.xclaim(
+            settings.outbox.OUTBOX_STREAM,
+            settings.outbox.OUTBOX_GROUP,
+            self.consumer,
+            min_idle_time=0,
+            message_ids=[entry_id],
+            justid=True,
+        )
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        delay = min(settings.outbox.OUTBOX_BACKOFF_MAX, settings.outbox.OUTBOX_BACKOFF_BASE * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    @staticmethod
+    async def _mark_in_progress(submission: ModerationSubmission):
+        try:
+            async with async_session_maker() as session:
+                await TaskProgressRepository.mark_in_progress(
+                    session=session,
+                    username=submission.username,
+                    task_id=submission.task_id,
+                )
+        except Exception as e:
+            # Сообщение уже у модераторов, повторная отправка продублирует его, поэтому только логируем
+            logger.error(f"Не удалось отметить задание {submission.task_id} как взятое в работу: {e}", exc_info=True)
+
+    @staticmethod
+    async def _ack(entry_id: str):
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.xack(settings.outbox.OUTBOX_STREAM, settings.outbox.OUTBOX_GROUP, entry_id)
+            pipe.xdel(settings.outbox.OUTBOX_STREAM, entry_id)
+            await pipe.execute()
+
+    async def _dead_letter(
+            self,
+            entry_id: str,
+            fields: dict,
+            error: str,
+            attempts: int,
+            submission: Optional[ModerationSubmission] = None):
+        """Переносит запись как есть в dead letter; задание освобождается, только если запись удалось разобрать"""
+        logger.error(f"Задание {entry_id} не доставлено после {attempts} попыток: {error}")
+        await redis_client.xadd(
+            settings.outbox.OUTBOX_DEAD_LETTER_STREAM,
+            {**fields, "error": error, "attempts": attempts},
+        )
+        await self._ack(entry_id)
+        if submission is not None:
+            await self._release(submission)
+
+    @staticmethod
+    async def _release(submission: ModerationSubmission):
+        """Освобождает недоставленное задание, чтобы пользователь мог отправить его снова"""
+        try:
+            async with async_session_maker() as session:
+                await TaskProgressRepository.release_task(
+                    session=session,
+                    username=submission.username,
+                    task_id=submission.task_id,
+                )
+        except Exception as e:
+            logger.error(f"Не удалось освободить недоставленное задание {submission.task_id}: {e}", exc_info=True)
+
+    @staticmethod
+    def _remove_file(submission: ModerationSubmission):
+        if submission.file_path:
+            try:
+                os.remove(submission.file_path)
+            except FileNotFoundError:
+                pass
+
+
+moderation_dispatcher = ModerationDispatcher()
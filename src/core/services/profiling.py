@@ -0,0 +1,145 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Optional
+
+from src.core.utils.config import settings
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # pyinstrument не обязателен, без него сохраняется только профиль памяти
+    Profiler = None
+
+logger = logging.getLogger("profiling_logger")
+
+PROFILE_HEADER = "x-profile"  # Значение: "<unix-время истечения>:<hex HMAC-SHA256>"
+PROFILE_MEMORY_HEADER = "x-profile-memory"  # "1" - дополнительно снять разницу tracemalloc
+
+
+def sign_profile_request(secret: str, path: str, expires: int) -> str:
+    """Подпись для заголовка X-Profile: разрешает профилировать запросы к path до момента expires"""
+    digest = hmac.new(secret.encode(), f"{expires}:{path}".encode(), hashlib.sha256).hexdigest()
+    return f"{expires}:{digest}"
+
+
+def verify_profile_signature(path: str, header: Optional[str]) -> bool:
+    """Проверяет заголовок X-Profile, подписанный администратором ключом PROFILING_SECRET"""
+    secret = settings.profiling.PROFILING_SECRET
+    if not secret or not header:
+        return False
+
+    expires, _, _ = header.partition(":")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(header, sign_profile_request(secret, path, int(expires)))
+
+
+class RequestProfile:
+    """
+    Профиль одного запроса: статистический профиль CPU (pyinstrument, с учётом async-контекста)
+    и, если запрошено, прирост памяти по строкам кода (tracemalloc).
+
+    tracemalloc общий на процесс, поэтому в разницу попадают и параллельные запросы этого воркера.
+    """
+
+    def __init__(self, trace_memory: bool):
+        self.trace_memory = trace_memory
+        self._profiler = Profiler(interval=settings.profiling.PROFILING_INTERVAL, async_mode="enabled") if Profiler else None
+        self._memory_before: Optional[tracemalloc.Snapshot] = None
+        self._started_tracing = False
+        self._started_at = 0.0
+        self.duration = 0.0
+
+    def start(self):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._memory_before = tracemalloc.take_snapshot()
+        if self._profiler is not None:
+            self._profiler.start()
+        self._started_at = time.perf_counter()
+
+    def stop(self) -> dict:
+        self.duration = time.perf_counter() - self._started_at
+        result = {"cpu_profile": None, "memory_top": None}
+        if self._profiler is not None:
+            self._profiler.stop()
+            result["cpu_profile"] = self._profiler.output_text(unicode=True, color=False)
+
+        if self._memory_before is not None:
+            stats = tracemalloc.take_snapshot().compare_to(self._memory_before, "lineno")
+            result["memory_top"] = [str(stat) for stat in stats[:settings.profiling.PROFILING_TRACEMALLOC_TOP]]
+            if self._started_tracing:
+                tracemalloc.stop()
+        return result
+
+
+class ProfileStore:
+    """
+    Кольцо профилей на диске: не больше max_files последних файлов, старые удаляются.
+    Длительность и время запроса зашиты в имя файла, чтобы сводку можно было собрать, не читая все профили.
+    Каталог может быть общим для всех воркеров.
+    """
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = Path(directory)
+        self.max_files = max_files
+
+    def save(self, capture: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"{int(capture['started_at'] * 1000)}_{int(capture['duration'] * 1000)}_{os.getpid()}.json"
+        tmp_path = self.directory / f"{name}.tmp"
+        tmp_path.write_text(json.dumps(capture, ensure_ascii=False))
+        os.replace(tmp_path, self.directory / name)
+        self._trim()
+
+    def _files(self) -> list[Path]:
+        return sorted(self.directory.glob("*.json"))  # Имя начинается со времени, поэтому сортировка — хронологическая
+
+    def _trim(self):
+        files = self._files()
+        for path in files[:max(0, len(files) - self.max_files)]:
+            path.unlink(missing_ok=True)
+
+    def slowest(self, limit: int) -> list[dict]:
+        """Самые медленные из сохранённых профилей, без самих профилей"""
+        if not self.directory.exists():
+            return []
+
+        def duration_ms(path: Path) -> int:
+            return int(path.stem.split("_")[1])
+
+        summary = []
+        for path in sorted(self._files(), key=duration_ms, reverse=True)[:limit]:
+            try:
+                capture = json.loads(path.read_text())
+            except (FileNotFoundError, ValueError):
+                continue  # Файл успели вытеснить или ещё дописывают
+            summary.append({
+                "file": path.name,
+                "method": capture["method"],
+                "path": capture["path"],
+                "status": capture["status"],
+                "duration_ms": duration_ms(path),
+                "started_at": capture["started_at"],
+                "trigger": capture["trigger"],
+            })
+        return summary
+
+    def load(self, name: str) -> Optional[dict]:
+        path = self.directory / Path(name).name
+        if path.suffix != ".json" or not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+
+profile_store = ProfileStore(
+    directory=settings.profiling.PROFILING_DIR,
+    max_files=settings.profiling.PROFILING_MAX_FILES,
+)
@@ -0,0 +1,64 @@
+import asyncio
+import logging
+
+from src.core.redis_client import redis_client
+
+logger = logging.getLogger("rate_limit_logger")
+
+# KEYS[1] - состояние корзины, KEYS[2] - ключ принудительной паузы (например, после 429 от Telegram)
+# ARGV[1] - скорость пополнения (токенов в секунду), ARGV[2] - ёмкость корзины
+# Возвращает 0, если токен выдан, иначе сколько миллисекунд подождать перед следующей попыткой
+TOKEN_BUCKET_SCRIPT = """
+local paused = redis.call('PTTL', KEYS[2])
+if paused > 0 then
+    return paused
+end
+
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate / 1000)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * 1000 / rate) + 1000)
+return wait
+"""
+
+
+class RedisTokenBucket:
+    """
+    Token bucket, общий для всех воркеров и узлов: состояние хранится в Redis
+    и обновляется атомарно Lua-скриптом.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._state_key = f"ratelimit:{name}:bucket"
+        self._pause_key = f"ratelimit:{name}:paused"
+        self._script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def acquire(self):
+        """Ждёт, пока не будет выдан токен"""
+        while True:
+            wait_ms = await self._script(keys=[self._state_key, self._pause_key], args=[self.rate, self.capacity])
+            if wait_ms <= 0:
+                return
+            await asyncio.sleep(wait_ms / 1000)
+
+    async def pause(self, seconds: float):
+        """Запрещает выдачу токенов всем потребителям на заданное время"""
+        logger.warning(f"Лимит {self._state_key} приостановлен на {seconds} с")
+        await redis_client.set(self._pause_key, 1, px=max(int(seconds * 1000), 1))
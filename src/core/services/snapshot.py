@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import pyarrow as pa
+from pandas import DataFrame, isna
+from pandas.api.types import infer_dtype
+from pyarrow import feather
+
+from src.core.utils.config import settings
+from src.core.utils.single_flight import SingleFlight
+from src.core.utils.workbook import compute_file_hash, get_file_signature, read_workbook_sheet
+
+logger = logging.getLogger("snapshot_logger")
+
+SNAPSHOT_FORMAT_VERSION = b"1"  # Меняется при несовместимом изменении формата снимка
+SOURCE_HASH_KEY = b"source_sha256"
+FORMAT_VERSION_KEY = b"snapshot_format_version"
+
+
+def _prepare_for_arrow(df: DataFrame) -> DataFrame:
+    """
+    Arrow требует один тип на колонку, а в Excel в одной колонке бывают и числа, и строки.
+    Такие колонки приводятся к строкам, пустые ячейки остаются пустыми.
+    """
+    df = df.copy()
+    df.columns = [str(column) for column in df.columns]
+    for column in df.columns[df.dtypes == object]:
+        if infer_dtype(df[column], skipna=True) not in ("string", "empty"):
+            df[column] = df[column].map(lambda value: value if isna(value) else str(value))
+    return df
+
+
+def _compile_in_process(source_path: str, sheet_name: str, snapshot_path: str) -> str:
+    """Точка входа процесса из пула: собирает снимок и возвращает только версию, DataFrame между процессами не передаётся"""
+    return WorkbookSnapshot(source_path, sheet_name, snapshot_path, check_interval=0).compile()
+
+
+class WorkbookSnapshot:
+    """
+    Скомпилированный снимок листа Excel в формате Arrow IPC (Feather v2, без сжатия),
+    который читается через memory map. В метаданных снимка лежит sha256 исходного xlsx,
+    поэтому медленный разбор xlsx выполняется, только когда файл действительно изменился.
+
+    Загруженная таблица Arrow держится до смены версии. Её буферы — отображённые в память страницы файла снимка,
+    а не объекты в куче Python, поэтому таблица, загруженная в мастере gunicorn, после fork остаётся общей
+    для всех воркеров. DataFrame из неё строится только на время обработки и нигде не хранится.
+    """
+
+    def __init__(
+        self,
+        source_path: str,
+        sheet_name: str,
+        snapshot_path: str,
+        check_interval: float,
+        parse_timeout: Optional[float] = None,
+        parse_concurrency: int = 1,
+    ):
+        self.source_path = source_path
+        self.sheet_name = sheet_name
+        self.snapshot_path = snapshot_path
+        self.check_interval = check_interval
+        self.parse_timeout = parse_timeout
+        self.parse_concurrency = parse_concurrency
+
+        # Пул процессов создаётся при первом разборе xlsx, то есть уже в воркере, а не в мастере gunicorn
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._compiling = False
+        self._parse_slots = asyncio.Semaphore(parse_concurrency)
+        self._flight = SingleFlight()
+
+        self._table: Optional[pa.Table] = None
+        self._version: Optional[str] = None
+        self._signature: Optional[tuple[int, int]] = None
+        self._checked_at: float = 0.0
+        self._source_hash: Optional[tuple[tuple[int, int], str]] = None  # (подпись xlsx, его sha256)
+
+    @property
+    def version(self) -> Optional[str]:
+        """sha256 исходного xlsx, из которого собран загруженный снимок"""
+        return self._version
+
+    async def source_version(self) -> Optional[str]:
+        """
+        Возвращает sha256 xlsx на диске, не разбирая его (и не трогая загруженный снимок);
+        без xlsx — версию снимка на диске. Хеш пересчитывается, только если изменилась подпись файла.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            signature = await loop.run_in_executor(None, get_file_signature, self.source_path)
+        except FileNotFoundError:
+            return await loop.run_in_executor(None, self.read_snapshot_version)
+
+        if self._source_hash is None or self._source_hash[0] != signature:
+            self._source_hash = (signature, await loop.run_in_executor(None, compute_file_hash, self.source_path))
+        return self._source_hash[1]
+
+    def read_snapshot_version(self) -> Optional[str]:
+        """Возвращает sha256 исходника из метаданных снимка на диске, не читая сами данные"""
+        try:
+            with pa.memory_map(self.snapshot_path) as source:
+                schema = pa.ipc.open_file(source).schema
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+        metadata = schema.metadata or {}
+        if metadata.get(FORMAT_VERSION_KEY) != SNAPSHOT_FORMAT_VERSION:
+            return None
+        source_hash = metadata.get(SOURCE_HASH_KEY)
+        return source_hash.decode() if source_hash else None
+
+    def compile(self, force: bool = False) -> str:
+        """
+        Собирает снимок из xlsx, если его нет или он собран из другой версии файла.
+        Запись атомарная: снимок пишется во временный файл и подменяется через os.replace.
+        """
+        source_hash = compute_file_hash(self.source_path)
+        if not force and self.read_snapshot_version() == source_hash:
+            return source_hash
+
+        started_at = time.perf_counter()
+        df = _prepare_for_arrow(read_workbook_sheet(self.source_path, self.sheet_name))
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            SOURCE_HASH_KEY: source_hash.encode(),
+            FORMAT_VERSION_KEY: SNAPSHOT_FORMAT_VERSION,
+        })
+
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, self.snapshot_path)
+
+        logger.info(
+            f"Снимок {self.snapshot_path} собран из {self.source_path} (sha256={source_hash}, "
+            f"строк: {table.num_rows}) за {time.perf_counter() - started_at:.2f} с"
+        )
+        return source_hash
+
+    def load(self, force_check: bool = False) -> tuple[str, pa.Table]:
+        """
+        Возвращает (версия, таблица Arrow) актуального снимка.
+        Не чаще, чем раз в check_interval секунд (или сразу, если force_check), сверяет подпись xlsx
+        (mtime, размер) и пересобирает снимок, только если поменялось содержимое.
+        """
+        if self._is_fresh(force_check):
+            return self._version, self._table
+
+        try:
+            signature = get_file_signature(self.source_path)
+        except FileNotFoundError:
+            # Исходника нет (например, в образе оставили только снимок) — работаем с тем, что есть
+            signature = None
+
+        if self._table is None or signature != self._signature:
+            version = self.compile() if signature is not None else self.read_snapshot_version()
+            if version is None:
+                raise FileNotFoundError(f"Нет ни {self.source_path}, ни его снимка {self.snapshot_path}")
+            if version != self._version:
+                self._table = self._read_table()
+                self._version = version
+            self._signature = signature
+
+        self._checked_at = time.monotonic()
+        return self._version, self._table
+
+    async def aload(self, force_check: bool = False) -> tuple[str, pa.Table]:
+        """
+        То же, что load, но не блокирует event loop: подпись файла и чтение снимка выполняются в потоке,
+        а разбор xlsx — в отдельном процессе (не больше parse_concurrency одновременно).
+        Одновременные вызовы склеиваются в одну загрузку. Если она не уложилась в parse_timeout,
+        выбрасывается TimeoutError, а зависший разбор xlsx прерывается вместе с пулом процессов:
+        процесс пишет снимок во временный файл, поэтому убить его безопасно, а следующий вызов начнёт заново.
+        """
+        if self._is_fresh(force_check):
+            return self._version, self._table
+        try:
+            return await asyncio.wait_for(self._flight.do("load", self._load_off_loop), timeout=self.parse_timeout)
+        except TimeoutError:
+            if self._compiling:
+                logger.warning(f"Разбор {self.source_path} не уложился в {self.parse_timeout} с, процессы разбора остановлены")
+                self._kill_pool()
+            raise
+
+    async def _load_off_loop(self) -> tuple[str, pa.Table]:
+        loop = asyncio.get_running_loop()
+        try:
+            signature = await loop.run_in_executor(None, get_file_signature, self.source_path)
+        except FileNotFoundError:
+            signature = None
+
+        if self._table is None or signature != self._signature:
+            if signature is not None:
+                version = await self._compile_in_pool()
+            else:
+                version = await loop.run_in_executor(None, self.read_snapshot_version)
+            if version is None:
+                raise FileNotFoundError(f"Нет ни {self.source_path}, ни его снимка {self.snapshot_path}")
+            if version != self._version:
+                self._table = await loop.run_in_executor(None, self._read_table)
+                self._version = version
+            self._signature = signature
+
+        self._checked_at = time.monotonic()
+        return self._version, self._table
+
+    async def _compile_in_pool(self) -> str:
+        loop = asyncio.get_running_loop()
+        async with self._parse_slots:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.parse_concurrency,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            pool = self._pool
+            self._compiling = True
+            try:
+                return await loop.run_in_executor(
+                    pool, _compile_in_process, self.source_path, self.sheet_name, self.snapshot_path
+                )
+            except BrokenProcessPool:
+                # Процесс разбора упал (например, его убил OOM killer или _kill_pool) — следующий вызов создаст пул заново
+                if self._pool is pool:
+                    self._pool = None
+                raise
+            finally:
+                self._compiling = False
+
+    def close(self):
+        """Останавливает пул процессов разбора xlsx"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _kill_pool(self):
+        """Останавливает пул и убивает его процессы вместе с недописанными временными файлами снимка"""
+        pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        # До Python 3.14 у ProcessPoolExecutor нет публичного способа завершить процессы
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+            try:
+                os.remove(f"{self.snapshot_path}.{process.pid}.tmp")
+            except OSError:
+                pass
+
+    def _is_fresh(self, force_check: bool) -> bool:
+        return (
+            self._table is not None
+            and not force_check
+            and time.monotonic() - self._checked_at < self.check_interval
+        )
+
+    def _read_table(self) -> pa.Table:
+        return feather.read_table(self.snapshot_path, memory_map=True)
+
+    def read_dataframe(self) -> DataFrame:
+        return self.load()[1].to_pandas()
+
+
+workbook_snapshot = WorkbookSnapshot(
+    source_path=settings.excel.FILE_PATH,
+    sheet_name=settings.excel.SHEET_NAME,
+    snapshot_path=settings.excel.SNAPSHOT_PATH,
+    check_interval=settings.excel.INDEX_CHECK_INTERVAL,
+    parse_timeout=settings.excel.PARSE_TIMEOUT,
+    parse_concurrency=settings.excel.PARSE_CONCURRENCY,
+)
@@ -1,80 +1,241 @@
-import json
+import asyncio
 import logging
+import os
 from typing import Optional
 
-from aiohttp import FormData, ClientSession
-from fastapi import status, Request, UploadFile, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import status, Request, Response, UploadFile, HTTPException
+from pandas import DataFrame, to_numeric
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
-from src.core.jwt.tokens import verify_jwt_token
-from src.core.repositories.users import UserRepository
-from src.core.utils.config import settings
-from src.core.schemas.tasks import ParseTasksResponse
+from src.core.metrics import CACHE_DAY_LOOKUPS, CACHE_LOOKUPS
+from src.core.repositories.progress import TaskProgressRepository
+from src.core.schemas.tasks import ModerationSubmission
 from src.core.services.excel import ExcelService
 from src.core.services.cache import CacheService
+from src.core.services.lease import RedisLease
+from src.core.services.outbox import ModerationOutbox
+from src.core.services.snapshot import workbook_snapshot
 from src.core.utils.auth import verify_user_by_jwt
+from src.core.utils.config import settings
+from src.core.utils.disconnect import cancel_on_disconnect
+from src.core.utils.http_cache import build_cached_response, build_variants, choose_encoding, compute_etag
+from src.core.utils.json_render import render_tasks_response
+from src.core.utils.media import detect_media_type, MAGIC_BYTES_LENGTH
+from src.core.utils.single_flight import SingleFlight
+from src.core.utils.uploaded_file import upload_file
 
 logger = logging.getLogger("tasks_logger")
 
+# Пересборка каталога: внутри воркера склеиваются одновременные промахи, между воркерами — аренда в Redis
+_rebuild_flight = SingleFlight()
+_rebuild_lease = RedisLease(name="tasks:rebuild", ttl_ms=settings.redis.REBUILD_LOCK_TTL_MS)
+
 
 class TaskService:
     @staticmethod
     async def get_all_tasks(
             request: Request,
-            session: Session,
-            day: int | None = None) -> ParseTasksResponse:
+            session: AsyncSession,
+            day: int | None = None) -> Response:
+        """
+        Возвращает задания готовым телом ответа в формате ParseTasksResponse.
+        Тело собирается из сериализованных данных дней без разбора JSON и кешируется целиком
+        вместе с ETag и сжатыми вариантами, поэтому при попадании в кеш ответ отдаётся как есть,
+        а если у клиента уже есть эта версия — отдаётся 304.
+        """
         logger.info(f"Запущен метод get_all_tasks(), day={day}")
 
         logger.info(f"Запущена проверка jwt-токена в get_all_tasks")
         await verify_user_by_jwt(request=request, session=session)
         logger.info(f"JWT-токен успешно проверен")
 
-        # Пытаемся получить данные из кеша
-        cached_data = CacheService.get_accumulated_data(day)
-
-        if cached_data is not None:
-            logger.info(f"Данные {'за все дни' if day is None else f'за дни 1-{day}'} получены из кеша.")
-            return ParseTasksResponse(
-                status=status.HTTP_200_OK,
-                details=f"Данные {'за все дни' if day is None else f'за дни 1-{day}'} получены из кеша.",
-                data=cached_data,
+        scope = CacheService.response_scope(day)
+        period = 'за все дни' if day is None else f'за дни 1-{day}'
+
+        # Пытаемся получить готовый ответ из кеша
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+        cached_response = await CacheService.get_response(scope, encoding)
+        if cached_response is not None:
+            logger.info(f"Ответ {period} получен из кеша.")
+            etag, encoding, body = cached_response
+            return build_cached_response(request, etag, body, encoding)
+
+        # Пытаемся собрать ответ из закешированных дней актуальной версии
+        version, days, cached_days = await CacheService.get_accumulated_data(day)
+        missing_days = [day_num for day_num, data in cached_days.items() if data is None]
+        for day_num in days:
+            CACHE_DAY_LOOKUPS.labels(day=day_num, result="miss" if day_num in missing_days else "hit").inc()
+        if version is None:
+            CACHE_LOOKUPS.labels(layer="catalogue", result="miss").inc()
+        elif missing_days:
+            CACHE_LOOKUPS.labels(layer="catalogue", result="partial_miss").inc()
+        else:
+            CACHE_LOOKUPS.labels(layer="catalogue", result="hit").inc()
+
+        # Пересборка общая для всех ждущих запросов, поэтому ушедший клиент перестаёт ждать, но её не прерывает
+        if version is None:
+            # Каталога ещё нет — собираем и публикуем его целиком (один раз на все одновременные запросы)
+            logger.info("В кеше нет каталога актуальной версии, пересобираем его")
+            version, catalogue = await cancel_on_disconnect(
+                request, _rebuild_flight.do(("catalogue", None), TaskService._rebuild_catalogue)
             )
+            days, cached_days = TaskService._select_days(catalogue, day)
+        elif missing_days:
+            # Из кеша актуальной версии пропали отдельные дни — допарсиваем только их
+            logger.info(f"В кеше версии {version} нет дней {missing_days}, пересобираем только их")
+            repaired_version, repaired_days = await cancel_on_disconnect(
+                request,
+                _rebuild_flight.do(
+                    (version, tuple(missing_days)),
+                    lambda: TaskService._repair_days(version, missing_days),
+                ),
+            )
+            if repaired_version == version:
+                cached_days.update(repaired_days)
+            else:
+                # Пока допарсивали, файл изменился, и вышел каталог новой версии — отдаём его целиком
+                version = repaired_version
+                days, cached_days = TaskService._select_days(repaired_days, day)
+        days_data = [cached_days[day_num] for day_num in days]
 
-        # Если в кеше нет данных, парсим Excel
-        logger.info(f"Парсинг Excel-файла через ExcelService.parse_table(day={day})")
-        excel_shop_df = await ExcelService.parse_table(request, day)
-
-        # Преобразуем в JSON
-        json_data = excel_shop_df.to_json(orient="records")
-        formatted_json_data = json.loads(json_data)
-
-        if not formatted_json_data:
+        if all(data.strip() == b"[]" for data in days_data):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Ошибка при форматировании данных из таблицы",
             )
 
-        # Разделяем данные по дням и кешируем каждый день отдельно
-        if 'Номер дня' in excel_shop_df.columns:
-            for day_num in range(1, 4): # От 1 до 3 дней
-                day_data = excel_shop_df[excel_shop_df['Номер дня'] == day_num]
-                day_json = day_data.to_json(orient="records")
-                CacheService.cache_day_data(day_num, json.loads(day_json))
-
-
-        response = ParseTasksResponse(
+        body = render_tasks_response(
             status=status.HTTP_200_OK,
-            details="Данные успешно получены из Excel файла.",
-            data=formatted_json_data,
+            details=f"Данные {period} успешно получены.",
+            data_arrays=days_data,
         )
+        etag = compute_etag(body)
+        variants = await run_in_threadpool(build_variants, body)
+        await CacheService.cache_response(scope, etag, variants, version=version)
 
         logger.info("Метод get_all_tasks() завершён. Данные возвращены клиенту.")
-        return response
+        return build_cached_response(request, etag, variants[encoding], encoding)
+
+    @staticmethod
+    async def refresh_catalogue() -> str:
+        """
+        Сверяет Excel-файл на диске с актуальной версией каталога в Redis и, если файл изменился,
+        публикует каталог новой версии. Возвращает версию файла.
+        Сверяется только хеш файла: разбирает xlsx лишь воркер, захвативший аренду на пересборку.
+        """
+        version = await workbook_snapshot.source_version()
+        if version is None:
+            raise FileNotFoundError(f"Нет ни {workbook_snapshot.source_path}, ни его снимка {workbook_snapshot.snapshot_path}")
+        if version != await CacheService.get_current_version():
+            logger.info(f"Обнаружена новая версия Excel-файла (sha256={version}), публикуем каталог")
+            version, _ = await _rebuild_flight.do(
+                ("catalogue", version), lambda: TaskService._rebuild_catalogue(target_version=version)
+            )
+        return version
+
+    @staticmethod
+    async def _rebuild_catalogue(target_version: Optional[str] = None) -> tuple[str, dict[int, bytes]]:
+        """
+        Собирает каталог заданий текущей версии Excel-файла и публикует его так, чтобы Excel
+        разбирал только один воркер:
+        - кто захватил аренду в Redis, собирает каталог и переключает на него версию со своим fencing-токеном;
+        - остальные ждут, пока в кеше появится полный каталог версии target_version (без неё — любой версии),
+          и снова пробуют захватить аренду: если её освободили, не опубликовав нужную версию, каталог
+          собирает и публикует следующий воркер. По таймауту каталог собирается без записи в кеш.
+        Возвращает (версия, данные всех дней).
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.redis.REBUILD_WAIT_TIMEOUT
+        waiting = False
+        while True:
+            try:
+                fence_token = await _rebuild_lease.acquire()
+            except Exception as e:
+                logger.error(f"Не удалось захватить аренду на пересборку кеша: {e}", exc_info=True)
+                return await TaskService._build_catalogue()
+
+            if fence_token is not None:
+                try:
+                    version, catalogue = await TaskService._build_catalogue()
+                    await CacheService.publish_version(version, catalogue, fence_token=fence_token)
+                    return version, catalogue
+                finally:
+                    await _rebuild_lease.release(fence_token)
+
+            if not waiting:
+                logger.info("Кеш пересобирает другой воркер, ожидаем результат")
+                waiting = True
+            if loop.time() >= deadline:
+                break
+            await asyncio.sleep(settings.redis.REBUILD_POLL_INTERVAL)
+            version, _, catalogue = await CacheService.get_accumulated_data()
+            if (
+                version is not None
+                and (target_version is None or version == target_version)
+                and all(data is not None for data in catalogue.values())
+            ):
+                return version, catalogue
+
+        logger.warning("Не дождались пересборки кеша другим воркером, собираем каталог сами")
+        return await TaskService._build_catalogue()
+
+    @staticmethod
+    async def _repair_days(version: str, days: list[int]) -> tuple[str, dict[int, bytes]]:
+        """
+        Допарсивает дни, которых не хватает в кеше версии version, и дописывает их в эту версию.
+        Снимок Excel обычно уже собран, поэтому аренда не нужна: xlsx при этом не разбирается.
+        Если файл уже другой версии, вместо этого публикует каталог новой версии целиком.
+        Возвращает (версия, данные дней).
+        """
+        loaded_version, excel_shop_df = await ExcelService.load_catalogue()
+        if loaded_version != version:
+            return await _rebuild_flight.do(
+                ("catalogue", loaded_version), lambda: TaskService._rebuild_catalogue(target_version=loaded_version)
+            )
+
+        days_data = await run_in_threadpool(TaskService._split_by_days, excel_shop_df, days)
+        await CacheService.repair_days(version, days_data)
+        return version, days_data
+
+    @staticmethod
+    def _select_days(catalogue: dict[int, bytes], day: int | None) -> tuple[list[int], dict[int, bytes]]:
+        """Выбирает из каталога дни, нужные запросу; дни, которых нет в каталоге, пустые"""
+        days = sorted(catalogue) if day is None else list(range(1, day + 1))
+        return days, {day_num: catalogue.get(day_num, b"[]") for day_num in days}
+
+    @staticmethod
+    async def _build_catalogue() -> tuple[str, dict[int, bytes]]:
+        logger.info("Сборка каталога заданий через ExcelService.load_catalogue()")
+        version, excel_shop_df = await ExcelService.load_catalogue()
+        return version, await run_in_threadpool(TaskService._split_by_days, excel_shop_df)
+
+    @staticmethod
+    def _split_by_days(excel_shop_df: DataFrame, days: Optional[list[int]] = None) -> dict[int, bytes]:
+        """
+        Раскладывает задания по дням и сериализует каждый день в JSON-массив.
+        Без days в каталог попадают все дни мероприятия (даже пустые) и все дни, которые есть в таблице.
+        """
+        if 'Номер дня' not in excel_shop_df.columns:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="В таблице не существует колонки 'Номер дня'."
+            )
+
+        if days is None:
+            table_days = to_numeric(excel_shop_df['Номер дня'], errors="coerce").dropna().astype(int)
+            days = sorted(set(range(1, settings.excel.DAYS_COUNT + 1)) | set(table_days.unique().tolist()))
+
+        days_data = {}
+        for day_num in days:
+            day_data = excel_shop_df[excel_shop_df['Номер дня'] == day_num]
+            days_data[day_num] = day_data.to_json(orient="records", force_ascii=False).encode()
+        return days_data
 
     @staticmethod
     async def send_task_to_moderator(
             request: Request,
-            session: Session,
+            session: AsyncSession,
             task_id: int,
             user_id: int,
             value: int,
@@ -82,7 +243,8 @@ class TaskService:
             file: Optional[UploadFile] = None
     ):
         """
-        Отправляет задание модератору.
+        Ставит задание в исходящую очередь для модераторов.
+        Сама отправка в Telegram выполняется в фоне ModerationDispatcher'ом.
 
         Возможные входные данные:
         - Только текст
@@ -90,105 +252,59 @@ class TaskService:
         - Видео + текст
         """
         logger.info(f"Запущена проверка jwt-токена в send_task_to_moderator")
-        await verify_user_by_jwt(request=request, session=session)
+        user = await verify_user_by_jwt(request=request, session=session)
         logger.info(f"JWT-токен успешно проверен")
 
-        token = request.cookies.get("jwt-token")
-        verified_token = verify_jwt_token(token)
-        username = verified_token.get("sub")
-
-        answers = {
-            1: "https://t.me/c/2621459328/2",
-            6: "https://t.me/c/2621459328/4",
-            7: "https://t.me/c/2621459328/5",
-            8: "https://t.me/c/2621459328/6",
-            9: "https://t.me/c/2621459328/7",
-            10: "https://t.me/c/2621459328/8",
-            11: "https://t.me/c/2621459328/22",
-            12: "https://t.me/c/2621459328/9",
-            13: "https://t.me/c/2621459328/19",
-            14: "https://t.me/c/2621459328/10",
-            17: "https://t.me/c/2621459328/11",
-            18: "https://t.me/c/2621459328/21",
-            19: "https://t.me/c/2621459328/12",
-            20: "https://t.me/c/2621459328/13",
-            21: "https://t.me/c/2621459328/14",
-            25: "https://t.me/c/2621459328/15",
-            28: "https://t.me/c/2621459328/20",
-            34: "https://t.me/c/2621459328/16",
-            35: "https://t.me/c/2621459328/17",
-            36: "https://t.me/c/2621459328/18",
-        }
-
-        if UserRepository.is_task_already_in_progress(session=session, task_id=task_id, username=username):
+        # Занимаем задание сразу: повторная или параллельная отправка того же задания сюда уже не пройдёт
+        if not await TaskProgressRepository.claim_task(session=session, username=user.username, task_id=task_id):
             return status.HTTP_200_OK
 
-        logger.info("Создание сообщения")
-        if task_id not in answers:
-            message = f"📎 Задание №{task_id}\n\n👤 Пользователь: @{username}\n\n💲 Количество баллов: {value}"
-        else:
-            message = f"📎 Задание №{task_id}\n\n👤 Пользователь: @{username}\n\n💲 Количество баллов: {value}\n\nПроверить ответ: {answers[task_id]}"
-
-        if text and text.strip():
-            message += f"\n\n🖋 Текст пользователя: {text}"
+        try:
+            await TaskService._enqueue_submission(user.username, task_id, user_id, value, text, file)
+        except BaseException:
+            # Задание не принято — освобождаем его, чтобы пользователь мог отправить его снова
+            await TaskProgressRepository.release_task(session=session, username=user.username, task_id=task_id)
+            raise
 
-        logger.info("Сообщение собрано")
+        return status.HTTP_202_ACCEPTED
 
-        keyboard = {
-            "inline_keyboard": [
-                [{"text": "Принять", "callback_data": f"approve_{task_id}_{user_id}_{value}"}],
-                [{"text": "Отклонить", "callback_data": f"reject_{task_id}_{user_id}"}]
-            ]
-        }
+    @staticmethod
+    async def _enqueue_submission(
+            username: str,
+            task_id: int,
+            user_id: int,
+            value: int,
+            text: Optional[str],
+            file: Optional[UploadFile]
+    ):
+        """Сохраняет файл задания на диск и ставит задание в исходящую очередь"""
+        submission = ModerationSubmission(
+            task_id=task_id,
+            user_id=user_id,
+            value=value,
+            username=username,
+            text=text,
+        )
 
-        # Определяем, какой тип файла отправлять
+        # Определяем, какой тип файла отправлять, по его сигнатуре, а не по content_type от клиента
         if file:
-            # jpeg - норм
-            if "image" in file.content_type:
-                url = f"https://api.telegram.org/bot{settings.bot.TELEGRAM_BOT_TOKEN}/sendPhoto"
-                file_type = "photo"
-            elif "video" in file.content_type:
-                url = f"https://api.telegram.org/bot{settings.bot.TELEGRAM_BOT_TOKEN}/sendVideo"
-                file_type = "video"
-            else:
+            media_type = detect_media_type(await file.read(MAGIC_BYTES_LENGTH))
+            if media_type is None:
                 logging.warning(f"Неподдерживаемый формат файла {file.content_type}")
                 raise HTTPException(status_code=400, detail="Неподдерживаемый формат файла")
 
-            # Формируем данные для отправки
-            form_data = FormData()
-            form_data.add_field('chat_id', str(settings.bot.MODERATOR_CHAT_ID))
-            form_data.add_field('caption', message)  # Описание (подпись)
-            form_data.add_field('reply_markup', json.dumps(keyboard))
-            form_data.add_field(file_type, file.file, filename=file.filename, content_type=file.content_type)
-
-        else:
-            # Если файл отсутствует, отправляем только текст
-            url = f"https://api.telegram.org/bot{settings.bot.TELEGRAM_BOT_TOKEN}/sendMessage"
-
-            payload = {
-                "chat_id": str(settings.bot.MODERATOR_CHAT_ID),
-                "text": message,
-                "reply_markup": json.dumps(keyboard),
-                "parse_mode": "HTML",
-            }
-
-
-        # Отправка запроса
-        async with ClientSession() as client_session:
-            if file:
-                async with client_session.post(url, data=form_data) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error(f"Failed to send task to moderator: {error_text}")
-                        raise HTTPException(status_code=500, detail=f"Failed to send task to moderator: {error_text}")
-            else:
-                async with client_session.post(url, json=payload) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error(f"Failed to send task to moderator: {error_text}")
-                        raise HTTPException(status_code=500,
-                                            detail=f"Failed to send text task to moderator: {error_text}")
-
-        UserRepository.update_user_in_progress_tasks(session=session, username=username, task_id=task_id)
-
-        return status.HTTP_200_OK
+            # Файл сохраняется на диск, чтобы пережить перезапуск до отправки
+            submission.file_type, submission.content_type = media_type
+            submission.file_path, submission.file_sha256 = await upload_file(file)
+            submission.file_name = file.filename
+
+        try:
+            await ModerationOutbox.enqueue(submission)
+        except Exception as e:
+            logger.error(f"Не удалось поставить задание {task_id} в очередь: {e}", exc_info=True)
+            if submission.file_path:
+                os.remove(submission.file_path)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Не удалось принять задание, попробуйте позже",
+            )
@@ -0,0 +1,221 @@
+import json
+import logging
+import time
+from typing import Optional
+
+import aiohttp
+from aiohttp import FormData
+from redis.exceptions import RedisError
+
+from src.core.http_client import http_client
+from src.core.metrics import OUTBOUND_HTTP_SECONDS
+from src.core.redis_client import redis_client
+from src.core.schemas.tasks import ModerationSubmission
+from src.core.utils.config import settings
+from src.core.utils.exceptions import TelegramDeliveryError
+
+logger = logging.getLogger("telegram_logger")
+
+# Ссылки на сообщения с правильными ответами для модераторов
+ANSWERS = {
+    1: "https://t.me/c/2621459328/2",
+    6: "https://t.me/c/2621459328/4",
+    7: "https://t.me/c/2621459328/5",
+    8: "https://t.me/c/2621459328/6",
+    9: "https://t.me/c/2621459328/7",
+    10: "https://t.me/c/2621459328/8",
+    11: "https://t.me/c/2621459328/22",
+    12: "https://t.me/c/2621459328/9",
+    13: "https://t.me/c/2621459328/19",
+    14: "https://t.me/c/2621459328/10",
+    17: "https://t.me/c/2621459328/11",
+    18: "https://t.me/c/2621459328/21",
+    19: "https://t.me/c/2621459328/12",
+    20: "https://t.me/c/2621459328/13",
+    21: "https://t.me/c/2621459328/14",
+    25: "https://t.me/c/2621459328/15",
+    28: "https://t.me/c/2621459328/20",
+    34: "https://t.me/c/2621459328/16",
+    35: "https://t.me/c/2621459328/17",
+    36: "https://t.me/c/2621459328/18",
+}
+
+
+class TelegramMediaCache:
+    """
+    file_id уже загруженных в Telegram файлов по sha256 содержимого.
+    Одинаковый скриншот или видео отправляется повторно по file_id, без новой загрузки файла.
+    Кеш вспомогательный: при недоступности Redis файл просто загружается заново.
+    """
+
+    @staticmethod
+    def _key(file_type: str, sha256: str) -> str:
+        return settings.bot.TELEGRAM_FILE_ID_KEY_TEMPLATE.format(file_type=file_type, sha256=sha256)
+
+    @staticmethod
+    async def get(file_type: str, sha256: Optional[str]) -> Optional[str]:
+        if not sha256:
+            return None
+        try:
+            return await redis_client.get(TelegramMediaCache._key(file_type, sha256))
+        except RedisError as e:
+            logger.warning(f"Не удалось прочитать file_id из Redis: {e}")
+            return None
+
+    @staticmethod
+    async def set(file_type: str, sha256: str, file_id: str):
+        try:
+            await redis_client.set(
+                TelegramMediaCache._key(file_type, sha256), file_id, ex=settings.bot.TELEGRAM_FILE_ID_TTL
+            )
+        except RedisError as e:
+            logger.warning(f"Не удалось сохранить file_id в Redis: {e}")
+
+    @staticmethod
+    async def delete(file_type: str, sha256: str):
+        try:
+            await redis_client.delete(TelegramMediaCache._key(file_type, sha256))
+        except RedisError as e:
+            logger.warning(f"Не удалось удалить file_id из Redis: {e}")
+
+
+class TelegramService:
+    @staticmethod
+    def _method_url(method: str) -> str:
+        return f"{settings.bot.TELEGRAM_API_URL}/bot{settings.bot.TELEGRAM_BOT_TOKEN}/{method}"
+
+    @staticmethod
+    def build_message(task_id: int, username: str, value: int, text: Optional[str] = None) -> str:
+        if task_id not in ANSWERS:
+            message = f"📎 Задание №{task_id}\n\n👤 Пользователь: @{username}\n\n💲 Количество баллов: {value}"
+        else:
+            message = f"📎 Задание №{task_id}\n\n👤 Пользователь: @{username}\n\n💲 Количество баллов: {value}\n\nПроверить ответ: {ANSWERS[task_id]}"
+
+        if text and text.strip():
+            message += f"\n\n🖋 Текст пользователя: {text}"
+
+        return message
+
+    @staticmethod
+    def build_keyboard(task_id: int, user_id: int, value: int) -> dict:
+        return {
+            "inline_keyboard": [
+                [{"text": "Принять", "callback_data": f"approve_{task_id}_{user_id}_{value}"}],
+                [{"text": "Отклонить", "callback_data": f"reject_{task_id}_{user_id}"}]
+            ]
+        }
+
+    @staticmethod
+    async def send_submission(submission: ModerationSubmission) -> dict:
+        """
+        Отправляет задание в чат модераторов.
+
+        Возможные входные данные:
+        - Только текст
+        - Фото + текст
+        - Видео + текст
+
+        Если такой же файл уже отправлялся, он передаётся по закешированному file_id без повторной загрузки.
+
+        Возвращает поле result из ответа Telegram, при ошибке выбрасывает TelegramDeliveryError.
+        """
+        message = TelegramService.build_message(
+            task_id=submission.task_id,
+            username=submission.username,
+            value=submission.value,
+            text=submission.text,
+        )
+        keyboard = TelegramService.build_keyboard(submission.task_id, submission.user_id, submission.value)
+
+        if submission.file_path:
+            method = "sendPhoto" if submission.file_type == "photo" else "sendVideo"
+            file_id = await TelegramMediaCache.get(submission.file_type, submission.file_sha256)
+            if file_id:
+                payload = {
+                    "chat_id": str(settings.bot.MODERATOR_CHAT_ID),
+                    "caption": message,
+                    "reply_markup": json.dumps(keyboard),
+                    submission.file_type: file_id,
+                }
+                try:
+                    return await TelegramService._post(method, json=payload)
+                except TelegramDeliveryError as e:
+                    if e.status != 400:
+                        raise
+                    # Telegram не принял file_id: забываем его и загружаем файл заново
+                    logger.warning(f"Telegram отклонил закешированный file_id, файл будет загружен заново: {e}")
+                    await TelegramMediaCache.delete(submission.file_type, submission.file_sha256)
+
+            # aiohttp читает файл блоками прямо в тело multipart-запроса, целиком в память он не загружается
+            with open(submission.file_path, "rb") as file:
+                form_data = FormData()
+                form_data.add_field('chat_id', str(settings.bot.MODERATOR_CHAT_ID))
+                form_data.add_field('caption', message)  # Описание (подпись)
+                form_data.add_field('reply_markup', json.dumps(keyboard))
+                form_data.add_field(
+                    submission.file_type,
+                    file,
+                    filename=submission.file_name,
+                    content_type=submission.content_type,
+                )
+                result = await TelegramService._post(method, data=form_data)
+
+            file_id = TelegramService._extract_file_id(submission.file_type, result)
+            if submission.file_sha256 and file_id:
+                await TelegramMediaCache.set(submission.file_type, submission.file_sha256, file_id)
+            return result
+
+        payload = {
+            "chat_id": str(settings.bot.MODERATOR_CHAT_ID),
+            "text": message,
+            "reply_markup": json.dumps(keyboard),
+            "parse_mode": "HTML",
+        }
+        return await TelegramService._post("sendMessage", json=payload)
+
+    @staticmethod
+    def _extract_file_id(file_type: str, result: dict) -> Optional[str]:
+        """Достаёт file_id загруженного файла из ответа sendPhoto/sendVideo"""
+        try:
+            if file_type == "photo":
+                # Telegram возвращает несколько размеров фото, последний из них — исходный
+                return result["photo"][-1]["file_id"]
+            return result[file_type]["file_id"]
+        except (KeyError, IndexError, TypeError):
+            return None
+
+    @staticmethod
+    async def _post(method: str, **kwargs) -> dict:
+        started_at = time.perf_counter()
+        status_code = 0
+        try:
+            result = await TelegramService._send(method, **kwargs)
+            status_code = 200
+            return result
+        except TelegramDeliveryError as e:
+            status_code = e.status
+            raise
+        finally:
+            OUTBOUND_HTTP_SECONDS.labels(target=f"telegram/{method}", status=status_code).observe(
+                time.perf_counter() - started_at
+            )
+
+    @staticmethod
+    async def _send(method: str, **kwargs) -> dict:
+        try:
+            async with http_client.session.post(TelegramService._method_url(method), **kwargs) as response:
+                if response.status == 200:
+                    return (await response.json()).get("result", {})
+
+                error_text = await response.text()
+                retry_after = None
+                if response.status == 429:
+                    try:
+                        retry_after = (await response.json(content_type=None))["parameters"]["retry_after"]
+                    except Exception:
+                        retry_after = None
+        except (aiohttp.ClientError, TimeoutError) as e:
+            raise TelegramDeliveryError(status=0, detail=str(e))
+
+        logger.error(f"Failed to send task to moderator: {error_text}")
+        raise TelegramDeliveryError(status=response.status, detail=error_text, retry_after=retry_after)
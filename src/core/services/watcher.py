@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import Optional
+
+from src.core.services.tasks import TaskService
+from src.core.utils.config import settings
+
+try:
+    from watchfiles import awatch
+except ImportError:  # watchfiles не обязателен, без него файл опрашивается раз в WATCH_INTERVAL
+    awatch = None
+
+logger = logging.getLogger("watcher_logger")
+
+
+class WorkbookWatcher:
+    """
+    Фоновая задача воркера: следит за Excel-файлом и, как только он изменился, публикует каталог
+    новой версии в Redis (см. TaskService.refresh_catalogue). Работает в каждом воркере, но до аренды
+    воркеры лишь сверяют sha256 файла с версией в Redis, а Excel разбирает только тот, кто захватил аренду
+    на пересборку; остальные дожидаются переключения версии и потом читают уже собранный им снимок.
+
+    Если установлен watchfiles, изменения приходят через inotify (и аналоги), а опрос раз в WATCH_INTERVAL
+    остаётся страховкой; без него файл просто опрашивается по mtime и размеру.
+    """
+
+    def __init__(self, path: str, interval: float):
+        self.path = Path(path).resolve()
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run(), name="workbook-watcher")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self._sync()
+                if awatch is None:
+                    await self._poll()
+                else:
+                    await self._watch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Наблюдение за {self.path} прервано: {e}", exc_info=True)
+                await asyncio.sleep(self.interval)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._sync()
+
+    async def _watch(self):
+        # Следим за каталогом, а не за файлом: редакторы и копирование часто подменяют файл целиком
+        async for _ in awatch(
+                self.path.parent,
+                watch_filter=lambda _, changed_path: Path(changed_path).resolve() == self.path,
+                rust_timeout=int(self.interval * 1000),
+                yield_on_timeout=True,
+        ):
+            await self._sync()
+
+    async def _sync(self):
+        try:
+            await TaskService.refresh_catalogue()
+        except FileNotFoundError as e:
+            logger.warning(f"Нечего публиковать: {e}")
+
+
+workbook_watcher = WorkbookWatcher(path=settings.excel.FILE_PATH, interval=settings.excel.WATCH_INTERVAL)
@@ -1,22 +1,57 @@
-from fastapi import HTTPException, Request
-from sqlalchemy.orm import Session
+from fastapi import HTTPException, Request, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.database.db import get_db_session
 from src.core.jwt.tokens import verify_jwt_token
 from src.core.repositories.users import UserRepository
+from src.core.schemas.auth import AuthenticatedUser
+from src.core.services.auth_cache import AuthCacheService, UNKNOWN_USER
 
+USER_NOT_FOUND_DETAIL = "По такому имени в JWT-Токене нет пользователя в базе данных"
 
-async def verify_user_by_jwt(request: Request, session: Session):
+
+async def verify_user_by_jwt(request: Request, session: AsyncSession) -> AuthenticatedUser:
     """
-    Возвращает пользователя после аутентификации по username с помощью jwt
+    Возвращает пользователя после аутентификации по username с помощью jwt.
+
+    Результат запоминается в request.state, поэтому в рамках одного запроса токен декодируется один раз,
+    а между запросами проверенный пользователь берётся из AuthCacheService без обращения к базе.
     """
+    principal = getattr(request.state, "principal", None)
+    if principal is not None:
+        return principal
+
     token = request.cookies.get("jwt-token")
     if not token:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
-    verified_token = verify_jwt_token(token)
+    token_hash = AuthCacheService.hash_token(token)
+    principal = await AuthCacheService.get(token_hash)
+    if principal is UNKNOWN_USER:
+        raise HTTPException(status_code=401, detail=USER_NOT_FOUND_DETAIL)
+
+    if principal is None:
+        verified_token = verify_jwt_token(token)
+
+        username_from_jwt = verified_token.get("sub")
+        exp = verified_token.get("exp")
+        username_from_db = await UserRepository.get_user_by_username(session=session, username=username_from_jwt)
+        if username_from_db is None or username_from_jwt != username_from_db:
+            await AuthCacheService.set_unknown(token_hash, exp)
+            raise HTTPException(status_code=401, detail=USER_NOT_FOUND_DETAIL)
 
-    username_from_jwt = verified_token.get("sub")
-    username_from_db = UserRepository.get_user_by_username(session=session, username=username_from_jwt)
-    if username_from_db is None or username_from_jwt != username_from_db:
-        raise HTTPException(status_code=401, detail="По такому имени в JWT-Токене нет пользователя в базе данных")
+        principal = AuthenticatedUser(username=username_from_db, exp=exp)
+        await AuthCacheService.set_user(token_hash, principal)
 
+    request.state.principal = principal
+    return principal
+
+
+async def get_current_user(
+        request: Request,
+        session: AsyncSession = Depends(get_db_session)
+) -> AuthenticatedUser:
+    """
+    Зависимость FastAPI: аутентифицированный пользователь текущего запроса.
+    """
+    return await verify_user_by_jwt(request=request, session=session)
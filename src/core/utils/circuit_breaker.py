@@ -0,0 +1,82 @@
+import time
+from typing import Callable, Optional
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+
+class CircuitOpenError(Exception):
+    """Предохранитель разомкнут: запрос не отправляется, чтобы не ждать заведомо недоступный сервис"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Предохранитель {name} разомкнут, повтор через {retry_in:.1f} с")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Предохранитель внутри процесса воркера.
+
+    После failure_threshold ошибок подряд размыкается и reset_timeout секунд сразу отказывает,
+    затем пропускает один пробный запрос: успех замыкает предохранитель, ошибка снова размыкает.
+    Работает в одном event loop, поэтому блокировки не нужны.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        reset_timeout: float,
+        on_state_change: Optional[Callable[[str], None]] = None,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._on_state_change = on_state_change
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return self._state
+
+    def before_call(self):
+        """Разрешает запрос или выбрасывает CircuitOpenError. После разрешения обязателен record_success/record_failure"""
+        state = self.state
+        if state == CLOSED:
+            return
+        if state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            self._set_state(HALF_OPEN)
+            return
+        retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+        raise CircuitOpenError(self.name, retry_in)
+
+    def record_success(self):
+        self._failures = 0
+        self._probe_in_flight = False
+        self._set_state(CLOSED)
+
+    def record_failure(self):
+        self._failures += 1
+        probe_failed = self._probe_in_flight
+        self._probe_in_flight = False
+        if probe_failed or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def release(self):
+        """Запрос не дошёл до сервиса (например, отменён): пробный слот освобождается без изменения состояния"""
+        self._probe_in_flight = False
+
+    def _set_state(self, state: str):
+        if state == self._state:
+            return
+        self._state = state
+        if self._on_state_change is not None:
+            self._on_state_change(state)
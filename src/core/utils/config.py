@@ -1,7 +1,7 @@
 import logging
 import os
 from pathlib import Path
-from typing import Literal
+from typing import Literal, Optional
 
 from dotenv import load_dotenv
 from pydantic import BaseModel
@@ -9,14 +9,14 @@ from pydantic.v1 import BaseSettings
 
 load_dotenv()
 
-UPLOAD_FOLDER = Path("uploads/images")
+UPLOAD_FOLDER = Path(os.getenv("UPLOAD_FOLDER", "uploads/images"))
 UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
 
 LOG_DEFAULT_FORMAT = (
     "[%(asctime)s.%(msecs)03d] %(module)10s:%(lineno)-3d %(levelname)-7s - %(message)s"
 )
 
-BASE_URL_FOR_AIOHTTP = "https://it-otdel.space/playit/auth" # Адрес, куда будут лететь запросы
+BASE_URL_FOR_AIOHTTP = os.getenv("AUTH_SERVICE_URL", "https://it-otdel.space/playit/auth") # Адрес, куда будут лететь запросы
 
 class LoggingSettings(BaseModel):
     log_level: Literal[
@@ -25,7 +25,7 @@ class LoggingSettings(BaseModel):
         "warning",
         "error",
         "critical",
-    ] = "debug"
+    ] = os.getenv("LOG_LEVEL", "debug")
 
     log_format: str = LOG_DEFAULT_FORMAT
 
@@ -37,11 +37,38 @@ class LoggingSettings(BaseModel):
 class RunSettings(BaseModel):
     host: str = "0.0.0.0"
     port: int = 8001
+    reload: bool = os.getenv("RUN_RELOAD", "false").lower() == "true"  # Только для локальной разработки: python main.py
+    workers: int = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))  # Количество процессов-воркеров gunicorn
+    max_requests: int = int(os.getenv("RUN_MAX_REQUESTS", 10000))  # После стольких запросов воркер перезапускается (защита от утечек памяти)
+    max_requests_jitter: int = int(os.getenv("RUN_MAX_REQUESTS_JITTER", 1000))  # Чтобы воркеры не перезапускались одновременно
+    graceful_timeout: int = int(os.getenv("RUN_GRACEFUL_TIMEOUT", 30))  # Сколько воркер дорабатывает начатые запросы при остановке
+    timeout: int = int(os.getenv("RUN_TIMEOUT", 60))  # Воркер, не отвечающий мастеру дольше этого, перезапускается
+    keepalive: int = int(os.getenv("RUN_KEEPALIVE", 5))
 
 
 class BotSettings(BaseModel):
     TELEGRAM_BOT_TOKEN: str = os.getenv("TELEGRAM_BOT_TOKEN")
     MODERATOR_CHAT_ID: str = os.getenv("MODERATOR_CHAT_ID")
+    TELEGRAM_API_URL: str = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")  # Можно подменить на локальную заглушку
+    TELEGRAM_RATE_LIMIT: float = float(os.getenv("TELEGRAM_RATE_LIMIT", 0.3))  # Сообщений в секунду в чат модераторов (лимит Telegram для групп ~20 в минуту)
+    TELEGRAM_RATE_BURST: int = int(os.getenv("TELEGRAM_RATE_BURST", 5))
+    TELEGRAM_FILE_ID_KEY_TEMPLATE: str = os.getenv("TELEGRAM_FILE_ID_KEY_TEMPLATE", "telegram:file_id:{file_type}:{sha256}")
+    TELEGRAM_FILE_ID_TTL: int = int(os.getenv("TELEGRAM_FILE_ID_TTL", 30 * 24 * 3600))  # file_id бота не устаревает, TTL лишь ограничивает рост кеша
+
+
+class OutboxSettings(BaseModel):
+    OUTBOX_STREAM: str = os.getenv("OUTBOX_STREAM", "moderation:outbox")
+    OUTBOX_DEAD_LETTER_STREAM: str = os.getenv("OUTBOX_DEAD_LETTER_STREAM", "moderation:outbox:dead")
+    OUTBOX_GROUP: str = os.getenv("OUTBOX_GROUP", "moderation-dispatchers")
+    OUTBOX_CONCURRENCY: int = int(os.getenv("OUTBOX_CONCURRENCY", 4))  # Сколько заданий одновременно отправляет один воркер
+    OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+    OUTBOX_BACKOFF_BASE: float = float(os.getenv("OUTBOX_BACKOFF_BASE", 1.0))  # Первая пауза между попытками, дальше удваивается
+    OUTBOX_BACKOFF_MAX: float = float(os.getenv("OUTBOX_BACKOFF_MAX", 300.0))
+    OUTBOX_CLAIM_IDLE_MS: int = int(os.getenv("OUTBOX_CLAIM_IDLE_MS", 10 * 60 * 1000))  # Через сколько забирать задания упавшего воркера
+    OUTBOX_READ_BLOCK_MS: int = int(os.getenv("OUTBOX_READ_BLOCK_MS", 5000))
+    OUTBOX_SHUTDOWN_TIMEOUT: float = float(os.getenv("OUTBOX_SHUTDOWN_TIMEOUT", 10.0))  # Сколько ждать отправки уже взятых заданий при остановке
+    # Через сколько заявку 'pending' можно занять заново. Должно быть больше времени всех попыток отправки из outbox
+    OUTBOX_PENDING_STALE_AFTER: float = float(os.getenv("OUTBOX_PENDING_STALE_AFTER", 3600.0))
 
 
 class DBSettings(BaseModel):
@@ -50,7 +77,13 @@ class DBSettings(BaseModel):
     DB_NAME: str = os.getenv("DATABASE_NAME", "postgres")
     DB_USER: str = os.getenv("DATABASE_USER", "postgres")
     DB_PORT: str = os.getenv("DATABASE_PORT", "5432")
-    DATABASE_URL: str = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    DATABASE_URL: str = os.getenv("DATABASE_URL", f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")  # Целиком переопределяет параметры выше
+    DB_POOL_SIZE: int = int(os.getenv("DATABASE_POOL_SIZE", 10))  # Постоянные соединения на воркер
+    DB_MAX_OVERFLOW: int = int(os.getenv("DATABASE_MAX_OVERFLOW", 20))  # Дополнительные соединения при пиковой нагрузке
+    DB_POOL_TIMEOUT: float = float(os.getenv("DATABASE_POOL_TIMEOUT", 5))  # Сколько ждать свободное соединение из пула
+    DB_POOL_RECYCLE: int = int(os.getenv("DATABASE_POOL_RECYCLE", 1800))  # Пересоздавать соединения старше 30 минут
+    DB_POOL_PRE_PING: bool = os.getenv("DATABASE_POOL_PRE_PING", "true").lower() == "true"
+    DB_STATEMENT_TIMEOUT: int = int(os.getenv("DATABASE_STATEMENT_TIMEOUT", 5000))  # Таймаут запроса в миллисекундах
 
 
 class TokenSettings(BaseModel):
@@ -58,19 +91,145 @@ class TokenSettings(BaseModel):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24
 
 
+class AuthCacheSettings(BaseModel):
+    AUTH_CACHE_TTL: int = int(os.getenv("AUTH_CACHE_TTL", 300))  # Сколько помнить проверенного пользователя, но не дольше exp токена
+    AUTH_CACHE_NEGATIVE_TTL: int = int(os.getenv("AUTH_CACHE_NEGATIVE_TTL", 30))  # Сколько помнить, что пользователя нет в базе
+    AUTH_CACHE_MAX_SIZE: int = int(os.getenv("AUTH_CACHE_MAX_SIZE", 10000))  # Размер внутрипроцессного кеша
+    AUTH_CACHE_REDIS_ENABLED: bool = os.getenv("AUTH_CACHE_REDIS_ENABLED", "true").lower() == "true"
+    AUTH_CACHE_KEY_TEMPLATE: str = os.getenv("AUTH_CACHE_KEY_TEMPLATE", "auth:principal:{token_hash}")
+
+
 class RedisSettings(BaseModel):
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
     REDIS_DB: int = int(os.getenv("REDIS_DB", 0))
-    CACHE_KEY_TEMPLATE: str = os.getenv("CACHE_KEY_TEMPLATE", "tasks:day:{day}")  # Ключ для хранения данных кеша для дня
-    CACHE_EXPIRE: int = int(os.getenv("CACHE_EXPIRE", 21600))  # Время жизни кеша: 6 часов = 6 * 3600 секунд
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))  # Размер пула соединений на воркер
+    REDIS_POOL_TIMEOUT: float = float(os.getenv("REDIS_POOL_TIMEOUT", 1.0))  # Сколько ждать свободное соединение из пула
+    REDIS_SOCKET_TIMEOUT: float = float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.5))  # Таймаут на чтение/запись одной команды
+    REDIS_CONNECT_TIMEOUT: float = float(os.getenv("REDIS_CONNECT_TIMEOUT", 0.5))
+    REDIS_HEALTH_CHECK_INTERVAL: int = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+    REDIS_BLOCKING_MAX_CONNECTIONS: int = int(os.getenv("REDIS_BLOCKING_MAX_CONNECTIONS", 4))  # Для блокирующих команд и подписок
+    # Каталог заданий хранится под ключами версии Excel-файла (sha256) и не имеет TTL;
+    # какая версия актуальна, определяет один указатель, который переключается атомарно
+    CACHE_KEY_TEMPLATE: str = os.getenv("CACHE_KEY_TEMPLATE", "tasks:v{version}:day:{day}")  # Данные дня
+    RESPONSE_CACHE_KEY_TEMPLATE: str = os.getenv("RESPONSE_CACHE_KEY_TEMPLATE", "tasks:v{version}:response:{scope}")  # Готовое тело ответа /get-all
+    CACHE_DAYS_INDEX_TEMPLATE: str = os.getenv("CACHE_DAYS_INDEX_TEMPLATE", "tasks:v{version}:days")  # Индекс дней версии (sorted set)
+    CACHE_CURRENT_VERSION_KEY: str = os.getenv("CACHE_CURRENT_VERSION_KEY", "tasks:current")  # Указатель на актуальную версию
+    CACHE_RETIRED_VERSION_TTL: int = int(os.getenv("CACHE_RETIRED_VERSION_TTL", 600))  # Сколько ещё хранить прежнюю версию для уже начатых запросов
+    CACHE_FENCE_KEY: str = os.getenv("CACHE_FENCE_KEY", "tasks:fence")  # Последний fencing-токен, с которым записывался кеш
+    REBUILD_LOCK_TTL_MS: int = int(os.getenv("REBUILD_LOCK_TTL_MS", 30000))  # Время аренды на пересборку кеша
+    REBUILD_WAIT_TIMEOUT: float = float(os.getenv("REBUILD_WAIT_TIMEOUT", 10.0))  # Сколько ждать чужую пересборку, прежде чем парсить самим
+    REBUILD_POLL_INTERVAL: float = float(os.getenv("REBUILD_POLL_INTERVAL", 0.05))
+
+
+class HttpClientSettings(BaseModel):
+    HTTP_LIMIT: int = int(os.getenv("HTTP_LIMIT", 100))  # Всего соединений в пуле на воркер
+    HTTP_LIMIT_PER_HOST: int = int(os.getenv("HTTP_LIMIT_PER_HOST", 20))
+    HTTP_DNS_CACHE_TTL: int = int(os.getenv("HTTP_DNS_CACHE_TTL", 300))
+    HTTP_KEEPALIVE_TIMEOUT: float = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3))
+    HTTP_READ_TIMEOUT: float = float(os.getenv("HTTP_READ_TIMEOUT", 15))
+    HTTP_TOTAL_TIMEOUT: float = float(os.getenv("HTTP_TOTAL_TIMEOUT", 60))  # С запасом на загрузку видео в Telegram
+
+
+class BalanceClientSettings(BaseModel):
+    BALANCE_DEADLINE: float = float(os.getenv("BALANCE_DEADLINE", 5.0))  # Сколько всего секунд даётся на пополнение баланса, включая повторы
+    BALANCE_MAX_ATTEMPTS: int = int(os.getenv("BALANCE_MAX_ATTEMPTS", 3))
+    BALANCE_BACKOFF_BASE: float = float(os.getenv("BALANCE_BACKOFF_BASE", 0.2))
+    BALANCE_BULKHEAD_SIZE: int = int(os.getenv("BALANCE_BULKHEAD_SIZE", 10))  # Одновременных запросов к сервису авторизации на воркер
+    BALANCE_BULKHEAD_WAIT: float = float(os.getenv("BALANCE_BULKHEAD_WAIT", 0.5))  # Сколько ждать свободного места, прежде чем отложить начисление
+    BALANCE_BREAKER_FAILURES: int = int(os.getenv("BALANCE_BREAKER_FAILURES", 5))  # Ошибок подряд до размыкания
+    BALANCE_BREAKER_RESET: float = float(os.getenv("BALANCE_BREAKER_RESET", 30.0))  # Через сколько секунд пропустить пробный запрос
+    BALANCE_REPLAY_KEY: str = os.getenv("BALANCE_REPLAY_KEY", "balance:replay")
+    BALANCE_REPLAY_DEAD_KEY: str = os.getenv("BALANCE_REPLAY_DEAD_KEY", "balance:replay:dead")
+    BALANCE_REPLAY_INTERVAL: float = float(os.getenv("BALANCE_REPLAY_INTERVAL", 5.0))
+    BALANCE_REPLAY_BATCH: int = int(os.getenv("BALANCE_REPLAY_BATCH", 20))
+    BALANCE_REPLAY_LEASE: float = float(os.getenv("BALANCE_REPLAY_LEASE", 60.0))  # Через сколько вернуть в очередь начисление упавшего воркера
+    BALANCE_REPLAY_BACKOFF_MAX: float = float(os.getenv("BALANCE_REPLAY_BACKOFF_MAX", 300.0))
+    BALANCE_REPLAY_MAX_AGE: float = float(os.getenv("BALANCE_REPLAY_MAX_AGE", 24 * 3600))  # Более старые начисления уходят на ручную сверку
+    BALANCE_REPLAY_TOKEN_LIFETIME: int = int(os.getenv("BALANCE_REPLAY_TOKEN_LIFETIME", 60))  # Сколько живёт токен, выпущенный для отложенного начисления
+
+
+class ImageSettings(BaseModel):
+    IMAGE_MAX_DIMENSION: int = int(os.getenv("IMAGE_MAX_DIMENSION", 2560))  # Больше Telegram всё равно не показывает
+    IMAGE_QUALITY: int = int(os.getenv("IMAGE_QUALITY", 85))  # Качество JPEG после пересжатия
+    IMAGE_PASSTHROUGH_BYTES: int = int(os.getenv("IMAGE_PASSTHROUGH_BYTES", 512 * 1024))  # Фото меньше этого отправляются как есть
+    IMAGE_POOL_WORKERS: int = int(os.getenv("IMAGE_POOL_WORKERS", 2))  # Процессов для пересжатия на воркер
+    IMAGE_PROCESS_TIMEOUT: float = float(os.getenv("IMAGE_PROCESS_TIMEOUT", 30.0))  # Дольше этого фото не ждём и отправляем как есть
+
+
+class UploadSettings(BaseModel):
+    UPLOAD_MAX_SIZE: int = int(os.getenv("UPLOAD_MAX_SIZE", 50 * 1024 * 1024))  # Максимальный размер файла задания: 50 МБ (лимит Telegram для ботов)
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", 256 * 1024))  # Размер блока при копировании файла
+
+
+class LocalCacheSettings(BaseModel):
+    LOCAL_CACHE_TTL: float = float(os.getenv("LOCAL_CACHE_TTL", 60))  # Сколько ответ живёт в памяти воркера без подтверждения из Redis
+    LOCAL_CACHE_MAX_BYTES: int = int(os.getenv("LOCAL_CACHE_MAX_BYTES", 64 * 1024 * 1024))  # Лимит памяти воркера под готовые ответы
+    CACHE_INVALIDATION_CHANNEL: str = os.getenv("CACHE_INVALIDATION_CHANNEL", "tasks:invalidate")
+
+
+class HttpCacheSettings(BaseModel):
+    GZIP_LEVEL: int = int(os.getenv("GZIP_LEVEL", 9))  # Сжатие выполняется один раз на версию данных, поэтому можно максимальное
+    BROTLI_QUALITY: int = int(os.getenv("BROTLI_QUALITY", 9))
+
+
+class MetricsSettings(BaseModel):
+    EVENT_LOOP_LAG_INTERVAL: float = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", 0.5))  # Как часто замерять задержку event loop
+
+
+class ProfilingSettings(BaseModel):
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"  # Без этого middleware профилирования не подключается вовсе
+    PROFILING_SECRET: Optional[str] = os.getenv("PROFILING_SECRET")  # Ключ для подписи заголовка X-Profile
+    PROFILING_SAMPLE_RATE: float = float(os.getenv("PROFILING_SAMPLE_RATE", 0.0))  # Доля случайных запросов, которые профилируются без заголовка
+    PROFILING_INTERVAL: float = float(os.getenv("PROFILING_INTERVAL", 0.001))  # Период сэмплирования стека, в секундах
+    PROFILING_DIR: str = os.getenv("PROFILING_DIR", "profiles")
+    PROFILING_MAX_FILES: int = int(os.getenv("PROFILING_MAX_FILES", 100))  # Сколько последних профилей хранить на диске
+    PROFILING_TRACEMALLOC_TOP: int = int(os.getenv("PROFILING_TRACEMALLOC_TOP", 20))  # Сколько строк с наибольшим приростом памяти сохранять
+
+
+class AutocheckSettings(BaseModel):
+    AUTOCHECK_BATCH_MAX_SIZE: int = int(os.getenv("AUTOCHECK_BATCH_MAX_SIZE", 100))  # Максимум ответов в одном пакетном запросе
+    AUTOCHECK_BATCH_CONCURRENCY: int = int(os.getenv("AUTOCHECK_BATCH_CONCURRENCY", 10))  # Одновременных запросов пополнения баланса на пакет
+
+
+class IdempotencySettings(BaseModel):
+    IDEMPOTENCY_PENDING_TTL_MS: int = int(os.getenv("IDEMPOTENCY_PENDING_TTL_MS", 30000))  # Сколько действует захват операции, если её исполнитель упал
+    IDEMPOTENCY_RESULT_TTL: int = int(os.getenv("IDEMPOTENCY_RESULT_TTL", 7 * 24 * 3600))  # Сколько хранить ответ на запрос с Idempotency-Key (записи о пополнении баланса бессрочные)
+    IDEMPOTENCY_WAIT_TIMEOUT: float = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", 10.0))  # Сколько повтор ждёт результат операции, которая ещё выполняется
+    IDEMPOTENCY_POLL_INTERVAL: float = float(os.getenv("IDEMPOTENCY_POLL_INTERVAL", 0.05))
+    IDEMPOTENCY_KEY_MAX_LENGTH: int = int(os.getenv("IDEMPOTENCY_KEY_MAX_LENGTH", 255))
+
+
+class ExcelSettings(BaseModel):
+    FILE_PATH: str = os.getenv("EXCEL_FILE_PATH", "PlayIT.xlsx")
+    SHEET_NAME: str = os.getenv("EXCEL_SHEET_NAME", "Персонажи")
+    DAYS_COUNT: int = int(os.getenv("EXCEL_DAYS_COUNT", 3))  # Сколько дней длится мероприятие
+    SNAPSHOT_PATH: str = os.getenv("EXCEL_SNAPSHOT_PATH", "PlayIT.arrow")  # Скомпилированный снимок листа (Arrow IPC)
+    INDEX_CHECK_INTERVAL: float = float(os.getenv("EXCEL_INDEX_CHECK_INTERVAL", 1.0))  # Как часто (в секундах) проверять, не изменился ли файл
+    WATCH_INTERVAL: float = float(os.getenv("EXCEL_WATCH_INTERVAL", 5.0))  # Период опроса файла фоновым наблюдателем (без inotify — единственный способ заметить изменение)
+    PARSE_TIMEOUT: float = float(os.getenv("EXCEL_PARSE_TIMEOUT", 60.0))  # Сколько запрос ждёт загрузки Excel-файла, прежде чем получить 503
+    PARSE_CONCURRENCY: int = int(os.getenv("EXCEL_PARSE_CONCURRENCY", 1))  # Сколько xlsx одновременно разбирается в отдельных процессах воркера
 
 
 class Settings(BaseSettings):
     bot: BotSettings = BotSettings()
     db: DBSettings = DBSettings()
     token: TokenSettings = TokenSettings()
+    auth_cache: AuthCacheSettings = AuthCacheSettings()
     redis: RedisSettings = RedisSettings()
+    excel: ExcelSettings = ExcelSettings()
+    http: HttpClientSettings = HttpClientSettings()
+    balance: BalanceClientSettings = BalanceClientSettings()
+    outbox: OutboxSettings = OutboxSettings()
+    upload: UploadSettings = UploadSettings()
+    image: ImageSettings = ImageSettings()
+    http_cache: HttpCacheSettings = HttpCacheSettings()
+    local_cache: LocalCacheSettings = LocalCacheSettings()
+    metrics: MetricsSettings = MetricsSettings()
+    profiling: ProfilingSettings = ProfilingSettings()
+    autocheck: AutocheckSettings = AutocheckSettings()
+    idempotency: IdempotencySettings = IdempotencySettings()
     logging: LoggingSettings = LoggingSettings()
     run: RunSettings = RunSettings()
 
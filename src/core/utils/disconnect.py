@@ -0,0 +1,37 @@
+import asyncio
+from typing import Awaitable, TypeVar
+
+from fastapi import Request
+
+from src.core.utils.exceptions import ClientDisconnectedExcept
+
+T = TypeVar("T")
+
+
+async def _wait_for_disconnect(request: Request):
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Ждёт awaitable, пока клиент не закрыл соединение; если закрыл — отменяет ожидание и выбрасывает 499.
+    Вызывать только после того, как тело запроса прочитано: иначе ожидание отключения заберёт его части.
+    Общая работа, защищённая asyncio.shield (например, через SingleFlight), при этом не прерывается.
+    """
+    work = asyncio.ensure_future(awaitable)
+    disconnect = asyncio.create_task(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait({work, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        work.cancel()
+        raise
+    finally:
+        disconnect.cancel()
+
+    if work.done():
+        return work.result()
+    work.cancel()
+    raise ClientDisconnectedExcept
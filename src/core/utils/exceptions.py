@@ -33,3 +33,24 @@ ForbiddenExcept = HTTPException(
     status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав!"
 )
 UnAuthenticatedExcept = HTTPException(status_code=401, detail="Неавторизован")
+ExcelParseTimeoutExcept = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Excel-файл ещё обрабатывается, попробуйте позже"
+)
+ClientDisconnectedExcept = HTTPException(status_code=499, detail="Клиент закрыл соединение")
+
+
+class TelegramDeliveryError(Exception):
+    """
+    Telegram Bot API не принял сообщение.
+    status=0 означает сетевую ошибку, когда ответа от Telegram нет вовсе.
+    """
+
+    def __init__(self, status: int, detail: str, retry_after: float | None = None):
+        super().__init__(f"Telegram ответил {status}: {detail}")
+        self.status = status
+        self.detail = detail
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status == 0 or self.status == 429 or self.status >= 500
@@ -0,0 +1,104 @@
+import gzip
+import hashlib
+
+from fastapi import Request, Response, status
+
+from src.core.utils.config import settings
+
+try:
+    import brotli
+except ImportError:  # brotli не обязателен, без него отдаём только gzip
+    brotli = None
+
+IDENTITY = "identity"
+GZIP = "gzip"
+BROTLI = "br"
+
+# Кодировки в порядке предпочтения сервера
+SUPPORTED_ENCODINGS = (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+
+def compute_etag(body: bytes) -> str:
+    """Сильный ETag, вычисленный по содержимому несжатого ответа"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def build_variants(body: bytes) -> dict[str, bytes]:
+    """
+    Готовит все варианты тела ответа: несжатый, gzip и (если доступен) brotli.
+    gzip собирается с mtime=0, чтобы результат зависел только от содержимого.
+    """
+    variants = {
+        IDENTITY: body,
+        GZIP: gzip.compress(body, compresslevel=settings.http_cache.GZIP_LEVEL, mtime=0),
+    }
+    if brotli is not None:
+        variants[BROTLI] = brotli.compress(body, quality=settings.http_cache.BROTLI_QUALITY)
+    return variants
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    """Выбирает кодировку ответа по заголовку Accept-Encoding с учётом q-значений"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+
+    for encoding in SUPPORTED_ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return IDENTITY
+
+
+def _representation_etag(etag: str, encoding: str) -> str:
+    # У разных представлений одного содержимого должны быть разные сильные ETag
+    return f'"{etag}"' if encoding == IDENTITY else f'"{etag}-{encoding}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Сравнивает If-None-Match с ETag содержимого (слабое сравнение, как требует RFC 9110).
+    Подходит ETag любого представления этого содержимого ("etag", "etag-gzip", "etag-br"), но только целиком.
+    """
+    if if_none_match.strip() == "*":
+        return True
+    known = {etag} | {f"{etag}-{encoding}" for encoding in (GZIP, BROTLI)}
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') in known:
+            return True
+    return False
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    return bool(if_none_match) and etag_matches(if_none_match, etag)
+
+
+def build_cached_response(request: Request, etag: str, body: bytes, encoding: str) -> Response:
+    """
+    Отдаёт 304, если у клиента уже есть эта версия, иначе — готовое тело в выбранной кодировке.
+    """
+    headers = {
+        "ETag": _representation_etag(etag, encoding),
+        "Vary": "Accept-Encoding",
+        # Ответ требует авторизации, поэтому кешируется только у клиента и всегда перепроверяется по ETag
+        "Cache-Control": "private, no-cache",
+    }
+    if is_not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if encoding != IDENTITY:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,52 @@
+import os
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+JPEG_CONTENT_TYPE = "image/jpeg"
+
+
+def recompress_image(path: str, max_dimension: int, quality: int, passthrough_bytes: int) -> Optional[str]:
+    """
+    Уменьшает фото до max_dimension по большей стороне, убирает EXIF (предварительно повернув
+    изображение по его ориентации) и пересжимает в JPEG с качеством quality. Файл подменяется на месте.
+
+    Файл остаётся как есть (возвращается None), если он не больше passthrough_bytes, формат не распознан,
+    изображение анимированное, уже обработано или результат получился не меньше исходника.
+    Иначе возвращает новый MIME-тип.
+
+    Выполняется в отдельном процессе, поэтому зависит только от Pillow и аргументов.
+    """
+    if os.path.getsize(path) <= passthrough_bytes:
+        return None
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with Image.open(path) as image:
+            if getattr(image, "is_animated", False):
+                return None
+            if image.format == "JPEG" and max(image.size) <= max_dimension and "exif" not in image.info:
+                return None  # Уже уменьшено и без метаданных — повторное сжатие только испортит качество
+
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+            if image.mode in ("RGBA", "LA", "P"):
+                # У JPEG нет прозрачности — кладём изображение на белый фон
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+
+            image.save(tmp_path, "JPEG", quality=quality, optimize=True, progressive=True)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError):
+        Path(tmp_path).unlink(missing_ok=True)
+        return None
+
+    if os.path.getsize(tmp_path) >= os.path.getsize(path):
+        os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, path)
+    return JPEG_CONTENT_TYPE
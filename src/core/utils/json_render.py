@@ -0,0 +1,22 @@
+import json
+from typing import Iterable
+
+
+def join_json_arrays(arrays: Iterable[bytes]) -> bytes:
+    """
+    Склеивает несколько сериализованных JSON-массивов в один без их разбора.
+    """
+    items = [array.strip()[1:-1].strip() for array in arrays]
+    return b"[" + b",".join(item for item in items if item) + b"]"
+
+
+def render_tasks_response(status: int, details: str, data_arrays: Iterable[bytes]) -> bytes:
+    """
+    Собирает готовое тело ответа в формате ParseTasksResponse из уже сериализованных массивов заданий.
+    """
+    return (
+        b'{"status":' + str(status).encode()
+        + b',"details":' + json.dumps(details, ensure_ascii=False).encode()
+        + b',"data":' + join_json_arrays(data_arrays)
+        + b"}"
+    )
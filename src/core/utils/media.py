@@ -0,0 +1,28 @@
+from typing import Optional
+
+MAGIC_BYTES_LENGTH = 32  # Сколько первых байт файла нужно для определения формата
+
+# Бренды контейнера ISO BMFF (байты 8-12), которые Telegram принимает как видео
+VIDEO_FTYP_BRANDS = (b"isom", b"iso2", b"mp41", b"mp42", b"avc1", b"M4V ", b"qt  ", b"3gp4", b"3gp5", b"dash")
+# Бренды HEIC/HEIF — в этом формате снимают iPhone; Telegram принимает такие фото
+IMAGE_FTYP_BRANDS = {b"heic": "image/heic", b"heix": "image/heic", b"mif1": "image/heif", b"msf1": "image/heif"}
+
+
+def detect_media_type(head: bytes) -> Optional[tuple[str, str]]:
+    """
+    Определяет тип файла по сигнатуре (magic bytes), а не по заявленному клиентом content_type.
+    Возвращает (тип для Telegram: photo/video, MIME-тип) или None, если формат не поддерживается.
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return "photo", "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "photo", "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "photo", "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in IMAGE_FTYP_BRANDS:
+        return "photo", IMAGE_FTYP_BRANDS[head[8:12]]
+    if head[4:8] == b"ftyp" and head[8:12] in VIDEO_FTYP_BRANDS:
+        return "video", "video/quicktime" if head[8:12] == b"qt  " else "video/mp4"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video", "video/webm"
+    return None
@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Простой внутрипроцессный кеш: LRU с ограничением суммарного размера элементов
+    и своим временем жизни у каждого элемента.
+    По умолчанию размер каждого элемента равен 1, то есть max_size — это количество элементов.
+    Истёкшие элементы не удаляются сразу, а вытесняются по LRU, поэтому их можно получить
+    с allow_stale=True (например, когда источник данных недоступен).
+    Не потокобезопасен — рассчитан на использование из одного event loop.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()
+        self._total_size = 0
+
+    def get(self, key: Hashable, default: Any = None, allow_stale: bool = False) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+
+        expires_at, _, value = item
+        if expires_at <= time.monotonic() and not allow_stale:
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, size: int = 1):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or size > self.max_size:
+            return
+
+        self.delete(key)
+        self._data[key] = (time.monotonic() + ttl, size, value)
+        self._total_size += size
+        while self._total_size > self.max_size:
+            _, (_, evicted_size, _) = self._data.popitem(last=False)
+            self._total_size -= evicted_size
+
+    def delete(self, key: Hashable):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._total_size -= item[1]
+
+    def discard_if(self, predicate: Callable[[Hashable, Any], bool]):
+        """Удаляет все элементы, для которых predicate(ключ, значение) истинно"""
+        for key in [key for key, (_, _, value) in self._data.items() if predicate(key, value)]:
+            self.delete(key)
+
+    def clear(self):
+        self._data.clear()
+        self._total_size = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
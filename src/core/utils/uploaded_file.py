@@ -1,16 +1,51 @@
+import hashlib
 import uuid
+from pathlib import Path
+from typing import BinaryIO
 
-from fastapi import UploadFile
+from fastapi import UploadFile, HTTPException, status
+from starlette.concurrency import run_in_threadpool
 
-from src.core.utils.config import UPLOAD_FOLDER
+from src.core.utils.config import UPLOAD_FOLDER, settings
 from src.core.utils.exceptions import handle_http_exceptions
 
 
+def _copy_limited(source: BinaryIO, file_path: Path, max_size: int, chunk_size: int) -> str:
+    """
+    Копирует файл блоками по chunk_size, так что в памяти одновременно не больше одного блока.
+    Попутно считает sha256 содержимого и возвращает его.
+    """
+    written = 0
+    digest = hashlib.sha256()
+    with open(file_path, "wb") as f:
+        while chunk := source.read(chunk_size):
+            written += len(chunk)
+            if written > max_size:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail="Файл слишком большой",
+                )
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
 @handle_http_exceptions
-async def upload_file(uploaded_file: UploadFile):
-    unique_filename = f"{uuid.uuid4().hex}_{uploaded_file.filename}"
+async def upload_file(uploaded_file: UploadFile) -> tuple[str, str]:
+    """Сохраняет загруженный файл в UPLOAD_FOLDER. Возвращает путь к файлу и sha256 его содержимого"""
+    unique_filename = f"{uuid.uuid4().hex}_{Path(uploaded_file.filename or 'file').name}"
     file_path = UPLOAD_FOLDER / unique_filename
-    with open(file_path, "wb") as f:
-        content = await uploaded_file.read()
-        f.write(content)
-    return str(file_path)
+
+    await uploaded_file.seek(0)
+    try:
+        sha256 = await run_in_threadpool(
+            _copy_limited,
+            uploaded_file.file,
+            file_path,
+            settings.upload.UPLOAD_MAX_SIZE,
+            settings.upload.UPLOAD_CHUNK_SIZE,
+        )
+    except BaseException:
+        file_path.unlink(missing_ok=True)
+        raise
+    return str(file_path), sha256
@@ -0,0 +1,33 @@
+import hashlib
+import os
+
+from pandas import read_excel, DataFrame
+
+HASH_CHUNK_SIZE = 1024 * 1024  # Размер блока при подсчёте хеша файла: 1 МБ
+
+
+def read_workbook_sheet(file_path: str, sheet_name: str) -> DataFrame:
+    """
+    Читает лист Excel-файла целиком в DataFrame.
+    """
+    return read_excel(file_path, sheet_name=sheet_name)
+
+
+def get_file_signature(file_path: str) -> tuple[int, int]:
+    """
+    Возвращает дешёвую подпись файла (mtime в наносекундах, размер),
+    по которой можно понять, что файл мог измениться.
+    """
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def compute_file_hash(file_path: str) -> str:
+    """
+    Считает sha256 содержимого файла, читая его блоками.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
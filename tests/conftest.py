@@ -0,0 +1,44 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+from urllib.parse import urlparse
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Тесты, которым нужен настоящий Redis или PostgreSQL, запускаются, только если заданы эти переменные.
+# Redis-тесты очищают свою базу (TEST_REDIS_URL=redis://localhost:6379/15), поэтому указывайте отдельную
+TEST_REDIS_URL = os.getenv("TEST_REDIS_URL")
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+if TEST_REDIS_URL:
+    # Клиенты Redis создаются при импорте src.core.redis_client, поэтому адрес задаётся до импорта приложения
+    parsed = urlparse(TEST_REDIS_URL)
+    os.environ["REDIS_HOST"] = parsed.hostname or "localhost"
+    os.environ["REDIS_PORT"] = str(parsed.port or 6379)
+    os.environ["REDIS_DB"] = (parsed.path or "/0").lstrip("/") or "0"
+
+requires_redis = pytest.mark.skipif(not TEST_REDIS_URL, reason="TEST_REDIS_URL не задан")
+requires_database = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL не задан")
+
+
+@pytest.fixture
+def redis_run():
+    """
+    Выполняет сценарий на очищенной базе TEST_REDIS_URL через клиентов приложения.
+    У каждого теста свой event loop, поэтому соединения пулов приложения закрываются после сценария.
+    """
+    from src.core.redis_client import redis_binary_pool, redis_client, redis_pool
+
+    async def run(scenario):
+        await redis_client.flushdb()
+        try:
+            return await scenario()
+        finally:
+            await redis_pool.disconnect()
+            await redis_binary_pool.disconnect()
+
+    return lambda scenario: asyncio.run(run(scenario))
@@ -0,0 +1,62 @@
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("redis")
+pytest.importorskip("prometheus_client")
+pytest.importorskip("fastapi")
+
+from tests.conftest import requires_redis
+
+pytestmark = requires_redis
+
+
+def test_publish_switches_version_atomically_and_retires_previous(redis_run):
+    from src.core.redis_client import redis_binary_client
+    from src.core.services.cache import CacheService
+
+    async def scenario():
+        assert await CacheService.publish_version("v1", {1: b"[1]", 2: b"[2]"}, fence_token=1)
+        assert await CacheService.publish_version("v2", {1: b"[10]"}, fence_token=2)
+        version, days, cached = await CacheService.get_accumulated_data()
+        old_day_ttl = await redis_binary_client.ttl(CacheService._day_key("v1", 1))
+        new_day_ttl = await redis_binary_client.ttl(CacheService._day_key("v2", 1))
+        return version, days, cached, old_day_ttl, new_day_ttl
+
+    version, days, cached, old_day_ttl, new_day_ttl = redis_run(scenario)
+    assert version == "v2"
+    assert days == [1]
+    assert cached == {1: b"[10]"}
+    assert old_day_ttl > 0  # Прежняя версия доживает CACHE_RETIRED_VERSION_TTL
+    assert new_day_ttl == -1
+
+
+def test_publish_with_stale_fence_token_is_rejected(redis_run):
+    from src.core.redis_client import redis_binary_client
+    from src.core.services.cache import CacheService
+
+    async def scenario():
+        assert await CacheService.publish_version("v2", {1: b"[new]"}, fence_token=5)
+        # Писатель, чья аренда истекла, пытается записать каталог поверх более нового
+        rejected = not await CacheService.publish_version("v1", {1: b"[old]"}, fence_token=4)
+        return (
+            rejected,
+            await CacheService.get_current_version(),
+            await redis_binary_client.exists(CacheService._day_key("v1", 1)),
+        )
+
+    assert redis_run(scenario) == (True, "v2", 0)
+
+
+def test_publish_with_same_fence_token_is_accepted(redis_run):
+    from src.core.services.cache import CacheService
+
+    async def scenario():
+        assert await CacheService.publish_version("v1", {1: b"[1]"}, fence_token=3)
+        # Тот же владелец аренды может переопубликовать каталог, например после дозаписи
+        assert await CacheService.publish_version("v1", {1: b"[1]", 2: b"[2]"}, fence_token=3)
+        return await CacheService.get_accumulated_data()
+
+    version, days, cached = redis_run(scenario)
+    assert version == "v1"
+    assert days == [1, 2]
+    assert cached == {1: b"[1]", 2: b"[2]"}
@@ -0,0 +1,91 @@
+import pytest
+
+from src.core.utils import circuit_breaker
+from src.core.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def transitions() -> list[str]:
+    return []
+
+
+@pytest.fixture
+def breaker(clock, transitions) -> CircuitBreaker:
+    return CircuitBreaker("test", failure_threshold=3, reset_timeout=10, on_state_change=transitions.append)
+
+
+def fail(breaker: CircuitBreaker, times: int):
+    for _ in range(times):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_opens_after_threshold_consecutive_failures(breaker, transitions):
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+    assert transitions == [OPEN]
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_in == pytest.approx(10)
+
+
+def test_success_resets_failure_count(breaker):
+    fail(breaker, 2)
+    breaker.before_call()
+    breaker.record_success()
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_single_probe(breaker, clock, transitions):
+    fail(breaker, 3)
+    clock.now += 10
+    assert breaker.state == HALF_OPEN
+
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # Второй запрос ждёт исхода пробного
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert transitions == [OPEN, HALF_OPEN, CLOSED]
+
+
+def test_failed_probe_reopens_for_full_timeout(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 10
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    clock.now += 9
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_release_frees_probe_without_changing_state(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 10
+    breaker.before_call()
+    breaker.release()
+
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()  # Слот пробного запроса снова свободен
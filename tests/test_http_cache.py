@@ -0,0 +1,83 @@
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("fastapi")
+
+from starlette.requests import Request
+
+from src.core.utils.http_cache import (
+    GZIP,
+    IDENTITY,
+    build_cached_response,
+    choose_encoding,
+    compute_etag,
+    etag_matches,
+)
+
+ETAG = compute_etag(b'{"status": 200}')
+
+
+def make_request(if_none_match: str | None = None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/get-all", "headers": headers})
+
+
+@pytest.mark.parametrize(
+    "if_none_match",
+    [
+        f'"{ETAG}"',
+        f'"{ETAG}-gzip"',
+        f'"{ETAG}-br"',
+        f'W/"{ETAG}-gzip"',
+        f'"stale", "{ETAG}"',
+        "*",
+    ],
+)
+def test_matches_any_representation_of_same_content(if_none_match):
+    assert etag_matches(if_none_match, ETAG)
+
+
+@pytest.mark.parametrize(
+    "if_none_match",
+    [
+        f'"{ETAG}-foo"',
+        f'"{ETAG}-gzip-extra"',
+        f'"{ETAG[:-1]}"',
+        f'"x{ETAG}"',
+        '"stale", "other-gzip"',
+    ],
+)
+def test_rejects_other_etags(if_none_match):
+    assert not etag_matches(if_none_match, ETAG)
+
+
+@pytest.mark.parametrize(
+    ("accept_encoding", "expected"),
+    [
+        ("", IDENTITY),
+        ("gzip", GZIP),
+        ("gzip;q=0", IDENTITY),
+        ("deflate, gzip;q=0.5", GZIP),
+        ("*;q=0", IDENTITY),
+    ],
+)
+def test_chooses_gzip_when_brotli_is_not_offered(accept_encoding, expected):
+    assert choose_encoding(accept_encoding) == expected
+
+
+def test_returns_304_with_variant_etag_when_client_has_content():
+    response = build_cached_response(make_request(f'"{ETAG}"'), ETAG, b"compressed", GZIP)
+
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == f'"{ETAG}-gzip"'
+    assert response.headers["vary"] == "Accept-Encoding"
+
+
+def test_returns_body_with_encoding_when_etag_differs():
+    response = build_cached_response(make_request('"stale"'), ETAG, b"compressed", GZIP)
+
+    assert response.status_code == 200
+    assert response.body == b"compressed"
+    assert response.headers["content-encoding"] == GZIP
+    assert response.headers["etag"] == f'"{ETAG}-gzip"'
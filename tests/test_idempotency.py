@@ -0,0 +1,142 @@
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("redis")
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException
+
+from tests.conftest import requires_redis
+
+pytestmark = requires_redis
+
+
+def make_store(result_ttl=None):
+    from src.core.services.idempotency import IdempotencyStore
+
+    return IdempotencyStore(prefix="test:idempotency", result_ttl=result_ttl)
+
+
+class Operation:
+    def __init__(self, result=None, error: Exception | None = None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_run_once_executes_operation_once_and_replays_result(redis_run):
+    from src.core.redis_client import redis_client
+
+    async def scenario():
+        store = make_store()
+        operation = Operation({"balance": 10})
+        first = await store.run_once("user:1", operation)
+        second = await store.run_once("user:1", operation)
+        return first, second, operation.calls, await redis_client.ttl("test:idempotency:user:1")
+
+    first, second, calls, ttl = redis_run(scenario)
+    assert first == second == {"balance": 10}
+    assert calls == 1
+    assert ttl == -1  # Без result_ttl результат хранится бессрочно
+
+
+def test_result_ttl_is_applied(redis_run):
+    from src.core.redis_client import redis_client
+
+    async def scenario():
+        await make_store(result_ttl=60).run_once("key", Operation("ok"))
+        return await redis_client.ttl("test:idempotency:key")
+
+    assert 0 < redis_run(scenario) <= 60
+
+
+def test_failed_operation_releases_claim(redis_run):
+    async def scenario():
+        store = make_store()
+        with pytest.raises(RuntimeError):
+            await store.run_once("key", Operation(error=RuntimeError("boom")))
+        retry = Operation("ok")
+        return await store.run_once("key", retry), retry.calls
+
+    assert redis_run(scenario) == ("ok", 1)
+
+
+def test_reused_key_with_other_fingerprint_is_rejected(redis_run):
+    async def scenario():
+        store = make_store()
+        await store.run_once("key", Operation("ok"), fingerprint="body-a")
+        with pytest.raises(HTTPException) as error:
+            await store.run_once("key", Operation("other"), fingerprint="body-b")
+        return error.value.status_code, await store.run_once("key", Operation("other"), fingerprint="body-a")
+
+    assert redis_run(scenario) == (422, "ok")
+
+
+def test_held_claim_returns_provisional_result_until_completed(redis_run):
+    async def scenario():
+        store = make_store()
+        token, current = await store.claim("key")
+        assert current is None
+        assert await store.hold("key", token, {"status": "queued"}, ttl=60)
+
+        _, current = await store.claim("key")
+        provisional = await store.wait_for_result("key", current)
+
+        assert await store.complete("key", token, {"status": "sent"})
+        _, current = await store.claim("key")
+        return provisional, await store.wait_for_result("key", current)
+
+    assert redis_run(scenario) == ({"status": "queued"}, {"status": "sent"})
+
+
+def test_held_claim_can_be_abandoned_by_its_owner_only(redis_run):
+    from src.core.redis_client import redis_client
+
+    async def scenario():
+        store = make_store()
+        token, _ = await store.claim("key")
+        await store.hold("key", token, {"status": "queued"})
+
+        other_token, _ = await store.claim("other")
+        await store.abandon("key", other_token)
+        completed_by_other = await store.complete("key", other_token, "stolen")
+        held_after_other = await redis_client.get("test:idempotency:key")
+
+        await store.abandon("key", token)
+        return completed_by_other, held_after_other, await redis_client.exists("test:idempotency:key")
+
+    completed_by_other, held_after_other, exists = redis_run(scenario)
+    assert not completed_by_other
+    assert held_after_other.startswith("held:")
+    assert exists == 0
+
+
+def test_hold_after_completion_does_not_overwrite_result(redis_run):
+    async def scenario():
+        store = make_store()
+        token, _ = await store.claim("key")
+        await store.complete("key", token, {"status": "sent"})  # Например, воркер отправил начисление раньше
+        held = await store.hold("key", token, {"status": "queued"})
+        _, current = await store.claim("key")
+        return held, await store.wait_for_result("key", current)
+
+    assert redis_run(scenario) == (False, {"status": "sent"})
+
+
+def test_held_claim_checks_fingerprint(redis_run):
+    async def scenario():
+        store = make_store()
+        token, _ = await store.claim("key", fingerprint="body-a")
+        await store.hold("key", token, {"status": "queued"})
+        _, current = await store.claim("key", fingerprint="body-b")
+        with pytest.raises(HTTPException) as error:
+            await store.wait_for_result("key", current, fingerprint="body-b")
+        return error.value.status_code
+
+    assert redis_run(scenario) == 422
@@ -0,0 +1,42 @@
+import pytest
+
+from src.core.utils.media import MAGIC_BYTES_LENGTH, detect_media_type
+
+
+def ftyp(brand: bytes) -> bytes:
+    return b"\x00\x00\x00\x18ftyp" + brand + b"\x00\x00\x00\x00" + brand
+
+
+@pytest.mark.parametrize(
+    ("head", "expected"),
+    [
+        (b"\xff\xd8\xff\xe0\x00\x10JFIF", ("photo", "image/jpeg")),
+        (b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR", ("photo", "image/png")),
+        (b"RIFF\x24\x00\x00\x00WEBPVP8 ", ("photo", "image/webp")),
+        (ftyp(b"heic"), ("photo", "image/heic")),
+        (ftyp(b"heix"), ("photo", "image/heic")),
+        (ftyp(b"mif1"), ("photo", "image/heif")),
+        (ftyp(b"isom"), ("video", "video/mp4")),
+        (ftyp(b"mp42"), ("video", "video/mp4")),
+        (ftyp(b"qt  "), ("video", "video/quicktime")),
+        (b"\x1a\x45\xdf\xa3\x9f\x42\x86\x81", ("video", "video/webm")),
+    ],
+)
+def test_detects_supported_formats(head, expected):
+    assert detect_media_type(head[:MAGIC_BYTES_LENGTH]) == expected
+
+
+@pytest.mark.parametrize(
+    "head",
+    [
+        b"",
+        b"%PDF-1.7\n",
+        b"GIF89a\x01\x00\x01\x00",
+        b"PK\x03\x04\x14\x00\x06\x00",  # zip/xlsx
+        b"RIFF\x24\x00\x00\x00WAVEfmt ",  # RIFF, но не WebP
+        ftyp(b"crx "),  # ISO BMFF с неизвестным брендом
+        b"<html><body>\xff\xd8\xff",  # Сигнатура не в начале файла
+    ],
+)
+def test_rejects_other_formats(head):
+    assert detect_media_type(head) is None
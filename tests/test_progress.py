@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("asyncpg")
+pytest.importorskip("greenlet")  # Нужен sqlalchemy.ext.asyncio
+pytest.importorskip("prometheus_client")
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from tests.conftest import ROOT, TEST_DATABASE_URL, requires_database
+
+pytestmark = requires_database
+
+SCHEMA = "test_user_task_progress"
+USERNAME = "alice"
+
+
+def database_run(scenario):
+    """Выполняет сценарий в чистой схеме с таблицей users и всеми миграциями"""
+    from src.core.repositories.progress import TaskProgressRepository
+
+    url = TEST_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+    async def run():
+        engine = create_async_engine(url, connect_args={"server_settings": {"search_path": SCHEMA}})
+        try:
+            async with engine.connect() as connection:
+                raw = await connection.get_raw_connection()
+                await raw.driver_connection.execute(f"""
+                    DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+                    CREATE SCHEMA {SCHEMA};
+                    CREATE TABLE users (id SERIAL PRIMARY KEY, username TEXT UNIQUE NOT NULL, in_progress INTEGER[]);
+                    INSERT INTO users (username) VALUES ('{USERNAME}');
+                """)
+                for migration in sorted((ROOT / "migrations").glob("*.sql")):
+                    await raw.driver_connection.execute(migration.read_text())
+            return await scenario(TaskProgressRepository, async_sessionmaker(engine, expire_on_commit=False))
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+async def fetch(session_maker, sql: str):
+    async with session_maker() as session:
+        return (await session.execute(text(sql))).scalar()
+
+
+def test_claim_is_exclusive_until_released():
+    async def scenario(repository, session_maker):
+        async with session_maker() as session:
+            first = await repository.claim_task(session, USERNAME, 7)
+            second = await repository.claim_task(session, USERNAME, 7)
+            await repository.release_task(session, USERNAME, 7)
+            after_release = await repository.claim_task(session, USERNAME, 7)
+        return first, second, after_release
+
+    assert database_run(scenario) == (True, False, True)
+
+
+def test_concurrent_claims_have_single_winner():
+    async def scenario(repository, session_maker):
+        async def claim():
+            async with session_maker() as session:
+                return await repository.claim_task(session, USERNAME, 7)
+
+        return await asyncio.gather(*(claim() for _ in range(10)))
+
+    assert sorted(database_run(scenario)) == [False] * 9 + [True]
+
+
+def test_stale_pending_claim_is_taken_over():
+    async def scenario(repository, session_maker):
+        async with session_maker() as session:
+            await repository.claim_task(session, USERNAME, 7)
+            await session.execute(text("UPDATE user_task_progress SET created_at = now() - interval '2 hours'"))
+            await session.commit()
+            stale = await repository.claim_task(session, USERNAME, 7)
+            fresh = await repository.claim_task(session, USERNAME, 7)
+        return stale, fresh
+
+    assert database_run(scenario) == (True, False)
+
+
+def test_in_progress_task_is_not_taken_over_even_when_old():
+    async def scenario(repository, session_maker):
+        async with session_maker() as session:
+            await repository.claim_task(session, USERNAME, 7)
+            await repository.mark_in_progress(session, USERNAME, 7)
+            await session.execute(text("UPDATE user_task_progress SET created_at = now() - interval '2 hours'"))
+            await session.commit()
+            return await repository.claim_task(session, USERNAME, 7)
+
+    assert database_run(scenario) is False
+
+
+def test_delivery_and_bot_rejection_are_synced_with_users_array():
+    async def scenario(repository, session_maker):
+        async with session_maker() as session:
+            await repository.claim_task(session, USERNAME, 7)
+            await repository.mark_in_progress(session, USERNAME, 7)
+        array_after_delivery = await fetch(session_maker, f"SELECT in_progress FROM users WHERE username = '{USERNAME}'")
+
+        async with session_maker() as session:
+            # Так отклонение обрабатывает бот модерации: убирает задание из массива
+            await session.execute(text(
+                f"UPDATE users SET in_progress = array_remove(in_progress, 7) WHERE username = '{USERNAME}'"
+            ))
+            await session.commit()
+        rows_after_reject = await fetch(session_maker, "SELECT count(*) FROM user_task_progress")
+
+        async with session_maker() as session:
+            resubmitted = await repository.claim_task(session, USERNAME, 7)
+        return array_after_delivery, rows_after_reject, resubmitted
+
+    assert database_run(scenario) == ([7], 0, True)